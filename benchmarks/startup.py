@@ -0,0 +1,90 @@
+"""
+Measures wall time of cold searchme runs.
+
+Usage: python benchmarks/startup.py [--files N] [--runs N]
+"""
+
+import argparse
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+COMMANDS = {
+    "interpreter": "pass",
+    "searchme": "from indexme.cli.searchme import app; app()",
+    "searchme (SQLAlchemy)": (
+        "from indexme.cli import searchme;"
+        " searchme.open_read_only = lambda: None;"
+        " searchme.app()"
+    ),
+}
+
+
+def make_tree(root: str, files: int) -> None:
+    """
+    Creates files spread over directories of 100 files each.
+    """
+    for i in range(files):
+        directory = os.path.join(root, f"dir{i // 100}")
+        os.makedirs(directory, exist_ok=True)
+        open(os.path.join(directory, f"file{i}.txt"), "w").close()
+
+
+def measure(code: str, args: List[str], env: Dict[str, str], runs: int) -> List[float]:
+    """
+    Runs Python code in a new interpreter, returns wall times in milliseconds.
+    """
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(
+            [sys.executable, "-c", code, *args],
+            env=env,
+            check=True,
+            stdout=subprocess.DEVNULL,
+        )
+        times.append((time.perf_counter() - start) * 1000)
+    return times
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Measures searchme startup time.")
+    parser.add_argument("--files", type=int, default=10000)
+    parser.add_argument("--runs", type=int, default=10)
+    args = parser.parse_args()
+
+    work = tempfile.mkdtemp()
+    try:
+        tree = os.path.join(work, "tree")
+        make_tree(tree, args.files)
+        env = {
+            **os.environ,
+            "PYTHONPATH": REPO,
+            "XDG_DATA_HOME": work,
+            "XDG_CONFIG_HOME": work,
+            "XDG_RUNTIME_DIR": work,
+        }
+        index = "from indexme.cli.indexme import app; app()"
+        subprocess.run(
+            [sys.executable, "-c", index, tree],
+            env=env,
+            check=True,
+            stdout=subprocess.DEVNULL,
+        )
+        print(f"{'command':<24}{'median ms':>12}{'min ms':>12}")
+        for label, code in COMMANDS.items():
+            times = measure(code, ["file42", tree], env, args.runs)
+            print(f"{label:<24}{statistics.median(times):>12.1f}{min(times):>12.1f}")
+    finally:
+        shutil.rmtree(work)
+
+
+if __name__ == "__main__":
+    main()
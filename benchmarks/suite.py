@@ -0,0 +1,410 @@
+"""
+Measures indexing and search performance on a synthetic directory tree.
+
+Results are printed as a table, optionally saved as JSON, and compared
+against a previously saved baseline. Exits with status 1 if any result
+is worse than the baseline by more than the tolerance.
+
+Usage: python benchmarks/suite.py [--depth N] [--fanout N] [--files N]
+                                  [--names numbered|random|zipf] [--runs N]
+                                  [--json FILE] [--baseline FILE]
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import statistics
+import string
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import redirect_stdout
+from typing import Any, Callable, Dict, List, Optional
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+
+from indexme.cli.indexme import rescan_dir, scan_dir  # noqa: E402
+from indexme.cli.purgeme import purge  # noqa: E402
+from indexme.db.bulk import add_file  # noqa: E402
+from indexme.db.connection import connect  # noqa: E402
+from indexme.db.file_ops import FileSortDirection, GetAllFiles, get_file  # noqa: E402
+from indexme.db.ignore import Exclusions  # noqa: E402
+from indexme.db.paths import (  # noqa: E402
+    set_db_string_factory,
+    set_ignore_path_factory,
+)
+from indexme.db.stat import Stat  # noqa: E402
+
+EXTENSIONS = ["txt", "py", "c", "h", "js", "json", "md", "png", "jpg", "so"]
+
+Results = Dict[str, Dict[str, Any]]
+"""
+Measured values with their units, by benchmark name.
+"""
+
+
+def make_names(kind: str, count: int, rng: random.Random) -> List[str]:
+    """
+    Generates file names: numbered (file0.txt, file1.txt...), random
+    (distinct random words), or zipf (words repeating with Zipf's law,
+    like README.md or index.js do in real trees).
+    """
+    if kind == "numbered":
+        return [f"file{i}.txt" for i in range(count)]
+
+    def word() -> str:
+        length = rng.randint(3, 16)
+        stem = "".join(rng.choice(string.ascii_lowercase) for _ in range(length))
+        return f"{stem}.{rng.choice(EXTENSIONS)}"
+
+    if kind == "random":
+        return [f"{word()}{i}" if i % 7 == 0 else f"{i}{word()}" for i in range(count)]
+    if kind == "zipf":
+        vocabulary = [word() for _ in range(max(count // 10, 1))]
+        weights = [1 / (rank + 1) for rank in range(len(vocabulary))]
+        return rng.choices(vocabulary, weights, k=count)
+    raise Exception(f"Unknown name distribution {kind}")
+
+
+def make_tree(
+    root: str, depth: int, fanout: int, files: int, names: str, seed: int
+) -> List[str]:
+    """
+    Creates a tree of directories, depth levels deep, each having fanout
+    subdirectories and files files. Files get random sizes, modification
+    times within the last year, and some are executable.
+    Returns paths of all directories, root first.
+    """
+    rng = random.Random(seed)
+    now = time.time()
+    dirs = [root]
+    level = [root]
+    for _ in range(depth):
+        level = [os.path.join(d, f"dir{i}") for d in level for i in range(fanout)]
+        dirs.extend(level)
+    for d in dirs:
+        os.makedirs(d, exist_ok=True)
+        # Duplicate names within a directory collapse into a single file.
+        for name in set(make_names(names, files, rng)):
+            path = os.path.join(d, name)
+            with open(path, "w") as f:
+                f.truncate(rng.randint(0, 1 << 16))
+            if rng.random() < 0.05:
+                os.chmod(path, 0o755)
+            mtime = now - rng.uniform(0, 365 * 24 * 3600)
+            os.utime(path, (mtime, mtime))
+    # Directories modified in the second a scan started are always rescanned.
+    for d in reversed(dirs):
+        os.utime(d, (now - 60, now - 60))
+    return dirs
+
+
+def count_entries(root: str) -> int:
+    """
+    Counts files and directories below root.
+    """
+    return sum(len(dirs) + len(files) for _, dirs, files in os.walk(root))
+
+
+def timed(action: Callable[[], Any]) -> float:
+    """
+    Runs an action with output discarded, returns wall time in seconds.
+    """
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        start = time.perf_counter()
+        action()
+        return time.perf_counter() - start
+
+
+def remove_db(db: str) -> None:
+    for suffix in ["", "-wal", "-shm"]:
+        if os.path.exists(db + suffix):
+            os.remove(db + suffix)
+
+
+def measure_indexing(
+    tree: str, dirs: List[str], db: str, runs: int, workers: int, changed: float
+) -> Results:
+    """
+    Measures a full scan into an empty database, an incremental rescan after
+    adding a file to a fraction of directories, and a purge after removing
+    them again. Also measures updating files one by one with add_file.
+    Rates are in entries of the whole tree per second.
+    """
+    entries = count_entries(tree)
+    rng = random.Random(0)
+    added = [
+        os.path.join(d, "added.txt")
+        for d in rng.sample(dirs, max(1, int(len(dirs) * changed)))
+    ]
+    # Files of the deepest directories, like watch mode updates them.
+    updated = [os.path.join(dirs[-1], name) for name in os.listdir(dirs[-1])]
+
+    times: Dict[str, List[float]] = {
+        "scan": [],
+        "rescan": [],
+        "purge": [],
+        "add_file": [],
+    }
+    for _ in range(runs):
+        remove_db(db)
+        times["scan"].append(timed(lambda: scan_dir(tree, Exclusions([]), workers)))
+        for path in added:
+            open(path, "w").close()
+        times["rescan"].append(timed(lambda: rescan_dir(tree, Exclusions([]))))
+        for path in added:
+            os.remove(path)
+        times["purge"].append(timed(lambda: purge(tree, False)))
+
+        Session = connect()
+        with Session() as s:
+            start = time.perf_counter()
+            for path in updated:
+                add_file(s, path, Stat.get(path))
+            times["add_file"].append(time.perf_counter() - start)
+
+    results: Results = {}
+    for name in ["scan", "rescan", "purge"]:
+        rate = entries / statistics.median(times[name])
+        results[name] = {"value": rate, "unit": "entries/s"}
+    rate = len(updated) / statistics.median(times["add_file"])
+    results["add_file"] = {"value": rate, "unit": "files/s"}
+    return results
+
+
+def query_cases(tree: str, sample: str) -> Dict[str, Callable[[GetAllFiles], Any]]:
+    """
+    Builds a search for each filter and each sorting of GetAllFiles.
+    """
+    top = os.path.join(tree, "dir0")
+    half_year = int(time.time()) - 182 * 24 * 3600
+    fragment = os.path.basename(sample)[1:4]
+    cases: Dict[str, Callable[[GetAllFiles], Any]] = {
+        "all": lambda q: q,
+        "name": lambda q: q.with_name(fragment),
+        "extension": lambda q: q.with_extension("txt"),
+        "executable": lambda q: q.with_executable_bit(True),
+        "suid": lambda q: q.with_suid_bit(True),
+        "directories": lambda q: q.with_directories_bit(True),
+        "created_after": lambda q: q.with_created_after(half_year),
+        "created_before": lambda q: q.with_created_before(half_year),
+        "modified_after": lambda q: q.with_modified_after(half_year),
+        "modified_before": lambda q: q.with_modified_before(half_year),
+        "path_prefix": lambda q: q.with_path_prefix(top),
+        "path_equal": lambda q: q.with_path_equal(sample),
+        "parent": lambda q: q.with_parent(top),
+    }
+    for sort in ["name", "path", "date", "size"]:
+
+        def sorted_by(
+            q: GetAllFiles, d: FileSortDirection = FileSortDirection(sort)
+        ) -> Any:
+            return q.with_sorting(d)
+
+        cases[f"sort_{sort}"] = sorted_by
+    return cases
+
+
+def measure_queries(tree: str, sample: str, runs: int) -> Results:
+    """
+    Measures latency of searches, fetching all matching files like searchme.
+    """
+    results: Results = {}
+    Session = connect()
+    for name, case in query_cases(tree, sample).items():
+        times = []
+        for _ in range(runs):
+            with Session() as s:
+                start = time.perf_counter()
+                list(case(GetAllFiles(s, tree)))
+                times.append((time.perf_counter() - start) * 1000)
+        results[f"query_{name}"] = {"value": statistics.median(times), "unit": "ms"}
+    return results
+
+
+def measure_watch(
+    tree: str, dirs: List[str], env: Dict[str, str], runs: int, debounce: int
+) -> Results:
+    """
+    Measures time from creating a file to it being searchable,
+    with indexme watching the tree in another process.
+    """
+    index = "from indexme.cli.indexme import app; app()"
+    watcher = subprocess.Popen(
+        [
+            sys.executable,
+            "-c",
+            index,
+            tree,
+            "--no-scan",
+            "--watch",
+            "--debounce",
+            str(debounce),
+        ],
+        env=env,
+        stdout=subprocess.DEVNULL,
+    )
+    Session = connect()
+
+    def wait_for(path: str, timeout: float) -> Optional[float]:
+        start = time.perf_counter()
+        while time.perf_counter() - start < timeout:
+            with Session() as s:
+                if get_file(s, path) is not None:
+                    return time.perf_counter() - start
+            time.sleep(0.001)
+        return None
+
+    rng = random.Random(0)
+    created: List[str] = []
+    times = []
+    try:
+        # The watcher is ready once it reports the first file.
+        while True:
+            path = os.path.join(tree, f"watched{len(created)}.txt")
+            open(path, "w").close()
+            created.append(path)
+            if wait_for(path, 1) is not None:
+                break
+            if watcher.poll() is not None:
+                raise Exception("indexme --watch exited")
+        for i in range(runs):
+            path = os.path.join(rng.choice(dirs), f"watched{len(created)}.txt")
+            open(path, "w").close()
+            created.append(path)
+            latency = wait_for(path, 10)
+            if latency is None:
+                raise Exception(f"{path} was not indexed in 10 s")
+            times.append(latency * 1000)
+    finally:
+        watcher.terminate()
+        watcher.wait()
+        for path in created:
+            os.remove(path)
+    return {"watch_latency": {"value": statistics.median(times), "unit": "ms"}}
+
+
+def compare(results: Results, baseline: Results, tolerance: float) -> List[str]:
+    """
+    Prints results next to baseline ones, returns names of regressed ones.
+    Times in ms are better when lower, rates when higher.
+
+    >>> compare({"a": {"value": 13, "unit": "ms"}}, {}, 0.2)
+    a                               13.00 ms                    -         -
+    []
+    >>> compare({"a": {"value": 13, "unit": "ms"}}, {"a": {"value": 10}}, 0.2)
+    a                               13.00 ms                10.00    +30.0% REGRESSION
+    ['a']
+    >>> compare({"a": {"value": 8, "unit": "op/s"}}, {"a": {"value": 10}}, 0.25)
+    a                                8.00 op/s              10.00    -20.0%
+    []
+    """
+    regressions = []
+    for name, result in results.items():
+        value, unit = result["value"], result["unit"]
+        line = f"{name:<24}{value:>13.2f} {unit:<10}"
+        if name not in baseline:
+            print(f"{line}{'-':>13}{'-':>10}")
+            continue
+        old = baseline[name]["value"]
+        change = value / old - 1
+        worse = change > tolerance if unit == "ms" else -change > tolerance
+        line = f"{line}{old:>13.2f}{change:>+10.1%}"
+        if worse:
+            line += " REGRESSION"
+            regressions.append(name)
+        print(line)
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Measures indexme performance.")
+    parser.add_argument("--depth", type=int, default=3, help="Directory levels")
+    parser.add_argument("--fanout", type=int, default=8, help="Subdirectories each")
+    parser.add_argument("--files", type=int, default=50, help="Files in each dir")
+    parser.add_argument(
+        "--names", choices=["numbered", "random", "zipf"], default="random"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--runs", type=int, default=3, help="Runs of scans")
+    parser.add_argument("--query-runs", type=int, default=10)
+    parser.add_argument("--watch-runs", type=int, default=20)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--debounce", type=int, default=100)
+    parser.add_argument(
+        "--changed", type=float, default=0.01, help="Fraction of dirs to rescan"
+    )
+    parser.add_argument("--no-watch", action="store_true", help="Skip watch mode")
+    parser.add_argument("--json", help="Save results to a file")
+    parser.add_argument("--baseline", help="Compare with results saved before")
+    parser.add_argument(
+        "--tolerance", type=float, default=0.2, help="Allowed relative slowdown"
+    )
+    args = parser.parse_args()
+    params = {
+        name: getattr(args, name)
+        for name in ["depth", "fanout", "files", "names", "seed", "workers"]
+    }
+
+    work = tempfile.mkdtemp()
+    try:
+        tree = os.path.join(work, "tree")
+        dirs = make_tree(
+            tree, args.depth, args.fanout, args.files, args.names, args.seed
+        )
+        db = os.path.join(work, "indexme.sqlite3")
+        set_db_string_factory(lambda: f"sqlite:///{db}")
+        set_ignore_path_factory(lambda: "/does/not/exist")
+        env = {
+            **os.environ,
+            "PYTHONPATH": REPO,
+            "XDG_DATA_HOME": work,
+            "XDG_CONFIG_HOME": work,
+            "XDG_RUNTIME_DIR": work,
+        }
+        sample = os.path.join(dirs[-1], sorted(os.listdir(dirs[-1]))[0])
+
+        results = measure_indexing(
+            tree, dirs, db, args.runs, args.workers, args.changed
+        )
+        results.update(measure_queries(tree, sample, args.query_runs))
+        if not args.no_watch:
+            results.update(
+                measure_watch(tree, dirs, env, args.watch_runs, args.debounce)
+            )
+    finally:
+        shutil.rmtree(work)
+
+    baseline: Results = {}
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            saved = json.load(f)
+        if saved["params"] != params:
+            print(f"Baseline was measured with {saved['params']}", file=sys.stderr)
+        baseline = saved["results"]
+
+    print(f"{'benchmark':<24}{'value':>13} {'unit':<10}{'baseline':>13}{'change':>10}")
+    regressions = compare(results, baseline, args.tolerance)
+
+    if args.json is not None:
+        with open(args.json, "w") as f:
+            report = {
+                "params": params,
+                "python": platform.python_version(),
+                "sqlite": sqlite3.sqlite_version,
+                "results": results,
+            }
+            json.dump(report, f, indent=2)
+
+    if len(regressions) > 0:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
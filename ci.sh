@@ -12,6 +12,11 @@ autoflake --check --remove-unused-variables --remove-all-unused-imports -r tests
 isort --check tests
 poetry run mypy -p tests --namespace-packages --strict
 
+black --check benchmarks
+autoflake --check --remove-unused-variables --remove-all-unused-imports -r benchmarks
+isort --check benchmarks
+poetry run mypy -p benchmarks --namespace-packages --strict
+
 poetry run coverage run -m unittest discover -s tests
 poetry run coverage report
 
@@ -1,12 +1,31 @@
+import math
 import os
-from typing import Iterator, List
+import stat
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Dict, Iterator, List, Optional, Tuple
 
 import typer
 from inotifyrecursive import INotify, flags  # type: ignore
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm.session import Session
 
+from indexme.db.bulk import FileWriter
+from indexme.db.changes import ADD, MOVE, REMOVE, Change, ChangeSet, Throttle
 from indexme.db.connection import connect
-from indexme.db.file_ops import GetAllFiles, add_file
+from indexme.db.file_model import File
+from indexme.db.file_ops import GetAllFiles
+from indexme.db.hashing import hash_files
+from indexme.db.ignore import IGNORE_FILES, Exclusions
+from indexme.db.journal import compact_journal, forget_changes
+from indexme.db.layout import FLAG_DIR
+from indexme.db.name_index import create_name_index, drop_name_index
 from indexme.db.paths import get_ignore_path
+from indexme.db.scan_stats import ProgressReporter, ScanStats
+from indexme.db.scans import last_scan_start, record_scan
+from indexme.db.stat import InvalidStat, Stat, ValidStat
+from indexme.db.walker import Walker
 
 app = typer.Typer()
 
@@ -22,11 +41,19 @@ def get_global_exclusions() -> Iterator[str]:
                 yield line.strip()
 
 
-def create_observer(directory: str, exclude: List[str]) -> INotify:
+def create_observer(directory: str, exclusions: Exclusions) -> INotify:
     """
-    Sets up INotify observer.
+    Sets up INotify observer. Excluded directories are not watched.
     """
     observer = INotify()
+
+    def watched(name: str, wd: int, is_dir: int) -> bool:
+        # Root, and events of watched directories themselves.
+        if wd == -1 or name == "":
+            return True
+        path = os.path.join(observer.get_path(wd), name)
+        return not exclusions.excluded(path, bool(is_dir))
+
     watch_flags = (
         flags.CREATE
         | flags.MOVED_FROM
@@ -34,72 +61,376 @@ def create_observer(directory: str, exclude: List[str]) -> INotify:
         | flags.DELETE
         | flags.DELETE_SELF
         | flags.MOVE_SELF
+        | flags.CLOSE_WRITE
+        | flags.MODIFY
+        | flags.ATTRIB
     )
-    observer.add_watch_recursive(
-        directory, watch_flags, lambda name, wd, mask: name not in exclude
-    )
+    observer.add_watch_recursive(directory, watch_flags, watched)
     return observer
 
 
-def run_observer(observer: INotify, exclude: List[str]) -> None:
+def apply_change(
+    s: Session,
+    writer: FileWriter,
+    change: Change,
+    exclusions: Exclusions,
+    stats: Optional[ScanStats] = None,
+) -> None:
+    """
+    Queues a single coalesced change.
+    Added directories are scanned, as their contents might have been
+    created before they were watched. Updated paths are only stat-ed again.
+    """
+    path, kind, source = change
+    if kind == REMOVE:
+        for file in GetAllFiles(s, path):
+            print(file)
+        writer.remove(path)
+        return
+
+    if kind == MOVE:
+        assert source is not None
+        writer.move(source, path)
+    # It might have been removed again since.
+    if not os.path.lexists(path):
+        return
+    entry = writer.add(path)
+    print(entry)
+    if kind == ADD and entry.is_dir:
+        # Subtrees added within a window are usually small, so they are
+        # walked without starting threads.
+        with Walker(path, exclusions, workers=0, stats=stats) as walker:
+            for child, child_stat in walker:
+                print(writer.add(child, child_stat))
+
+
+def apply_changes(
+    s: Session,
+    changes: ChangeSet,
+    exclusions: Exclusions,
+    stats: Optional[ScanStats] = None,
+    attempts: int = 3,
+) -> None:
+    """
+    Writes coalesced changes to the database in a single transaction,
+    in batches, so that large added subtrees are not kept in memory.
+    A change that cannot be applied is counted as an error and skipped,
+    without losing the others. Applying is retried a few times, as the
+    database might be locked by another program.
+    """
+    stats = stats if stats is not None else ScanStats()
+    for attempt in range(1, attempts + 1):
+        try:
+            with FileWriter(s, stats=stats, single_transaction=True) as writer:
+                for change in changes:
+                    try:
+                        apply_change(s, writer, change, exclusions, stats)
+                    except OperationalError:
+                        raise
+                    except Exception as e:
+                        stats.add(errors=1)
+                        print(e)
+            return
+        except OperationalError:
+            if attempt == attempts:
+                raise
+            stats.add(errors=1)
+            time.sleep(0.1 * attempt)
+
+
+def run_observer(
+    observer: INotify,
+    directory: str,
+    exclusions: Exclusions,
+    debounce: int = 100,
+    throttle: int = 1000,
+    stats: Optional[ScanStats] = None,
+    metrics: Optional[str] = None,
+) -> None:
     """
     Runs a given INotify observer forever.
+    Events are collected for debounce milliseconds after the first one arrives,
+    then coalesced and applied together.
+    Renames are paired using move cookies and applied in place.
+    Each file's size and attributes are refreshed at most once per
+    throttle milliseconds.
+    Changed ignore files apply to paths changed later, and to the next scan.
+    After each batch, metrics are written to a file, if given. Lag is
+    the time from the first event of a batch until it was saved.
     """
+    root = os.path.abspath(directory)
+    refreshes = Throttle(throttle / 1000)
+    stats = stats if stats is not None else ScanStats()
     Session = connect()
     while True:
-        for event in observer.read():
-            if event.name in exclude:
-                continue
+        changes = ChangeSet()
+        moved_from: Optional[Tuple[int, str, bool]] = None
+        timeout = refreshes.timeout(time.monotonic())
+        if timeout is not None:
+            timeout = math.ceil(timeout * 1000)
+        for event in observer.read(timeout=timeout, read_delay=debounce):
             path = os.path.join(observer.get_path(event.wd), event.name)
-            try:
-                for flag in flags.from_mask(event.mask):
-                    if flag in [flags.CREATE, flags.MOVED_TO]:
-                        with Session() as s:
-                            print(add_file(s, path))
-                            s.commit()
-
-                    if flag in [
-                        flags.MOVED_FROM,
-                        flags.DELETE,
-                        flags.DELETE_SELF,
-                        flags.MOVE_SELF,
-                    ]:
-                        with Session() as s:
-                            for file in GetAllFiles(s, path):
-                                print(file)
-                                s.delete(file)
-                            s.commit()
-
-            except Exception as e:
-                print(e)
-
-
-def scan_dir(directory: str, exclude: List[str]) -> None:
+            is_dir = event.mask & flags.ISDIR != 0
+            if event.name in IGNORE_FILES:
+                exclusions.forget(os.path.dirname(path))
+            excluded = event.name != "" and exclusions.excluded(path, is_dir)
+            if moved_from is not None:
+                cookie, old, old_is_dir = moved_from
+                moved_from = None
+                if event.mask & flags.MOVED_TO and event.cookie == cookie:
+                    if excluded:
+                        changes.remove(old, old_is_dir)
+                    else:
+                        changes.move(old, path)
+                    continue
+                # Moved outside of the watched tree.
+                changes.remove(old, old_is_dir)
+
+            if excluded:
+                continue
+            for flag in flags.from_mask(event.mask):
+                if flag == flags.MOVED_FROM:
+                    moved_from = (event.cookie, path, is_dir)
+
+                if flag in [flags.CREATE, flags.MOVED_TO]:
+                    changes.add(path, created=flag == flags.CREATE)
+
+                if flag == flags.DELETE:
+                    changes.remove(path, is_dir)
+
+                # Other directories are reported by their parents.
+                if flag in [flags.DELETE_SELF, flags.MOVE_SELF]:
+                    if os.path.abspath(path) == root:
+                        changes.remove(root, True)
+
+                if flag in [flags.CLOSE_WRITE, flags.MODIFY, flags.ATTRIB]:
+                    if event.name == "" and os.path.abspath(path) != root:
+                        continue
+                    if refreshes.allow(os.path.abspath(path), time.monotonic()):
+                        changes.update(path)
+
+        if moved_from is not None:
+            changes.remove(moved_from[1], moved_from[2])
+        for path in refreshes.due(time.monotonic()):
+            changes.update(path)
+
+        collected = time.monotonic()
+        try:
+            with Session() as s:
+                apply_changes(s, changes, exclusions, stats)
+        except Exception as e:
+            stats.add(errors=1)
+            print(e)
+
+        stats.add(batches=1)
+        stats.set("watch_changes", len(changes))
+        stats.set("watch_lag_seconds", debounce / 1000 + time.monotonic() - collected)
+        stats.set("watch_last_batch_timestamp_seconds", time.time())
+        if metrics is not None:
+            stats.write_metrics(metrics)
+
+
+def scan_dir(
+    directory: str,
+    exclusions: Exclusions,
+    workers: int = 4,
+    stats: Optional[ScanStats] = None,
+) -> None:
     """
     Recursively scans a directory.
+    Directories are listed and stat-ed by a pool of worker threads,
+    while this thread writes the results to the database.
     """
+    started = datetime.now(timezone.utc)
     Session = connect()
+    with Session() as s, FileWriter(s, stats=stats) as writer, Walker(
+        directory, exclusions, workers, stats=stats
+    ) as walker:
+        for path, path_stat in walker:
+            entry = writer.add(path, path_stat)
+            print(entry)
     with Session() as s:
-        for dir_path, subdirs, files in os.walk(directory):
-            # https://stackoverflow.com/a/19859907
-            files[:] = [x for x in files if x not in exclude]
-            subdirs[:] = [x for x in subdirs if x not in exclude]
+        record_scan(s, directory, started)
 
-            for file in files:
-                entry = add_file(s, os.path.join(dir_path, file))
-                print(entry)
-            for subdir in subdirs:
-                entry = add_file(s, os.path.join(dir_path, subdir))
-                print(entry)
-        s.commit()
+
+def rescan_dir(
+    directory: str, exclusions: Exclusions, stats: Optional[ScanStats] = None
+) -> None:
+    """
+    Incrementally rescans a previously scanned directory.
+    Only directories whose mtime changed since the last scan are listed;
+    their entries are updated, and vanished or excluded entries are removed.
+    Like in git, directories modified at or after the second the last scan
+    started are listed too, as their mtime might not have changed since.
+    Unchanged directories are only stat-ed to find changes deeper in the tree,
+    and entries they hold that are excluded now are removed. Entries that
+    are not excluded anymore are only found in changed directories.
+    """
+    root = os.path.abspath(directory)
+    stats = stats if stats is not None else ScanStats()
+    started = datetime.now(timezone.utc)
+    Session = connect()
+    with Session() as s, FileWriter(s, stats=stats) as writer:
+        racy_since = last_scan_start(s, root)
+        stored_dirs: Dict[str, datetime] = dict(
+            GetAllFiles(s, root)
+            .with_directories_bit(True)
+            .rows(File.path, File.modified_at)
+        )
+        stored_subdirs: Dict[str, List[str]] = {}
+        for path in stored_dirs:
+            stored_subdirs.setdefault(os.path.dirname(path), []).append(path)
+
+        stack = [root]
+        while len(stack) > 0:
+            dir_path = stack.pop()
+            stating = time.perf_counter()
+            try:
+                st = os.lstat(dir_path)
+            except OSError:
+                stats.add(errors=1)
+                continue
+            stats.add("stat", time.perf_counter() - stating, entries_stated=1)
+            # os.walk does not follow symlinks either.
+            if not stat.S_ISDIR(st.st_mode):
+                continue
+
+            mtime = ValidStat(st).mtime()
+            stored = stored_dirs.get(dir_path)
+            racy = racy_since is None or (stored is not None and stored >= racy_since)
+            if dir_path != root and stored == mtime and not racy:
+                excluded = exclusions.directory(dir_path)
+                # Patterns might have changed since.
+                if exclusions.applies(dir_path):
+                    for name, flags in stored_entries(s, dir_path):
+                        if excluded(name, flags & FLAG_DIR != 0):
+                            writer.remove(os.path.join(dir_path, name))
+                stack.extend(
+                    x
+                    for x in stored_subdirs.get(dir_path, [])
+                    if not excluded(os.path.basename(x), True)
+                )
+                continue
+
+            if dir_path != root:
+                print(writer.add(dir_path, ValidStat(st)))
+            listing = time.perf_counter()
+            try:
+                entries = list(os.scandir(dir_path))
+            except OSError:
+                stats.add(errors=1)
+                continue
+            stats.add("list", time.perf_counter() - listing, dirs_listed=1)
+
+            names = set(x.name for x in entries)
+            excluded = exclusions.directory(dir_path, names)
+            for name, flags in stored_entries(s, dir_path):
+                if name not in names or excluded(name, flags & FLAG_DIR != 0):
+                    writer.remove(os.path.join(dir_path, name))
+
+            for entry in exclusions.filter_entries(dir_path, entries):
+                stating = time.perf_counter()
+                entry_stat = Stat.from_entry(entry)
+                stats.add(
+                    "stat",
+                    time.perf_counter() - stating,
+                    entries_stated=1,
+                    errors=int(isinstance(entry_stat, InvalidStat)),
+                )
+                print(writer.add(entry.path, entry_stat))
+                if entry_stat.is_dir():
+                    stack.append(entry.path)
+    with Session() as s:
+        record_scan(s, root, started)
+
+
+def stored_entries(s: Session, dir_path: str) -> List[Tuple[str, int]]:
+    """
+    Gets names and flags of indexed entries of a directory.
+    """
+    query = GetAllFiles(s, dir_path).with_parent(dir_path)
+    return list(query.rows(File.name, File.flags))
+
+
+def configure_name_index(enabled: bool) -> None:
+    """
+    Creates or drops trigram index used for name searches.
+    """
+    Session = connect()
+    with Session() as s:
+        engine = s.get_bind()
+        if not enabled:
+            drop_name_index(engine)
+        elif not create_name_index(engine):
+            raise Exception("SQLite does not support FTS5 trigram indexes")
+
+
+def hash_dir(directory: str, workers: Optional[int], stats: ScanStats) -> None:
+    """
+    Hashes contents of files that might have duplicates.
+    """
+    Session = connect()
+    with Session() as s:
+        hash_files(s, directory, workers, stats)
+
+
+def maintain_journal(compact: bool, forget: Optional[int]) -> None:
+    """
+    Removes redundant or already read entries of the change journal.
+    """
+    Session = connect()
+    with Session() as s:
+        if forget is not None:
+            forget_changes(s, forget)
+        if compact:
+            compact_journal(s)
 
 
 @app.command()
 def index(
     directory: str = typer.Argument(".", help="Root directory"),
-    exclude: List[str] = typer.Option([], help="Directory names to exclude"),
+    exclude: List[str] = typer.Option(
+        [], help="Pattern of paths to exclude, as in .gitignore"
+    ),
+    ignore_files: bool = typer.Option(
+        True, help="Exclude paths listed in .gitignore and .indexmeignore files?"
+    ),
     scan: bool = typer.Option(True, help="Scan the directory first"),
+    incremental: bool = typer.Option(
+        False, help="Only rescan directories changed since last scan"
+    ),
     watch: bool = typer.Option(False, help="Watch for changes"),
+    workers: int = typer.Option(4, help="Number of directory scanning threads"),
+    debounce: int = typer.Option(
+        100, help="Milliseconds to collect watched changes for before saving them"
+    ),
+    throttle: int = typer.Option(
+        1000, help="Minimum milliseconds between refreshes of a changing file"
+    ),
+    name_index: Optional[bool] = typer.Option(
+        None, help="Keep a trigram index for fast name search?"
+    ),
+    stats: bool = typer.Option(False, help="Print time spent in each scan phase"),
+    progress: int = typer.Option(
+        0, help="Seconds between progress lines printed while scanning, 0 for none"
+    ),
+    metrics: Optional[str] = typer.Option(
+        None, help="File to keep Prometheus metrics in, e.g. for node_exporter"
+    ),
+    hash_contents: bool = typer.Option(
+        False, "--hash", help="Hash files sharing sizes, for searchme --duplicates"
+    ),
+    hash_workers: Optional[int] = typer.Option(
+        None, help="Number of hashing processes, one per CPU by default"
+    ),
+    compact_journal: bool = typer.Option(
+        False,
+        help="Remove changes superseded by later ones from the journal,"
+        " as is done after each scan",
+    ),
+    forget_changes: Optional[int] = typer.Option(
+        None, help="Remove changes up to a sequence number from the journal"
+    ),
 ) -> None:
     """
     Recursively index a directory, optionally watching for changes.
@@ -110,16 +441,48 @@ def index(
         indexes directories starting from current directory
       indexme /
         indexes whole filesystem
-      indexme ~ --exclude .git --exclude node_modules --exclude .cache
-        indexes home directory, excluding some directories
+      indexme ~ --exclude .git --exclude node_modules --exclude '*.o'
+        indexes home directory, excluding some directories and files
+      indexme ~ --incremental
+        quickly reindexes home directory, updating only changed directories
+      indexme / --name-index
+        indexes whole filesystem, then builds index for fast name searches
+      indexme / --stats --progress 10 > /dev/null
+        shows how long listing, stat-ing and saving files takes
+      indexme ~ --watch --metrics /var/lib/node_exporter/indexme.prom
+        keeps scan rate and watcher lag metrics for Prometheus
+      indexme ~ --hash
+        indexes home directory, then hashes files that might be duplicates
+      indexme --no-scan --compact-journal --forget-changes 1234
+        shrinks the journal read by searchme --changed-since
     """
-    exclude = [*exclude, *get_global_exclusions()]
+    # Like in git, patterns given last take precedence.
+    exclusions = Exclusions([*get_global_exclusions(), *exclude], ignore_files)
+    scan_stats = ScanStats()
+
+    observer = create_observer(directory, exclusions) if watch else None
 
-    observer = create_observer(directory, exclude) if watch else None
+    with ProgressReporter(scan_stats, progress, sys.stderr, metrics):
+        if scan and incremental:
+            rescan_dir(directory, exclusions, scan_stats)
+        elif scan:
+            scan_dir(directory, exclusions, workers, scan_stats)
+        if hash_contents:
+            hash_dir(directory, hash_workers, scan_stats)
+    scan_stats.mark_scanned()
+    if stats:
+        typer.echo(scan_stats.summary(), err=True)
+    if metrics is not None:
+        scan_stats.write_metrics(metrics)
 
-    if scan:
-        scan_dir(directory, exclude)
+    if name_index is not None:
+        configure_name_index(name_index)
+    # Scans supersede many changes, e.g. updates of each file of a rescan.
+    if scan or compact_journal or forget_changes is not None:
+        maintain_journal(scan or compact_journal, forget_changes)
 
     if watch:
         assert observer is not None
-        run_observer(observer, exclude)
+        run_observer(
+            observer, directory, exclusions, debounce, throttle, scan_stats, metrics
+        )
@@ -1,13 +1,44 @@
 import os
+from typing import Set
 
 import typer
+from sqlalchemy.orm.session import Session
 
+from indexme.db.bulk import FileWriter
 from indexme.db.connection import connect
-from indexme.db.file_ops import GetAllFiles
+from indexme.db.file_model import Directory, File
+from indexme.db.file_ops import STREAM_BATCH_SIZE, GetAllFiles
+from indexme.db.layout import subtree_range
 
 app = typer.Typer()
 
 
+def remove_subtree(s: Session, writer: FileWriter, path: str) -> None:
+    """
+    Prints all indexed files under path and removes them from database.
+    """
+    for file in GetAllFiles(s, path):
+        print(file)
+    writer.remove(path)
+
+
+def is_removed(path: str, removed: Set[str]) -> bool:
+    """
+    Checks whether path or any of its ancestors is in removed set.
+
+    >>> is_removed("/a/b/c", {"/a/b"})
+    True
+    >>> is_removed("/a/bc", {"/a/b"})
+    False
+    """
+    while path not in removed:
+        parent = os.path.dirname(path)
+        if parent == path:
+            return False
+        path = parent
+    return True
+
+
 @app.command()
 def purge(
     root: str = typer.Argument(".", help="Root directory"),
@@ -16,11 +47,41 @@ def purge(
     """
     Scan a subtree and remove deleted files from database.
     Optionally remove the whole subtree.
+
+    Each indexed directory is listed once, and vanished files are removed
+    together with everything below them.
     """
+    root = os.path.abspath(root)
     Session = connect()
-    with Session() as s:
-        for file in GetAllFiles(s, root):
-            if all or not os.path.exists(file.path):
-                s.delete(file)
-                print(file)
-        s.commit()
+    with Session() as s, FileWriter(s) as writer:
+        if all or not os.path.lexists(root):
+            remove_subtree(s, writer, root)
+            return
+
+        lower, upper = subtree_range(root)
+        dirs = (
+            s.query(Directory.id, Directory.path)
+            .filter(Directory.path >= lower, Directory.path < upper)
+            .order_by(Directory.path)
+        )
+        # Parents come before their subdirectories.
+        removed: Set[str] = set()
+        for dir_id, key in dirs.yield_per(STREAM_BATCH_SIZE):
+            dir_path = os.path.dirname(key)
+            if is_removed(dir_path, removed):
+                continue
+            try:
+                names = set(os.listdir(dir_path))
+            except (FileNotFoundError, NotADirectoryError):
+                remove_subtree(s, writer, dir_path)
+                removed.add(dir_path)
+                continue
+            except OSError:
+                continue
+
+            stored = s.query(File.name).filter(File.parent_id == dir_id).all()
+            for (name,) in stored:
+                if name not in names:
+                    path = os.path.join(dir_path, name)
+                    remove_subtree(s, writer, path)
+                    removed.add(path)
@@ -1,10 +1,12 @@
 import os
-from typing import Optional
+import sys
+from contextlib import closing
+from typing import Any, Dict, Iterator, Optional
 
 import typer
 
-from indexme.db.connection import connect
-from indexme.db.file_ops import FileSortDirection, GetAllFiles
+from indexme.db.daemon import query_daemon
+from indexme.db.quick_search import open_read_only, quick_search
 
 app = typer.Typer()
 
@@ -30,8 +32,20 @@ def search(
         None, help="Maximum modification timestamp"
     ),
     sort_by: str = typer.Option("date", help="What to sort results by"),
+    reverse: bool = typer.Option(False, help="Sort in descending order"),
+    limit: Optional[int] = typer.Option(
+        None, help="Print only this many first results"
+    ),
     count_only: bool = typer.Option(False, help="Print number of matches"),
+    total_size: bool = typer.Option(False, help="Print total size of matches"),
+    du: bool = typer.Option(False, help="Print size of each directory, like du"),
     xargs: bool = typer.Option(False, help="Print xargs-readable NUL-sep. list"),
+    duplicates: bool = typer.Option(
+        False, help="Print groups of identical files (see indexme --hash)"
+    ),
+    changed_since: Optional[int] = typer.Option(
+        None, help="Print changes made after a sequence number of the journal"
+    ),
 ) -> None:
     """
     Search database for matching files and directories.
@@ -44,32 +58,66 @@ def search(
         lists all indexed files
       searchme invoice ~/Downloads --extension pdf --no-directories
         finds all PDF invoices in ~/Downloads
+      searchme '' ~/Downloads --reverse --limit 20
+        lists 20 most recently modified files in ~/Downloads
       searchme photo --xargs | xargs -0 echo
         pass all files with 'photo' in name to xargs
+      searchme '' ~ --du | sort -n
+        lists directories in home directory by size
+      searchme '' ~ --duplicates --no-directories
+        lists groups of files with the same contents, largest first
+      searchme '' ~ --changed-since 1234
+        lists paths changed (+) and removed (-) after change 1234,
+        each preceded by number of the change
+
+    Searches are sent to serveme daemon, if it is running.
+    """
+    options = {
+        "name": name,
+        "root": root,
+        "extension": extension,
+        "executable": executable,
+        "suid": suid,
+        "directories": directories,
+        "created_after": created_after,
+        "created_before": created_before,
+        "modified_after": modified_after,
+        "modified_before": modified_before,
+        "sort_by": sort_by,
+        "reverse": reverse,
+        "limit": limit,
+        "count_only": count_only,
+        "total_size": total_size,
+        "du": du,
+        "xargs": xargs,
+        "duplicates": duplicates,
+        "changed_since": changed_since,
+    }
+    output = query_daemon(options)
+    if output is None:
+        output = search_directly(options)
+    for chunk in output:
+        sys.stdout.write(chunk)
+
+
+def search_directly(options: Dict[str, Any]) -> Iterator[str]:
+    """
+    Runs a search without the daemon.
+    Opens the database read-only and tries the quick search first.
+    Other database modules are imported only if needed, as they take
+    long to load.
     """
-    direction = FileSortDirection(sort_by)
-    if count_only and xargs:
-        raise Exception("Conflicting options")
+    conn = open_read_only()
+    if conn is not None:
+        with closing(conn):
+            output = quick_search(conn, options, os.getcwd())
+            if output is not None:
+                yield from output
+                return
+
+    from indexme.db.connection import connect
+    from indexme.db.search import run_search
 
-    counter = 0
     Session = connect()
     with Session() as s:
-        for file in (
-            GetAllFiles(s, root)
-            .with_name(name)
-            .with_extension(extension)
-            .with_executable_bit(executable)
-            .with_suid_bit(suid)
-            .with_directories_bit(directories)
-            .with_created_after(created_after)
-            .with_created_before(created_before)
-            .with_modified_after(modified_after)
-            .with_modified_before(modified_before)
-            .with_sorting(direction)
-        ):
-            counter += 1
-            if not count_only:
-                print(os.path.relpath(file.path), end=("\0" if xargs else "\n"))
-
-    if count_only:
-        print(counter)
+        yield from run_search(s, options, os.getcwd())
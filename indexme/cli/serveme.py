@@ -0,0 +1,156 @@
+import os
+import signal
+import socketserver
+import sys
+import threading
+from contextlib import closing
+from typing import Optional
+
+import typer
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm.session import Session
+
+from indexme.db.connection import connect
+from indexme.db.daemon import REQUEST_TIMEOUT, chunked, is_listening, receive, send
+from indexme.db.paths import get_db_string, get_socket_path
+from indexme.db.quick_search import open_read_only
+from indexme.db.search import run_search
+from indexme.db.snapshot import Snapshot
+
+app = typer.Typer()
+
+
+class SearchHandler(socketserver.StreamRequestHandler):
+    """
+    Serves a single searchme request.
+    Clients that stop sending or reading are dropped after a timeout.
+    """
+
+    server: "SearchServer"
+    timeout = REQUEST_TIMEOUT
+
+    def handle(self) -> None:
+        try:
+            self._serve()
+        except OSError:
+            # The client went away or stopped reading.
+            pass
+
+    def _serve(self) -> None:
+        request = receive(self.rfile)
+        if request is None:
+            return
+        if request["db"] != self.server.db_string:
+            send(self.wfile, {"unavailable": "Different database"})
+            return
+        send(self.wfile, {"ok": True})
+        try:
+            with self.server.Session() as s:
+                options, cwd = request["options"], request["cwd"]
+                output = None
+                snapshot = self.server.current_snapshot(s)
+                if snapshot is not None:
+                    output = snapshot.search(options, cwd)
+                if output is None:
+                    output = run_search(s, options, cwd)
+                for chunk in chunked(output):
+                    send(self.wfile, {"out": chunk})
+            send(self.wfile, {"done": True})
+        except OSError:
+            # Failures of the connection are handled above.
+            raise
+        except Exception as e:
+            send(self.wfile, {"error": str(e)})
+
+
+class SearchServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    Answers each search in its own thread, keeping database connections open.
+    Optionally keeps a Snapshot of the index, reloaded in background
+    whenever the database changes. Searches are answered from the database
+    until the reload finishes.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, socket_path: str, use_snapshot: bool = False) -> None:
+        self.db_string = get_db_string()
+        self.Session = connect(keep_alive=True)
+        self.use_snapshot = use_snapshot
+        self.lock = threading.Lock()
+        # Data version is tracked separately by each connection,
+        # so it is always read using the same one.
+        self.version_conn: Optional[Connection] = None
+        self.snapshot: Optional[Snapshot] = None
+        self.snapshot_version: Optional[int] = None
+        self.loader: Optional[threading.Thread] = None
+        super().__init__(socket_path, SearchHandler)
+
+    def current_snapshot(self, s: Session) -> Optional[Snapshot]:
+        """
+        Gets a snapshot, if it is up to date.
+        Starts reloading it otherwise.
+        """
+        if not self.use_snapshot:
+            return None
+        with self.lock:
+            if self.version_conn is None:
+                self.version_conn = s.get_bind().connect()
+            # Changes whenever other connections modify the database.
+            query = text("PRAGMA data_version")
+            version = self.version_conn.execute(query).scalar()
+            if self.snapshot is not None and self.snapshot_version == version:
+                return self.snapshot
+            if self.loader is None or not self.loader.is_alive():
+                self.loader = threading.Thread(
+                    target=self._load_snapshot, args=(version,), daemon=True
+                )
+                self.loader.start()
+        return None
+
+    def server_close(self) -> None:
+        super().server_close()
+        if self.version_conn is not None:
+            self.version_conn.close()
+
+    def _load_snapshot(self, version: int) -> None:
+        conn = open_read_only()
+        if conn is None:
+            return
+        with closing(conn):
+            snapshot = Snapshot(conn)
+        with self.lock:
+            self.snapshot, self.snapshot_version = snapshot, version
+
+
+@app.command()
+def serve(
+    snapshot: bool = typer.Option(
+        False, help="Keep whole index in memory for faster filtering?"
+    ),
+) -> None:
+    """
+    Run a daemon answering searchme queries over a Unix socket.
+    searchme uses it when it is running, and queries database directly otherwise.
+
+    \b
+    Examples:
+      serveme &
+        starts the daemon in background
+      serveme --snapshot &
+        starts the daemon, answering searches from memory when possible
+    """
+    socket_path = get_socket_path()
+    if is_listening(socket_path):
+        raise Exception("Daemon is already running")
+    if os.path.exists(socket_path):
+        # Left by a daemon that did not exit cleanly.
+        os.remove(socket_path)
+    # Let the socket be removed when killed.
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    with SearchServer(socket_path, snapshot) as server:
+        try:
+            server.serve_forever()
+        finally:
+            os.remove(socket_path)
@@ -0,0 +1,323 @@
+import os
+import time
+from contextlib import ExitStack
+from itertools import groupby
+from types import TracebackType
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple, Type
+
+from sqlalchemy import String, bindparam, delete, func, or_, select, update
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm.session import Session
+
+from indexme.db.connection import transaction
+from indexme.db.file_model import Directory, File
+from indexme.db.layout import (
+    FLAG_DIR,
+    FLAG_EXECUTABLE,
+    FLAG_SUID,
+    dir_key,
+    subtree_range,
+)
+from indexme.db.scan_stats import ScanStats
+from indexme.db.stat import InvalidStat, Stat
+
+# SQLite's default limit of bound parameters is 999.
+_MAX_PARAMS = 500
+
+Batch = List[Dict[str, Any]]
+
+
+def file_values(path: str, stat: Optional[Stat] = None) -> Dict[str, Any]:
+    """
+    Stats a file or a directory under given path, unless stat is provided.
+    Symlinks are not followed. Returns attributes of its File.
+    """
+    path = os.path.abspath(path)
+    if stat is None:
+        stat = Stat.get(path, follow_symlinks=False)
+    flags = 0
+    flags |= FLAG_DIR if stat.is_dir() else 0
+    flags |= FLAG_EXECUTABLE if stat.is_executable() else 0
+    flags |= FLAG_SUID if stat.is_suid() else 0
+    return {
+        "path": path,
+        "name": os.path.split(path)[1],
+        "flags": flags,
+        "size": stat.size(),
+        "created_at": stat.ctime(),
+        "modified_at": stat.mtime(),
+    }
+
+
+def add_file(s: Session, path: str, stat: Optional[Stat] = None) -> File:
+    """
+    Indexes a file or a directory under given path.
+    Stats it, unless stat is provided.
+    """
+    with FileWriter(s) as writer:
+        return writer.add(path, stat)
+
+
+def _upsert_statement() -> Any:
+    """
+    Builds INSERT ... ON CONFLICT DO UPDATE for the files table.
+    Rows that did not change are left untouched.
+    """
+    table = File.__table__
+    stmt = insert(table)
+    columns = [c for c in table.c if c.name not in ["id", "parent_id", "name"]]
+    return stmt.on_conflict_do_update(
+        index_elements=[table.c.parent_id, table.c.name],
+        set_={c.name: stmt.excluded[c.name] for c in columns},
+        where=or_(*(c.is_distinct_from(stmt.excluded[c.name]) for c in columns)),
+    )
+
+
+def _delete_statements() -> List[Any]:
+    """
+    Builds DELETEs of a path and everything below it.
+    """
+    files = File.__table__
+    dirs = Directory.__table__
+    in_subtree = dirs.c.path >= bindparam("lower"), dirs.c.path < bindparam("upper")
+    return [
+        delete(files).where(
+            files.c.parent_id.in_(select(dirs.c.id).where(*in_subtree))
+        ),
+        delete(files).where(
+            files.c.parent_id
+            == select(dirs.c.id)
+            .where(dirs.c.path == bindparam("parent"))
+            .scalar_subquery(),
+            files.c.name == bindparam("name"),
+        ),
+        delete(dirs).where(*in_subtree),
+    ]
+
+
+def _move_statements() -> List[Any]:
+    """
+    Builds UPDATEs renaming a path and rewriting paths of all directories
+    below it. Existing rows under the new path must be deleted first.
+    """
+    files = File.__table__
+    dirs = Directory.__table__
+    old_key = bindparam("old_key")
+    return [
+        update(dirs)
+        .where(dirs.c.path >= bindparam("lower"), dirs.c.path < bindparam("upper"))
+        .values(
+            path=bindparam("new_key", type_=String)
+            + func.substr(dirs.c.path, func.length(old_key) + 1)
+        ),
+        update(files)
+        .where(
+            files.c.parent_id
+            == select(dirs.c.id)
+            .where(dirs.c.path == bindparam("old_parent"))
+            .scalar_subquery(),
+            files.c.name == bindparam("old_name"),
+        )
+        .values(parent_id=bindparam("new_parent_id"), name=bindparam("new_name")),
+    ]
+
+
+def _chunks(items: List[str], size: int) -> Iterable[List[str]]:
+    for i in range(0, len(items), size):
+        yield items[i : i + size]
+
+
+class FileWriter:
+    """
+    Indexes files in large batches.
+    Bypasses the ORM - rows are sent with native SQLite UPSERTs,
+    one transaction per batch, so memory usage does not grow with tree size.
+    With single_transaction, batches are written into one transaction
+    instead, committed on commit or when leaving the writer, so that
+    readers see either none or all changes. Work done is recorded in stats.
+    """
+
+    def __init__(
+        self,
+        session: Session,
+        batch_size: int = 10000,
+        stats: Optional[ScanStats] = None,
+        single_transaction: bool = False,
+    ) -> None:
+        self.session = session
+        self.batch_size = batch_size
+        self.single_transaction = single_transaction
+        # Connection and transaction left open by flush with single_transaction.
+        self.open: Optional[Tuple[ExitStack, Connection]] = None
+        self.stats = stats if stats is not None else ScanStats()
+        self.pending: List[Tuple[Callable[[Connection, Batch], None], Any]] = []
+        self.upsert_stmt = _upsert_statement()
+        self.delete_stmts = _delete_statements()
+        self.move_stmts = _move_statements()
+
+    def add(self, path: str, stat: Optional[Stat] = None) -> File:
+        """
+        Queues a file or a directory under given path.
+        Symlinks are stat-ed themselves, like entries of scanned directories.
+        Returns a transient (not attached to any session) File for display.
+        """
+        if stat is None:
+            stating = time.perf_counter()
+            stat = Stat.get(path, follow_symlinks=False)
+            self.stats.add(
+                "stat",
+                time.perf_counter() - stating,
+                entries_stated=1,
+                errors=int(isinstance(stat, InvalidStat)),
+            )
+        values = file_values(path, stat)
+        self.stats.add(rows_queued=1)
+        self._queue(self._upsert, values)
+        return File(**values)
+
+    def remove(self, path: str) -> None:
+        """
+        Queues removal of a file or a whole directory subtree.
+        """
+        path = os.path.abspath(path)
+        parent, name = os.path.split(path)
+        lower, upper = subtree_range(path)
+        params = {"parent": dir_key(parent), "name": name}
+        self._queue(self._remove, {**params, "lower": lower, "upper": upper})
+
+    def move(self, old: str, new: str) -> None:
+        """
+        Queues renaming of a file or a whole directory subtree in place.
+        Anything indexed under the new path is removed.
+        """
+        self.remove(new)
+        old, new = os.path.abspath(old), os.path.abspath(new)
+        old_parent, old_name = os.path.split(old)
+        new_parent, new_name = os.path.split(new)
+        lower, upper = subtree_range(old)
+        params = {
+            "old_parent": dir_key(old_parent),
+            "old_name": old_name,
+            "new_parent": dir_key(new_parent),
+            "new_name": new_name,
+            "old_key": lower,
+            "new_key": dir_key(new),
+            "lower": lower,
+            "upper": upper,
+        }
+        self._queue(self._move, params)
+
+    def _queue(self, op: Callable[[Connection, Batch], None], params: Any) -> None:
+        self.pending.append((op, params))
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def _dir_ids(self, conn: Connection, paths: List[str]) -> Dict[str, int]:
+        """
+        Gets ids of directories under given (dir_key-formatted) paths,
+        creating missing ones.
+        """
+        dirs = Directory.__table__
+        conn.execute(
+            insert(dirs).on_conflict_do_nothing(), [{"path": p} for p in paths]
+        )
+        ids: Dict[str, int] = {}
+        for chunk in _chunks(paths, _MAX_PARAMS):
+            query = select(dirs.c.path, dirs.c.id).where(dirs.c.path.in_(chunk))
+            ids.update((path, id) for path, id in conn.execute(query))
+        return ids
+
+    def _upsert(self, conn: Connection, batch: Batch) -> None:
+        parents = [dir_key(os.path.dirname(values["path"])) for values in batch]
+        ids = self._dir_ids(conn, list(set(parents)))
+        rows = []
+        for parent, values in zip(parents, batch):
+            row = {key: value for key, value in values.items() if key != "path"}
+            row["parent_id"] = ids[parent]
+            rows.append(row)
+        result = conn.execute(self.upsert_stmt, rows)
+        self.stats.add(rows_written=result.rowcount)
+
+    def _remove(self, conn: Connection, batch: Batch) -> None:
+        for stmt in self.delete_stmts:
+            result = conn.execute(stmt, batch)
+            if stmt.table is File.__table__:
+                self.stats.add(rows_removed=result.rowcount)
+
+    def _move(self, conn: Connection, batch: Batch) -> None:
+        ids = self._dir_ids(conn, list(set(x["new_parent"] for x in batch)))
+        for params in batch:
+            params = {**params, "new_parent_id": ids[params["new_parent"]]}
+            for stmt in self.move_stmts:
+                conn.execute(stmt, params)
+
+    def _write(self, conn: Connection) -> None:
+        for op, group in groupby(self.pending, key=lambda item: item[0]):
+            op(conn, [params for _op, params in group])
+
+    def flush(self) -> None:
+        """
+        Writes all queued changes in order.
+        Consecutive changes of the same kind are sent together.
+        If writing fails, nothing is written and changes stay queued.
+        With single_transaction, changes are not committed yet, and if
+        writing fails, the writer must be left to roll back everything.
+        """
+        if len(self.pending) == 0:
+            return
+        writing = time.perf_counter()
+        if self.single_transaction:
+            if self.open is None:
+                stack = ExitStack()
+                self.open = stack, stack.enter_context(transaction(self.session))
+            self._write(self.open[1])
+            self.stats.add("write", time.perf_counter() - writing)
+            self.pending = []
+            return
+        with transaction(self.session) as conn:
+            self._write(conn)
+            committing = time.perf_counter()
+        self.stats.add("write", committing - writing)
+        self.stats.add("commit", time.perf_counter() - committing)
+        self.pending = []
+
+    def commit(self) -> None:
+        """
+        Writes all queued changes and, with single_transaction,
+        commits ones written before.
+        """
+        self.flush()
+        if self.open is not None:
+            committing = time.perf_counter()
+            stack, _conn = self.open
+            self.open = None
+            stack.close()
+            self.stats.add("commit", time.perf_counter() - committing)
+
+    def __enter__(self) -> "FileWriter":
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc: Optional[BaseException],
+        traceback: Optional[TracebackType],
+    ) -> None:
+        if exc is None:
+            try:
+                self.commit()
+            except BaseException as e:
+                self._rollback(e)
+                raise
+        else:
+            self._rollback(exc)
+
+    def _rollback(self, exc: BaseException) -> None:
+        """
+        Rolls back changes written since the last commit.
+        """
+        if self.open is not None:
+            stack, _conn = self.open
+            self.open = None
+            stack.__exit__(type(exc), exc, exc.__traceback__)
@@ -0,0 +1,216 @@
+import os
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+ADD = "add"
+REMOVE = "remove"
+MOVE = "move"
+UPDATE = "update"
+
+Change = Tuple[str, str, Optional[str]]
+"""
+Path, kind of change and, for moves, the path it was moved from.
+"""
+
+
+class ChangeSet:
+    """
+    Coalesces filesystem changes seen within a short time window.
+    Only the last change of each path is kept, and paths both created
+    and removed within the window are dropped altogether.
+    Moves are kept in order with other changes.
+    Additions and updates below a path added between the same moves are
+    dropped, as added directories are scanned whole.
+
+    >>> changes = ChangeSet()
+    >>> changes.add("/a/tmp", created=True)
+    >>> changes.add("/a/file")
+    >>> changes.remove("/a/tmp")
+    >>> changes.remove("/b", is_dir=True)
+    >>> changes.move("/a", "/c")
+    >>> changes.update("/c/file")
+    >>> changes.update("/d")
+    >>> changes.add("/d/e/f", created=True)
+    >>> changes.add("/d/e", created=True)
+    >>> for change in changes:
+    ...     print(change)
+    ('/b', 'remove', None)
+    ('/c', 'move', '/a')
+    ('/c/file', 'add', None)
+    ('/d', 'update', None)
+    ('/d/e', 'add', None)
+    """
+
+    def __init__(self) -> None:
+        self.done: List[Change] = []
+        self.changes: Dict[str, str] = {}
+        self.created: Set[str] = set()
+
+    def add(self, path: str, created: bool = False) -> None:
+        """
+        Records that a path was created or changed.
+        """
+        path = os.path.abspath(path)
+        previous = self.changes.pop(path, None)
+        if created and previous is None:
+            self.created.add(path)
+        self.changes[path] = ADD
+
+    def update(self, path: str) -> None:
+        """
+        Records that contents or attributes of a path changed.
+        Other changes of the path already imply it.
+        """
+        path = os.path.abspath(path)
+        if path not in self.changes:
+            self.changes[path] = UPDATE
+
+    def remove(self, path: str, is_dir: bool = False) -> None:
+        """
+        Records that a path was removed, together with everything below it.
+        """
+        path = os.path.abspath(path)
+        if is_dir:
+            self._pop_subtree(path)
+        self.changes.pop(path, None)
+        if path in self.created:
+            self.created.remove(path)
+            return
+        self.changes[path] = REMOVE
+
+    def move(self, old: str, new: str) -> None:
+        """
+        Records that a path was renamed, together with everything below it.
+        Changes recorded so far under the old path follow it.
+        """
+        old, new = os.path.abspath(old), os.path.abspath(new)
+        moved = self._pop_subtree(old)
+        created = old in self.created
+        self.created.discard(old)
+        if self.changes.pop(old, None) == ADD:
+            # Not indexed yet - index it under the new name instead.
+            self.remove(new, is_dir=True)
+            self.add(new, created)
+            return
+
+        self._pop_subtree(new)
+        self.changes.pop(new, None)
+        self.created.discard(new)
+        self.done.extend((path, change, None) for path, change in self.changes.items())
+        self.done.append((new, MOVE, old))
+        self.changes = {}
+        self.created = set()
+        for path, (change, was_created) in moved.items():
+            path = new + path[len(old) :]
+            self.changes[path] = change
+            if was_created:
+                self.created.add(path)
+
+    def _pop_subtree(self, path: str) -> Dict[str, Tuple[str, bool]]:
+        """
+        Forgets changes recorded below a path.
+        Returns them with their creation flags.
+        """
+        prefix = os.path.join(path, "")
+        popped = {}
+        for child in [x for x in self.changes if x.startswith(prefix)]:
+            popped[child] = (self.changes.pop(child), child in self.created)
+            self.created.discard(child)
+        return popped
+
+    def __len__(self) -> int:
+        return len(self.done) + len(self.changes)
+
+    def __iter__(self) -> Iterator[Change]:
+        """
+        Yields changes in the order they should be applied.
+        """
+        changes = self.done + [
+            (path, change, None) for path, change in self.changes.items()
+        ]
+        added: Set[str] = set()
+        for i, (path, change, source) in enumerate(changes):
+            if i == 0 or changes[i - 1][1] == MOVE:
+                added = set()
+                for later_path, later_change, _source in changes[i:]:
+                    if later_change == MOVE:
+                        break
+                    if later_change == ADD:
+                        added.add(later_path)
+            if change in [ADD, UPDATE] and _has_ancestor(path, added):
+                continue
+            yield path, change, source
+
+
+def _has_ancestor(path: str, paths: Set[str]) -> bool:
+    """
+    Checks whether any directory above a path is among given paths.
+
+    >>> _has_ancestor("/a/b/c", {"/a", "/d"}), _has_ancestor("/a", {"/a"})
+    (True, False)
+    """
+    parent = os.path.dirname(path)
+    while parent != path:
+        if parent in paths:
+            return True
+        path, parent = parent, os.path.dirname(parent)
+    return False
+
+
+class Throttle:
+    """
+    Limits how often a single path is refreshed.
+    Refreshes coming too early are postponed rather than dropped,
+    so the last change is always saved.
+
+    >>> throttle = Throttle(1.0)
+    >>> throttle.allow("/log", now=10.0), throttle.allow("/log", now=10.5)
+    (True, False)
+    >>> throttle.timeout(now=10.5)
+    0.5
+    >>> throttle.due(now=10.9), throttle.due(now=11.0)
+    ([], ['/log'])
+    >>> throttle.allow("/log", now=11.5), throttle.allow("/log", now=12.0)
+    (False, True)
+    """
+
+    def __init__(self, interval: float) -> None:
+        self.interval = interval
+        self.last: Dict[str, float] = {}
+        self.postponed: Dict[str, float] = {}
+
+    def allow(self, path: str, now: float) -> bool:
+        """
+        Checks whether a path can be refreshed now.
+        If not, postpones the refresh.
+        """
+        last = self.last.get(path)
+        if last is None or now - last >= self.interval:
+            self.last[path] = now
+            self.postponed.pop(path, None)
+            return True
+        self.postponed.setdefault(path, last + self.interval)
+        return False
+
+    def due(self, now: float) -> List[str]:
+        """
+        Gets postponed paths that can be refreshed now.
+        """
+        paths = [path for path, due in self.postponed.items() if due <= now]
+        for path in paths:
+            del self.postponed[path]
+            self.last[path] = now
+        # Paths not refreshed recently do not need to be remembered.
+        self.last = {
+            path: last
+            for path, last in self.last.items()
+            if now - last < self.interval or path in self.postponed
+        }
+        return paths
+
+    def timeout(self, now: float) -> Optional[float]:
+        """
+        Gets seconds until the next postponed refresh, if any.
+        """
+        if len(self.postponed) == 0:
+            return None
+        return max(0.0, min(self.postponed.values()) - now)
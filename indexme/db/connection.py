@@ -1,15 +1,22 @@
-from typing import TYPE_CHECKING, Any, Dict, List
+from contextlib import contextmanager
+from importlib import import_module
+from typing import TYPE_CHECKING, Any, Dict, Iterator, List
 
 from sqlalchemy import create_engine
+from sqlalchemy.engine import Connection
 from sqlalchemy.orm import declarative_base
-from sqlalchemy.orm.session import sessionmaker
+from sqlalchemy.orm.session import Session, sessionmaker
+from sqlalchemy.pool import QueuePool
 
+from indexme.db.migrations import migrate
+from indexme.db.name_index import has_name_index
 from indexme.db.paths import get_db_string
 
 if TYPE_CHECKING:
 
     class Base:
         metadata: Any
+        __table__: Any
 
         def __init__(self, *args: List[Any], **kwargs: Dict[Any, Any]) -> None:
             pass
@@ -18,10 +25,35 @@ else:
     Base = declarative_base()
 
 
-def connect() -> sessionmaker:
+def connect(keep_alive: bool = False) -> sessionmaker:
     """
     Connects to a database according to current db_string.
+    Session.info["name_index"] tells whether trigram index is available.
+    With keep_alive, connections (and their statement caches) are kept
+    in a pool and reused by sessions of any thread, instead of opening
+    one per session.
     """
-    engine = create_engine(get_db_string(), isolation_level="AUTOCOMMIT")
-    Base.metadata.create_all(engine)
-    return sessionmaker(bind=engine)
+    options: Dict[str, Any] = {"isolation_level": "AUTOCOMMIT"}
+    if keep_alive:
+        options["poolclass"] = QueuePool
+        # Each connection is used by one thread at a time.
+        options["connect_args"] = {"check_same_thread": False}
+    engine = create_engine(get_db_string(), **options)
+    # Tables are registered in Base.metadata when models are defined.
+    import_module("indexme.db.file_model")
+    migrate(engine, Base.metadata)
+    name_index = has_name_index(engine)
+    return sessionmaker(bind=engine, info={"name_index": name_index})
+
+
+@contextmanager
+def transaction(s: Session) -> Iterator[Connection]:
+    """
+    Opens a separate connection to session's database and runs
+    a block in a single transaction.
+    Sessions are AUTOCOMMIT, which makes SQLite commit after every statement.
+    """
+    with s.get_bind().connect() as conn:
+        conn = conn.execution_options(isolation_level="SERIALIZABLE")
+        with conn.begin():
+            yield conn
@@ -0,0 +1,126 @@
+import json
+import os
+import socket
+from typing import Any, Dict, Iterator, Optional
+
+from indexme.db.paths import get_db_string, get_socket_path
+
+CHUNK_SIZE = 64 * 1024
+"""
+How much output is sent in a single message.
+"""
+
+CONNECT_TIMEOUT = 1.0
+"""
+How long (in seconds) searchme waits for the daemon to accept a search,
+before running it directly.
+"""
+
+READ_TIMEOUT = 60.0
+"""
+How long (in seconds) searchme waits for each chunk of output.
+"""
+
+REQUEST_TIMEOUT = 10.0
+"""
+How long (in seconds) the daemon waits for a client to send its request
+or to read a chunk of output, before dropping the connection.
+"""
+
+# Messages are JSON objects, one per line. A client sends a request,
+# the daemon answers with {"ok": true} (or {"unavailable": reason}),
+# output chunks {"out": text} and finally {"done": true} or {"error": text}.
+
+
+def send(f: Any, message: Dict[str, Any]) -> None:
+    """
+    Writes a single message to a socket file.
+    """
+    f.write(json.dumps(message).encode("utf-8") + b"\n")
+    f.flush()
+
+
+def receive(f: Any) -> Optional[Dict[str, Any]]:
+    """
+    Reads a single message from a socket file.
+    Returns None if the other side closed the connection.
+    """
+    line = f.readline()
+    if line == b"":
+        return None
+    message: Dict[str, Any] = json.loads(line)
+    return message
+
+
+def chunked(output: Iterator[str]) -> Iterator[str]:
+    """
+    Joins small pieces of output into larger chunks.
+
+    >>> list(chunked(iter(["a", "b"])))
+    ['ab']
+    """
+    buffer = []
+    size = 0
+    for piece in output:
+        buffer.append(piece)
+        size += len(piece)
+        if size >= CHUNK_SIZE:
+            yield "".join(buffer)
+            buffer, size = [], 0
+    if size > 0:
+        yield "".join(buffer)
+
+
+def is_listening(socket_path: str) -> bool:
+    """
+    Checks whether a daemon accepts connections on a given socket.
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        try:
+            sock.connect(socket_path)
+        except OSError:
+            return False
+        return True
+
+
+def query_daemon(options: Dict[str, Any]) -> Optional[Iterator[str]]:
+    """
+    Sends a search to the daemon, if one is running for the current database.
+    Returns its output, or None if the search has to be run directly,
+    which is also the case when the daemon does not accept it in time.
+    """
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(CONNECT_TIMEOUT)
+    f = sock.makefile("rwb")
+    try:
+        sock.connect(get_socket_path())
+        request = {"db": get_db_string(), "cwd": os.getcwd(), "options": options}
+        send(f, request)
+        reply = receive(f)
+    except OSError:
+        reply = None
+    if reply is None or "ok" not in reply:
+        f.close()
+        sock.close()
+        return None
+    sock.settimeout(READ_TIMEOUT)
+    return _output(sock, f)
+
+
+def _output(sock: socket.socket, f: Any) -> Iterator[str]:
+    try:
+        while True:
+            try:
+                message = receive(f)
+            except socket.timeout:
+                raise Exception("Daemon stopped responding")
+            if message is None:
+                raise Exception("Daemon closed the connection")
+            if "error" in message:
+                raise Exception(message["error"])
+            if "done" in message:
+                return
+            yield message["out"]
+    finally:
+        f.close()
+        sock.close()
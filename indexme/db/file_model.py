@@ -1,26 +1,133 @@
 import os
-from typing import Any, cast
+from datetime import datetime, timezone
+from typing import Any, Optional, cast
 
-from sqlalchemy import Boolean, Column, DateTime, Integer, String
+from sqlalchemy import (
+    Column,
+    ForeignKey,
+    Index,
+    Integer,
+    LargeBinary,
+    String,
+    UniqueConstraint,
+    select,
+)
+from sqlalchemy.ext.hybrid import hybrid_property
+from sqlalchemy.orm import column_property
+from sqlalchemy.types import TypeDecorator
 
 from indexme.db.connection import Base
+from indexme.db.layout import FLAG_DIR, FLAG_EXECUTABLE, FLAG_SUID
+
+
+class EpochDateTime(TypeDecorator):
+    """
+    Stores timezone-aware datetimes as integer UNIX timestamps.
+    Naive datetimes are assumed to be in local time.
+    """
+
+    impl = Integer
+    cache_ok = True
+
+    def process_bind_param(self, value: Optional[datetime], dialect: Any) -> Any:
+        return None if value is None else int(value.timestamp())
+
+    def process_result_value(self, value: Optional[int], dialect: Any) -> Any:
+        return None if value is None else datetime.fromtimestamp(value, timezone.utc)
+
+
+class Directory(Base):
+    """
+    A directory containing indexed files.
+    Path is stored with a trailing slash (see dir_key).
+    Totals of its direct non-directory children are kept up to date
+    by triggers (see migrations).
+    """
+
+    __tablename__ = "dirs"
+
+    id: Any = Column(Integer, primary_key=True)
+    path: Any = Column(String, nullable=False, unique=True)
+    files_size: Any = Column(Integer, nullable=False, server_default="0")
+    files_count: Any = Column(Integer, nullable=False, server_default="0")
+
+
+class JournalEntry(Base):
+    """
+    A change of an indexed path, recorded by triggers (see migrations).
+    Kinds are listed in layout (CHANGE_*). Sequence numbers are never
+    reused, even after entries are removed.
+    Updates refer to files by id, as paths take much more space.
+    Removals and moves, which outlive the rows they refer to, hold paths.
+    """
+
+    __tablename__ = "journal"
+    __table_args__ = {"sqlite_autoincrement": True}
+
+    seq: Any = Column(Integer, primary_key=True)
+    file_id: Any = Column(Integer)
+    path: Any = Column(String)
+    kind: Any = Column(Integer, nullable=False)
+
+
+class Scan(Base):
+    """
+    Start time of the last full or incremental scan of a directory.
+    """
+
+    __tablename__ = "scans"
+
+    path: Any = Column(String, primary_key=True)
+    started_at: Any = Column(EpochDateTime, nullable=False)
+
+
+def _flag(bit: int) -> Any:
+    """
+    Exposes a bit of File.flags as a boolean attribute, usable in queries.
+    """
+
+    def get(self: "File") -> bool:
+        return cast(int, self.flags) & bit != 0
+
+    def set(self: "File", value: bool) -> None:
+        self.flags = (self.flags or 0) & ~bit | (bit if value else 0)
+
+    def expr(cls: Any) -> Any:
+        return cls.flags.op("&")(bit) != 0
+
+    return hybrid_property(get, set, expr=expr)
 
 
 class File(Base):
     """
     An indexed file or directory.
+    Indexes by modification time and by size hold columns needed to
+    filter by directory and flags, and to break ties like FileSortDirection.
+    Ids are never reused, as the journal refers to files by them.
     """
 
     __tablename__ = "files"
+    __table_args__ = (
+        UniqueConstraint("parent_id", "name"),
+        Index("ix_files_modified_at", "modified_at", "id", "parent_id", "flags"),
+        Index("ix_files_size", "size", "id", "parent_id", "flags"),
+        {"sqlite_autoincrement": True},
+    )
 
-    path: Any = Column(String, primary_key=True)
-    name: Any = Column(String, nullable=False, index=True)
-    is_dir: Any = Column(Boolean, nullable=False)
-    is_executable: Any = Column(Boolean, nullable=False)
-    is_suid: Any = Column(Boolean, nullable=False)
+    id: Any = Column(Integer, primary_key=True)
+    parent_id: Any = Column(Integer, ForeignKey("dirs.id"), nullable=False)
+    name: Any = Column(String, nullable=False)
+    flags: Any = Column(Integer, nullable=False)
     size: Any = Column(Integer, nullable=False)
-    created_at: Any = Column(DateTime, nullable=False)
-    modified_at: Any = Column(DateTime, nullable=False)
+    created_at: Any = Column(EpochDateTime, nullable=False)
+    modified_at: Any = Column(EpochDateTime, nullable=False)
+
+    path: Any = column_property(
+        select(Directory.path + name).where(Directory.id == parent_id).scalar_subquery()
+    )
+    is_dir: Any = _flag(FLAG_DIR)
+    is_executable: Any = _flag(FLAG_EXECUTABLE)
+    is_suid: Any = _flag(FLAG_SUID)
 
     def __str__(self) -> str:
         path = os.path.relpath(cast(str, self.path))
@@ -28,6 +135,22 @@ class File(Base):
         return f"{path}: {self.name} ({size}, {self.created_at} - {self.modified_at})"
 
 
+class FileHash(Base):
+    """
+    Hashes of contents of a file, valid while its size and modification
+    time are as recorded here. Removed with the file by a trigger
+    (see migrations).
+    """
+
+    __tablename__ = "hashes"
+
+    file_id: Any = Column(Integer, ForeignKey("files.id"), primary_key=True)
+    size: Any = Column(Integer, nullable=False)
+    modified_at: Any = Column(EpochDateTime, nullable=False)
+    partial: Any = Column(LargeBinary, nullable=False)
+    full: Any = Column(LargeBinary)
+
+
 def format_bytes(size: float) -> str:
     """
     Formats byte number to human-readable form.
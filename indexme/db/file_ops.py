@@ -1,45 +1,84 @@
 import os
 from datetime import datetime
-from typing import Iterator, Optional, cast
+from typing import Any, Dict, Iterable, Iterator, Optional, Tuple, cast
 
+from sqlalchemy import and_, func, or_, select, tuple_
+from sqlalchemy.orm import aliased
 from sqlalchemy.orm.query import Query
 from sqlalchemy.orm.session import Session
 
-from indexme.db.file_model import File
-from indexme.db.stat import Stat
+from indexme.db.file_model import Directory, File
+from indexme.db.layout import (
+    MIN_FRAGMENT_LENGTH,
+    dir_key,
+    prefer_sorted_scan,
+    subtree_range,
+)
+from indexme.db.name_index import NameIndex
 
+STREAM_BATCH_SIZE = 1000
 
-def add_file(s: Session, path: str) -> File:
+GET_FILES_BATCH_SIZE = 300
+"""
+Keeps get_files below SQLite's default limit of 999 bound parameters.
+"""
+
+
+def dir_id(path: str) -> Any:
+    """
+    Selects id of a directory under given path.
+    """
+    return select(Directory.id).where(Directory.path == dir_key(path)).scalar_subquery()
+
+
+def in_subtree(root: str, indexed: bool = True) -> Any:
     """
-    Indexes a file or a directory under given path.
+    Matches a file under given path and all files below it.
+    Served by a range scan over directory paths, and does not match
+    siblings sharing a name prefix (/home/ab for /home/a).
+    Unless indexed, files are not looked up by their parent directories,
+    so that SQLite reads them in order of another index instead.
     """
-    path = os.path.abspath(path)
-    stat = Stat.get(path)
-    entry = s.query(File).filter(File.path == path).one_or_none() or File()  # type: ignore
-    entry.path = path
-    entry.name = os.path.split(path)[1]
-    entry.is_dir = stat.is_dir()
-    entry.is_executable = stat.is_executable()
-    entry.is_suid = stat.is_suid()
-    entry.size = stat.size()
-    entry.created_at = stat.ctime()
-    entry.modified_at = stat.mtime()
-    s.add(entry)
-    return entry
+    lower, upper = subtree_range(root)
+    subtree = select(Directory.id).where(
+        Directory.path >= lower, Directory.path < upper
+    )
+    # Expressions of a column are not served by its indexes.
+    parent_id = File.parent_id if indexed else File.parent_id + 0
+    return or_(parent_id.in_(subtree), is_path(root, indexed))
+
+
+def is_path(path: str, indexed: bool = True) -> Any:
+    """
+    Matches a file under given path.
+    """
+    parent, name = os.path.split(path)
+    parent_id = File.parent_id if indexed else File.parent_id + 0
+    return and_(parent_id == dir_id(parent), File.name == name)
+
+
+Cursor = Tuple[Any, int]
+"""
+Value of the sort column and id of the last file of a page of results.
+"""
 
 
 class FileSortDirection:
     """
     Represents a parsed sorting directory.
+    Sorting by date or size follows an index (see File).
     """
 
-    def __init__(self, dir: str):
+    def __init__(self, dir: str, reverse: bool = False):
+        self.reverse = reverse
+        self.indexed = False
         if dir in ["name"]:
             self.col = File.name
             return
         if dir in ["path"]:
             self.col = File.path
             return
+        self.indexed = True
         if dir in ["date", "newest"]:
             self.col = File.modified_at
             return
@@ -51,36 +90,81 @@ class FileSortDirection:
     def apply(self, query: Query) -> Query:
         """
         Applies a filter to a query.
+        Ties are broken by indexing order.
         """
-        return cast(Query, query.order_by(self.col))
+        order = [self.col, File.id]
+        if self.reverse:
+            order = [column.desc() for column in order]
+        return cast(Query, query.order_by(*order))
+
+    def cursor(self, file: File) -> Cursor:
+        """
+        Gets a cursor pointing right after given file.
+        """
+        return getattr(file, self.col.key), cast(int, file.id)
+
+    def after(self, cursor: Cursor) -> Any:
+        """
+        Matches files coming after a cursor in this order.
+        """
+        key = tuple_(self.col, File.id)
+        return key < cursor if self.reverse else key > cursor
 
 
 class GetAllFiles:
     """
     Builds a search query.
+    With sorted_scan, files under root are not looked up by their
+    directories, but read in order of an index of the sort column
+    (see sorted_scan_pays_off).
     """
 
-    def __init__(self, session: Session, root: str):
+    def __init__(self, session: Session, root: str, sorted_scan: bool = False):
+        self.session = session
+        self.name_indexed = False
         self.root = os.path.abspath(root)
-        self.query = session.query(File).where(File.path.startswith(self.root))  # type: ignore
+        subtree = in_subtree(self.root, indexed=not sorted_scan)
+        self.query = session.query(File).where(subtree)  # type: ignore
 
     def with_path_prefix(self, path: Optional[str]) -> "GetAllFiles":
         if path is not None:
-            self.query = self.query.where(File.path.startswith(path))
+            self.query = self.query.where(in_subtree(os.path.abspath(path)))
         return self
 
     def with_path_equal(self, path: Optional[str]) -> "GetAllFiles":
         if path is not None:
-            self.query = self.query.where(File.path == path)
+            self.query = self.query.where(is_path(os.path.abspath(path)))
+        return self
+
+    def with_parent(self, path: Optional[str]) -> "GetAllFiles":
+        if path is not None:
+            self.query = self.query.where(
+                File.parent_id == dir_id(os.path.abspath(path))
+            )
         return self
 
+    def _with_name_index(self, pattern: str, fragment: str) -> None:
+        """
+        Narrows down the query using trigram index, if available
+        and fragment is long enough. Only the first fragment uses the index.
+        """
+        if len(fragment) < MIN_FRAGMENT_LENGTH or self.name_indexed:
+            return
+        if not self.session.info.get("name_index", False):
+            return
+        matches = select(NameIndex.c.rowid).where(NameIndex.c.name.like(pattern))
+        self.query = self.query.where(File.id.in_(matches))
+        self.name_indexed = True
+
     def with_name(self, name: Optional[str]) -> "GetAllFiles":
         if name is not None:
+            self._with_name_index(f"%{name}%", name)
             self.query = self.query.where(File.name.contains(name))
         return self
 
     def with_extension(self, extension: Optional[str]) -> "GetAllFiles":
         if extension is not None:
+            self._with_name_index(f"%.{extension}", f".{extension}")
             self.query = self.query.where(File.name.endswith(f".{extension}"))
         return self
 
@@ -127,8 +211,17 @@ class GetAllFiles:
             )
         return self
 
-    def with_sorting(self, sort_by: Optional[FileSortDirection]) -> "GetAllFiles":
+    def with_sorting(
+        self, sort_by: Optional[FileSortDirection], after: Optional[Cursor] = None
+    ) -> "GetAllFiles":
+        """
+        Sorts matching files. Given a cursor of the last file of a page,
+        only files after it are matched, so the next page is read
+        from an index instead of skipping over the previous ones.
+        """
         if sort_by is not None:
+            if after is not None:
+                self.query = self.query.where(sort_by.after(after))
             self.query = sort_by.apply(self.query)
         return self
 
@@ -137,7 +230,50 @@ class GetAllFiles:
         return self
 
     def __iter__(self) -> Iterator[File]:
-        yield from self.query.all()
+        """
+        Streams matching files from the cursor in batches.
+        Files are not kept by the session once the caller drops them.
+        Do not write to the database until iteration ends.
+        """
+        yield from self.query.yield_per(STREAM_BATCH_SIZE)
+
+    def rows(self, *columns: Any) -> Iterator[Tuple[Any, ...]]:
+        """
+        Streams chosen columns of matching files as plain tuples,
+        without building File objects.
+        """
+        yield from self.query.with_entities(*columns).yield_per(STREAM_BATCH_SIZE)
+
+    def count(self) -> int:
+        """
+        Counts matching files in SQL, ignoring sorting.
+        """
+        query = self.query.with_entities(func.count()).order_by(None)
+        return cast(int, query.scalar())
+
+    def total_size(self) -> int:
+        """
+        Sums sizes of matching non-directory files in SQL, ignoring sorting.
+        """
+        query = self.query.where(File.is_dir == False)
+        query = query.with_entities(func.coalesce(func.sum(File.size), 0))
+        return cast(int, query.order_by(None).scalar())
+
+
+def sorted_scan_pays_off(
+    s: Session, root: str, sort_by: FileSortDirection, limit: Optional[int]
+) -> bool:
+    """
+    Decides whether to read files in order of an index of the sort column
+    rather than to sort files under root (see prefer_sorted_scan).
+    Number of files under root is read from directory totals, and ids
+    of files estimate number of all files.
+    """
+    if not sort_by.indexed:
+        return False
+    matched = subtree_totals(s, root)[1]
+    total = cast(Optional[int], s.query(func.max(File.id)).scalar()) or 0
+    return prefer_sorted_scan(matched, total, limit)
 
 
 def get_file(s: Session, path: str) -> Optional[File]:
@@ -146,3 +282,74 @@ def get_file(s: Session, path: str) -> Optional[File]:
     """
     query = GetAllFiles(s, path).with_path_equal(path).limit(1)
     return next(query.__iter__(), None)
+
+
+def get_files(s: Session, paths: Iterable[str]) -> Dict[str, File]:
+    """
+    Searches for given exact paths in the database,
+    using a query per GET_FILES_BATCH_SIZE paths.
+    Returns found files by path.
+    """
+    paths = sorted({os.path.abspath(path) for path in paths})
+    files: Dict[str, File] = dict()
+    # Aliased, so that File.path subquery is not correlated with it.
+    parent = aliased(Directory)
+    for i in range(0, len(paths), GET_FILES_BATCH_SIZE):
+        batch = paths[i : i + GET_FILES_BATCH_SIZE]
+        # Narrows down the search to few (parent_id, name) index lookups.
+        parents = {dir_key(os.path.dirname(path)) for path in batch}
+        names = {os.path.basename(path) for path in batch}
+        query = (
+            s.query(File)
+            .join(parent, parent.id == File.parent_id)
+            .filter(parent.path.in_(parents))
+            .filter(File.name.in_(names))
+            .filter((parent.path + File.name).in_(batch))
+        )
+        files.update((file.path, file) for file in query)
+    return files
+
+
+def subtree_totals(s: Session, root: str) -> Tuple[int, int]:
+    """
+    Gets total size and count of non-directory files under root.
+    Reads precomputed directory totals instead of the files themselves.
+    """
+    root = os.path.abspath(root)
+    lower, upper = subtree_range(root)
+    query = select(
+        func.coalesce(func.sum(Directory.files_size), 0),
+        func.coalesce(func.sum(Directory.files_count), 0),
+    ).where(Directory.path >= lower, Directory.path < upper)
+    size, count = s.execute(query).one()
+    if size == 0 and count == 0:
+        # Root may be a file.
+        file = get_file(s, root)
+        if file is not None and not file.is_dir:
+            return file.size, 1
+    return size, count
+
+
+def directory_totals(s: Session, root: str) -> Iterator[Tuple[str, int, int]]:
+    """
+    Gets (path, size, count) of non-directory files below each indexed
+    directory under root, like du does - subdirectories before parents.
+    Reads precomputed directory totals instead of the files themselves.
+    """
+    lower, upper = subtree_range(os.path.abspath(root))
+    query = (
+        s.query(Directory.path, Directory.files_size, Directory.files_count)
+        .filter(Directory.path >= lower, Directory.path < upper)
+        .order_by(Directory.path.desc())
+    )
+    # Paths are sorted in reverse, so each directory comes right after
+    # its whole subtree. Only ancestors' partial sums are kept.
+    pending: Dict[str, Tuple[int, int]] = {}
+    for key, size, count in query.yield_per(STREAM_BATCH_SIZE):
+        sub_size, sub_count = pending.pop(key, (0, 0))
+        size, count = size + sub_size, count + sub_count
+        path = os.path.dirname(key)
+        yield path, size, count
+        parent = dir_key(os.path.dirname(path))
+        parent_size, parent_count = pending.get(parent, (0, 0))
+        pending[parent] = (parent_size + size, parent_count + count)
@@ -0,0 +1,223 @@
+import hashlib
+import mmap
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from itertools import groupby
+from typing import Any, Iterable, Iterator, List, Optional, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm.session import Session
+
+from indexme.db.connection import transaction
+from indexme.db.file_model import File, FileHash
+from indexme.db.file_ops import STREAM_BATCH_SIZE, GetAllFiles
+from indexme.db.scan_stats import ScanStats
+
+PARTIAL_SIZE = 64 * 1024
+"""
+How many bytes from each end of a file make up its partial hash.
+Files up to twice as long are hashed in full right away.
+"""
+
+Digest = Tuple[int, int, bytes, Optional[bytes]]
+"""
+Size and modification time of a file when it was read,
+its partial hash and, if asked for, its full hash.
+"""
+
+
+def _digest(*chunks: Any) -> bytes:
+    digest = hashlib.blake2b(digest_size=16)
+    for chunk in chunks:
+        digest.update(chunk)
+    return digest.digest()
+
+
+def hash_file(task: Tuple[str, bool]) -> Optional[Digest]:
+    """
+    Hashes a file given its path and whether to hash it in full.
+    Reads it through mmap, so only the hashed pages are read.
+    Returns None if it cannot be read or is empty.
+    """
+    path, full = task
+    try:
+        with open(path, "rb") as f:
+            st = os.fstat(f.fileno())
+            if st.st_size == 0:
+                return None
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                view = memoryview(m)
+                whole: Optional[bytes] = None
+                try:
+                    if st.st_size <= 2 * PARTIAL_SIZE:
+                        partial = whole = _digest(view)
+                    else:
+                        partial = _digest(view[:PARTIAL_SIZE], view[-PARTIAL_SIZE:])
+                        if full:
+                            whole = _digest(view)
+                finally:
+                    view.release()
+    except (OSError, ValueError):
+        return None
+    return st.st_size, int(st.st_mtime), partial, whole
+
+
+class _Candidate:
+    """
+    A file sharing its size with another one, with its stored hashes
+    if they are still valid.
+    """
+
+    def __init__(self, row: Tuple[Any, ...]) -> None:
+        id, path, size, modified_at, hash_size, hash_modified_at, partial, full = row
+        self.id: int = id
+        self.path: str = path
+        self.size: int = size
+        self.mtime = int(modified_at.timestamp())
+        valid = (hash_size, hash_modified_at) == (size, modified_at)
+        self.partial: Optional[bytes] = partial if valid else None
+        self.full: Optional[bytes] = full if valid else None
+        self.changed = False
+
+
+def _candidates(s: Session, root: str) -> List[_Candidate]:
+    """
+    Gets non-empty files under root whose sizes are not unique.
+    """
+    files = GetAllFiles(s, root).with_directories_bit(False).query
+    files = files.filter(File.size > 0)
+    sizes = (
+        files.with_entities(File.size)
+        .group_by(File.size)
+        .having(func.count() > 1)
+        .subquery()
+    )
+    query = (
+        files.filter(File.size.in_(sizes.select()))
+        .outerjoin(FileHash, FileHash.file_id == File.id)
+        .with_entities(
+            File.id,
+            File.path,
+            File.size,
+            File.modified_at,
+            FileHash.size,
+            FileHash.modified_at,
+            FileHash.partial,
+            FileHash.full,
+        )
+    )
+    return [_Candidate(row) for row in query.yield_per(STREAM_BATCH_SIZE)]
+
+
+def _hash(
+    candidates: List[_Candidate],
+    full: bool,
+    executor: Optional[ProcessPoolExecutor],
+    stats: ScanStats,
+) -> None:
+    """
+    Hashes candidates, partially or in full. Files changed since they
+    were indexed are left without hashes, until they are indexed again.
+    """
+    tasks = [(c.path, full) for c in candidates]
+    if executor is not None:
+        digests: Iterable[Optional[Digest]] = executor.map(
+            hash_file, tasks, chunksize=64
+        )
+    else:
+        digests = map(hash_file, tasks)
+    for candidate, digest in zip(candidates, digests):
+        if digest is None or digest[:2] != (candidate.size, candidate.mtime):
+            continue
+        _size, _mtime, candidate.partial, candidate.full = digest
+        candidate.changed = True
+        read = candidate.size if full else min(candidate.size, 2 * PARTIAL_SIZE)
+        stats.add(files_hashed=1, bytes_hashed=read)
+
+
+def _save(s: Session, candidates: List[_Candidate]) -> None:
+    table = FileHash.__table__
+    stmt = insert(table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.file_id],
+        set_={c.name: stmt.excluded[c.name] for c in table.c if c.name != "file_id"},
+    )
+    rows = [
+        {
+            "file_id": c.id,
+            "size": c.size,
+            "modified_at": datetime.fromtimestamp(c.mtime, timezone.utc),
+            "partial": c.partial,
+            "full": c.full,
+        }
+        for c in candidates
+        if c.changed
+    ]
+    if len(rows) > 0:
+        with transaction(s) as conn:
+            conn.execute(stmt, rows)
+
+
+def hash_files(
+    s: Session,
+    root: str,
+    workers: Optional[int] = None,
+    stats: Optional[ScanStats] = None,
+) -> None:
+    """
+    Hashes contents of files under root that might have duplicates.
+    Only files sharing their size with another one are read: first their
+    ends (partial hash), then, for those whose partial hashes collide too,
+    all of their contents (full hash). Hashes stored before are reused
+    while size and modification time of a file stay the same.
+    Files are read by a pool of worker processes, unless workers is 1.
+    """
+    stats = stats if stats is not None else ScanStats()
+    started = time.perf_counter()
+    candidates = _candidates(s, root)
+    executor = None if workers == 1 else ProcessPoolExecutor(workers)
+    try:
+        unhashed = [c for c in candidates if c.partial is None]
+        _hash(unhashed, False, executor, stats)
+
+        def key(c: _Candidate) -> Tuple[int, bytes]:
+            return c.size, c.partial or b""
+
+        hashed = sorted((c for c in candidates if c.partial is not None), key=key)
+        unconfirmed: List[_Candidate] = []
+        for _key, group in groupby(hashed, key=key):
+            same = list(group)
+            if len(same) > 1:
+                unconfirmed.extend(c for c in same if c.full is None)
+        _hash(unconfirmed, True, executor, stats)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    _save(s, candidates)
+    stats.add("hash", time.perf_counter() - started)
+
+
+def duplicates(query: GetAllFiles) -> Iterator[List[str]]:
+    """
+    Streams groups of paths of files matching a query that have the same
+    contents, largest files first. Only files hashed in full since they
+    last changed are considered (see hash_files).
+    """
+    rows = (
+        query.query.join(FileHash, FileHash.file_id == File.id)
+        .filter(
+            FileHash.full.isnot(None),
+            FileHash.size == File.size,
+            FileHash.modified_at == File.modified_at,
+        )
+        .with_entities(File.size, FileHash.full, File.path)
+        .order_by(File.size.desc(), FileHash.full, File.path)
+        .yield_per(STREAM_BATCH_SIZE)
+    )
+    for _key, group in groupby(rows, key=lambda row: row[:2]):
+        paths = [path for _size, _full, path in group]
+        if len(paths) > 1:
+            yield paths
@@ -0,0 +1,321 @@
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Callable, Collection, Dict, Iterable, List, Optional, Pattern
+
+from indexme.db.layout import dir_key
+
+IGNORE_FILES = [".gitignore", ".indexmeignore"]
+"""
+Names of files holding patterns of paths to exclude below their directory.
+Patterns of later ones take precedence.
+"""
+
+CACHED_DIRS = 4096
+"""
+How many directories' lists of patterns are kept (see Exclusions).
+"""
+
+
+def translate(pattern: str) -> str:
+    """
+    Translates a glob pattern of a path into a regular expression,
+    following gitignore: * and ? do not match slashes, **/ matches
+    any number of directories, and a trailing /** everything inside.
+
+    >>> translate("*.o")
+    '[^/]*\\\\.o'
+    >>> translate("**/target")
+    '(?:.*/)?target'
+    >>> translate("a/**/b[!0-9]")
+    'a/(?:.*/)?b(?!/)[^0-9]'
+    >>> translate("[a-c]")
+    '(?!/)[a-c]'
+    """
+    regex = ""
+    i = 0
+    while i < len(pattern):
+        at_start = i == 0 or pattern[i - 1] == "/"
+        if at_start and pattern.startswith("**/", i):
+            regex += "(?:.*/)?"
+            i += 3
+            continue
+        if at_start and pattern[i:] == "**":
+            regex += ".*"
+            break
+        c = pattern[i]
+        i += 1
+        if c == "*":
+            regex += "[^/]*"
+        elif c == "?":
+            regex += "[^/]"
+        elif c == "\\" and i < len(pattern):
+            regex += re.escape(pattern[i])
+            i += 1
+        elif c == "[":
+            end = _class_end(pattern, i)
+            if end is None:
+                regex += re.escape(c)
+                continue
+            members = pattern[i:end]
+            negated = members[:1] in ["!", "^"]
+            members = members[1:] if negated else members
+            # Ranges are kept, and neither kind of class matches a slash.
+            members = "".join(x if x == "-" else re.escape(x) for x in members)
+            regex += _class(members, negated)
+            i = end + 1
+        else:
+            regex += re.escape(c)
+    return regex
+
+
+def _class(members: str, negated: bool) -> str:
+    """
+    Builds a character class not matching slashes from escaped members.
+    Classes with invalid ranges, like [z-a], match nothing.
+    """
+    regex = f"(?!/)[^{members}]" if negated else f"(?!/)[{members}]"
+    try:
+        re.compile(regex)
+    except re.error:
+        return "(?!)"
+    return regex
+
+
+def _class_end(pattern: str, start: int) -> Optional[int]:
+    """
+    Finds the bracket closing a character class starting at given index,
+    right after the opening one. A bracket right at the start is a member.
+    """
+    if pattern[start : start + 1] in ["!", "^"]:
+        start += 1
+    end = pattern.find("]", start + 1)
+    return None if end == -1 else end
+
+
+class IgnorePatterns:
+    """
+    Patterns of paths below a base directory, with gitignore syntax:
+    comments (#), negations (!), directory-only patterns (trailing /),
+    and patterns anchored to the base when they hold a slash elsewhere.
+    The last matching pattern wins.
+
+    Plain names are looked up in a dictionary, and all other patterns
+    are compiled into a single regular expression, so matching does not
+    get slower with each added name.
+
+    >>> patterns = IgnorePatterns("/src", ["*.o", "!keep.o", "build/", "/tmp"])
+    >>> [patterns.match(x, False) for x in ["/src/a/b.o", "/src/keep.o", "/src/c"]]
+    [True, False, None]
+    >>> patterns.match("/src/a/build", False), patterns.match("/src/a/build", True)
+    (None, True)
+    >>> patterns.match("/src/tmp", True), patterns.match("/src/a/tmp", True)
+    (True, None)
+    >>> ranges = IgnorePatterns("/src", ["log[0-9]", "[!a-z]*.tmp", "a[!b]c"])
+    >>> [ranges.match(f"/src/{x}", False) for x in ["log5", "log-", "9.tmp", "b.tmp"]]
+    [True, None, True, None]
+    >>> ranges.match("/src/a-c", False), ranges.match("/src/a/c", False)
+    (True, None)
+    """
+
+    def __init__(self, base: str, lines: Iterable[str]) -> None:
+        self.base = dir_key(base)
+        self.negated: List[bool] = []
+        # Plain names, matching files and directories, or directories only.
+        self.names: Dict[str, int] = {}
+        self.dir_names: Dict[str, int] = {}
+        file_regexes: List[str] = []
+        dir_regexes: List[str] = []
+        for line in lines:
+            line = line.rstrip("\n")
+            # Trailing spaces are ignored, unless escaped.
+            if not line.endswith("\\ "):
+                line = line.rstrip(" ")
+            if line == "" or line.startswith("#"):
+                continue
+            index = len(self.negated)
+            negated = line.startswith("!")
+            line = line[1:] if negated else line
+            if line.startswith(("\\!", "\\#")):
+                line = line[1:]
+            dir_only = line.endswith("/")
+            line = line.rstrip("/")
+            if line == "":
+                continue
+            self.negated.append(negated)
+
+            if "/" not in line and re.search(r"[*?\[\\]", line) is None:
+                (self.dir_names if dir_only else self.names)[line] = index
+                continue
+            if "/" in line:
+                regex = translate(line.lstrip("/"))
+            else:
+                regex = "(?:.*/)?" + translate(line)
+            group = f"(?P<p{index}>{regex})"
+            dir_regexes.append(group)
+            if not dir_only:
+                file_regexes.append(group)
+        # Alternatives are tried in order, so later patterns go first.
+        self.file_regex = _compile(file_regexes)
+        self.dir_regex = _compile(dir_regexes)
+
+    def match(self, path: str, is_dir: bool) -> Optional[bool]:
+        """
+        Tells whether an absolute path below base is excluded,
+        or None if no pattern matches it.
+        """
+        relative = path[len(self.base) :]
+        name = relative[relative.rfind("/") + 1 :]
+        found = self.names.get(name, -1)
+        if is_dir:
+            found = max(found, self.dir_names.get(name, -1))
+        regex = self.dir_regex if is_dir else self.file_regex
+        if regex is not None:
+            match = regex.fullmatch(relative)
+            if match is not None and match.lastgroup is not None:
+                found = max(found, int(match.lastgroup[1:]))
+        return None if found < 0 else not self.negated[found]
+
+    def __bool__(self) -> bool:
+        return len(self.negated) > 0
+
+
+def _compile(regexes: List[str]) -> Optional[Pattern[str]]:
+    if len(regexes) == 0:
+        return None
+    return re.compile("|".join(reversed(regexes)), re.DOTALL)
+
+
+def read_ignore_file(dir_path: str, name: str) -> IgnorePatterns:
+    """
+    Reads patterns of an ignore file in a directory.
+    Unreadable files hold no patterns.
+    """
+    try:
+        with open(os.path.join(dir_path, name), errors="surrogateescape") as f:
+            return IgnorePatterns(dir_path, f.readlines())
+    except OSError:
+        return IgnorePatterns(dir_path, [])
+
+
+class Exclusions:
+    """
+    Decides which paths to skip while indexing. Global patterns
+    (indexme.ignore and --exclude) are matched against absolute paths,
+    and patterns of ignore files (see IGNORE_FILES) against paths below
+    their directories. Like in git, patterns of deeper directories take
+    precedence over those above them, and over global ones.
+
+    Lists of patterns applying in a directory are cached for recently
+    visited directories, and shared by directories below them.
+    Call forget after an ignore file changes.
+    """
+
+    def __init__(self, patterns: Iterable[str], ignore_files: bool = True) -> None:
+        self.globals = IgnorePatterns("/", patterns)
+        self.ignore_files = ignore_files
+        self.lock = threading.Lock()
+        self.cache: "OrderedDict[str, List[IgnorePatterns]]" = OrderedDict()
+
+    def _patterns(
+        self, dir_path: str, names: Optional[Collection[str]] = None
+    ) -> List[IgnorePatterns]:
+        """
+        Gets patterns applying to entries of an absolute directory path,
+        in order of precedence. Given names of its entries, ignore files
+        missing from them are not looked for.
+        """
+        if not self.ignore_files:
+            return [self.globals] if self.globals else []
+        with self.lock:
+            patterns = self.cache.get(dir_path)
+            if patterns is not None:
+                self.cache.move_to_end(dir_path)
+                return patterns
+
+        parent = os.path.dirname(dir_path)
+        if parent == dir_path:
+            patterns = [self.globals] if self.globals else []
+        else:
+            patterns = self._patterns(parent)
+        for name in IGNORE_FILES:
+            if names is not None:
+                present = name in names
+            else:
+                # Checking for a file is cheaper than failing to open it.
+                present = os.access(os.path.join(dir_path, name), os.F_OK)
+            read = read_ignore_file(dir_path, name) if present else None
+            if read:
+                patterns = [read, *patterns]
+
+        with self.lock:
+            self.cache[dir_path] = patterns
+            if len(self.cache) > CACHED_DIRS:
+                self.cache.popitem(last=False)
+        return patterns
+
+    def directory(
+        self, dir_path: str, names: Optional[Collection[str]] = None
+    ) -> Callable[[str, bool], bool]:
+        """
+        Gets a function telling whether an entry of a directory is excluded,
+        given its name and whether it is a directory itself.
+        """
+        key = dir_key(os.path.abspath(dir_path))
+        patterns = self._patterns(os.path.dirname(key), names)
+        if len(patterns) == 0:
+            return lambda name, is_dir: False
+
+        def excluded(name: str, is_dir: bool) -> bool:
+            path = key + name
+            for x in patterns:
+                result = x.match(path, is_dir)
+                if result is not None:
+                    return result
+            return False
+
+        return excluded
+
+    def applies(self, dir_path: str) -> bool:
+        """
+        Tells whether any patterns apply to entries of a directory.
+        """
+        return len(self._patterns(os.path.abspath(dir_path))) > 0
+
+    def filter_entries(
+        self, dir_path: str, entries: Iterable["os.DirEntry[str]"]
+    ) -> List["os.DirEntry[str]"]:
+        """
+        Leaves out excluded entries of a directory listing.
+        Entries that cannot be checked for being directories count as files.
+        """
+        entries = list(entries)
+        names = [x.name for x in entries if x.name in IGNORE_FILES]
+        excluded = self.directory(dir_path, names)
+        kept = []
+        for entry in entries:
+            try:
+                is_dir = entry.is_dir(follow_symlinks=False)
+            except OSError:
+                is_dir = False
+            if not excluded(entry.name, is_dir):
+                kept.append(entry)
+        return kept
+
+    def excluded(self, path: str, is_dir: bool) -> bool:
+        """
+        Tells whether a path is excluded. Its parents are not checked.
+        """
+        parent, name = os.path.split(os.path.abspath(path))
+        return self.directory(parent)(name, is_dir)
+
+    def forget(self, dir_path: str) -> None:
+        """
+        Drops cached patterns of a directory and directories below it.
+        """
+        key = dir_key(os.path.abspath(dir_path))
+        with self.lock:
+            for cached in list(self.cache):
+                if dir_key(cached).startswith(key):
+                    del self.cache[cached]
@@ -0,0 +1,107 @@
+import os
+from typing import Iterator, Optional, Tuple, cast
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.orm.session import Session
+
+from indexme.db.connection import transaction
+from indexme.db.file_model import Directory, File, JournalEntry
+from indexme.db.file_ops import STREAM_BATCH_SIZE, GetAllFiles
+from indexme.db.layout import (
+    CHANGE_FORGOTTEN,
+    CHANGE_MOVED,
+    CHANGE_UPDATED,
+    subtree_range,
+)
+
+Change = Tuple[int, int, str]
+"""
+Sequence number, kind (see CHANGE_* in layout) and path of a change.
+"""
+
+
+def forgotten_seq(s: Session) -> int:
+    """
+    Gets sequence number up to which changes were forgotten, or 0.
+    """
+    query = s.query(func.max(JournalEntry.seq)).filter(
+        JournalEntry.kind == CHANGE_FORGOTTEN
+    )
+    return cast(Optional[int], query.scalar()) or 0
+
+
+def changes_since(s: Session, seq: int, root: str) -> Iterator[Change]:
+    """
+    Streams changes of paths under root made after a given sequence number,
+    oldest first. Updated files are listed under their current paths,
+    and not at all once removed, as their removal is listed later.
+    Entries below moved directories are listed as updated, right after
+    the move, as they are found under their new path.
+    Fails if some of these changes were forgotten.
+    Do not write to the database until iteration ends.
+    """
+    forgotten = forgotten_seq(s)
+    if seq < forgotten:
+        raise Exception(
+            f"Changes up to {forgotten} were forgotten, list all files instead"
+        )
+    root = os.path.abspath(root)
+    lower, upper = subtree_range(root)
+    path = func.coalesce(JournalEntry.path, Directory.path + File.name)
+    query = (
+        s.query(JournalEntry.seq, JournalEntry.kind, path)
+        .outerjoin(File, File.id == JournalEntry.file_id)
+        .outerjoin(Directory, Directory.id == File.parent_id)
+        .filter(JournalEntry.seq > seq, JournalEntry.kind != CHANGE_FORGOTTEN)
+        .filter((path == root) | ((path >= lower) & (path < upper)))
+        .order_by(JournalEntry.seq)
+    )
+    for change_seq, kind, change_path in query.yield_per(STREAM_BATCH_SIZE):
+        yield change_seq, kind, change_path
+        if kind == CHANGE_MOVED:
+            for (moved,) in GetAllFiles(s, change_path).rows(File.path):
+                if moved != change_path:
+                    yield change_seq, CHANGE_UPDATED, moved
+
+
+def compact_journal(s: Session) -> int:
+    """
+    Removes journal entries made redundant by later ones: updates
+    followed by another update of the same file, or by its removal,
+    and removals and moves followed by another one of the same path.
+    Changes since any sequence number still lead to the same state.
+    Returns number of removed entries.
+    """
+    journal = JournalEntry.__table__
+    files = File.__table__
+    # Updates have no path, and removals and moves no file id.
+    latest_of_kind = select(func.max(journal.c.seq)).group_by(
+        journal.c.kind, journal.c.file_id, journal.c.path
+    )
+    with transaction(s) as conn:
+        removed = conn.execute(
+            delete(journal).where(
+                journal.c.kind != CHANGE_FORGOTTEN,
+                journal.c.seq.not_in(latest_of_kind),
+            )
+        ).rowcount
+        removed += conn.execute(
+            delete(journal).where(
+                journal.c.kind == CHANGE_UPDATED,
+                journal.c.file_id.not_in(select(files.c.id)),
+            )
+        ).rowcount
+    return cast(int, removed)
+
+
+def forget_changes(s: Session, seq: int) -> None:
+    """
+    Removes journal entries up to a given sequence number, once all
+    readers have seen them. Reading changes since earlier numbers fails.
+    """
+    if seq <= forgotten_seq(s):
+        return
+    journal = JournalEntry.__table__
+    with transaction(s) as conn:
+        conn.execute(delete(journal).where(journal.c.seq <= seq))
+        conn.execute(journal.insert().values(seq=seq, path="", kind=CHANGE_FORGOTTEN))
@@ -0,0 +1,100 @@
+# Facts about storage format needed by code that does not load SQLAlchemy.
+import os
+from typing import Optional, Tuple
+
+SCHEMA_VERSION = 9
+"""
+Version of the storage format, kept in SQLite's user_version.
+1 - files table keyed by full path, DateTime text timestamps.
+2 - dirs table, files keyed by parent directory id and name,
+    integer timestamps, packed flags.
+3 - dirs hold size and count of their direct non-directory children.
+4 - journal of changes to files.
+5 - hashes of contents of files.
+6 - indexes of files by modification time and by size.
+7 - journal refers to updated files by id instead of path.
+8 - start times of scans.
+9 - ids of removed files are not reused.
+"""
+
+MIN_FRAGMENT_LENGTH = 3
+"""
+Shortest name fragment the trigram index can look up.
+"""
+
+FLAG_DIR = 1
+FLAG_EXECUTABLE = 2
+FLAG_SUID = 4
+
+CHANGE_UPDATED = 0
+"""
+Journal entry kind: path was indexed, or its attributes changed.
+"""
+CHANGE_REMOVED = 1
+"""
+Journal entry kind: path and everything below it were removed.
+"""
+CHANGE_MOVED = 2
+"""
+Journal entry kind: path and everything below it were moved to path.
+"""
+CHANGE_FORGOTTEN = 3
+"""
+Journal entry kind: entries up to this one were removed by compaction.
+"""
+
+
+def dir_key(path: str) -> str:
+    """
+    Formats a directory path the way it is stored in the database.
+    Path must be normalized (see os.path.abspath).
+
+    >>> dir_key("/home/a")
+    '/home/a/'
+    >>> dir_key("/")
+    '/'
+    """
+    return os.path.join(path, "")
+
+
+def subtree_range(root: str) -> Tuple[str, str]:
+    """
+    Gets bounds of paths strictly below root: lower <= path < upper.
+    Root must be normalized (see os.path.abspath).
+
+    >>> subtree_range("/home/a")
+    ('/home/a/', '/home/a0')
+    >>> subtree_range("/")
+    ('/', '0')
+    """
+    lower = dir_key(root)
+    # "0" is the character right after "/".
+    return lower, lower[:-1] + "0"
+
+
+SORTED_SCAN_COST = 0.1
+"""
+Cost of reading an entry of an index, relative to sorting a file.
+"""
+
+
+def prefer_sorted_scan(matched: int, total: int, limit: Optional[int]) -> bool:
+    """
+    Decides whether to read all files in order of an index of the sort
+    column, skipping the unmatched ones until enough matches are found,
+    rather than to sort the matches. Assumes that matches are spread
+    evenly over the index.
+
+    >>> prefer_sorted_scan(1_000_000, 1_000_000, None)
+    True
+    >>> prefer_sorted_scan(10_000, 1_000_000, None)
+    False
+    >>> prefer_sorted_scan(10_000, 1_000_000, 20)
+    True
+    >>> prefer_sorted_scan(100, 1_000_000, 20)
+    False
+    """
+    if matched == 0:
+        return False
+    wanted = matched if limit is None else min(limit, matched)
+    return total * wanted / matched * SORTED_SCAN_COST <= matched
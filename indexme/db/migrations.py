@@ -0,0 +1,397 @@
+import os
+from datetime import datetime, timezone
+from typing import Any, Dict, List
+
+from sqlalchemy.engine import Connection, Engine
+
+from indexme.db.layout import SCHEMA_VERSION
+from indexme.db.name_index import create_name_index, has_name_index
+
+# Migrations describe schema as it was at given version,
+# so they do not use the models.
+_V2_FLAG_DIR = 1
+_V2_FLAG_EXECUTABLE = 2
+_V2_FLAG_SUID = 4
+
+# Adds size and count of a non-directory file to its parent.
+_V3_ADD = """
+    UPDATE dirs SET
+        files_size = files_size + {row}.size,
+        files_count = files_count + 1
+    WHERE id = {row}.parent_id AND {row}.flags & 1 = 0;
+"""
+_V3_SUBTRACT = """
+    UPDATE dirs SET
+        files_size = files_size - {row}.size,
+        files_count = files_count - 1
+    WHERE id = {row}.parent_id AND {row}.flags & 1 = 0;
+"""
+_V3_TRIGGERS = [
+    f"""
+    CREATE TRIGGER dirs_totals_insert AFTER INSERT ON files BEGIN
+        {_V3_ADD.format(row="new")}
+    END
+    """,
+    f"""
+    CREATE TRIGGER dirs_totals_delete AFTER DELETE ON files BEGIN
+        {_V3_SUBTRACT.format(row="old")}
+    END
+    """,
+    f"""
+    CREATE TRIGGER dirs_totals_update
+    AFTER UPDATE OF parent_id, flags, size ON files BEGIN
+        {_V3_SUBTRACT.format(row="old")}
+        {_V3_ADD.format(row="new")}
+    END
+    """,
+]
+
+# Kinds of journal entries, as in layout (CHANGE_*).
+_V4_UPDATED = 0
+_V4_REMOVED = 1
+_V4_MOVED = 2
+
+# Records a change of a files row, under its full path.
+_V4_RECORD = """
+    INSERT INTO journal (path, kind) VALUES (
+        (SELECT path FROM dirs WHERE id = {row}.parent_id) || {row}.name, {kind}
+    );
+"""
+_V4_TRIGGERS = [
+    f"""
+    CREATE TRIGGER journal_insert AFTER INSERT ON files BEGIN
+        {_V4_RECORD.format(row="new", kind=_V4_UPDATED)}
+    END
+    """,
+    f"""
+    CREATE TRIGGER journal_delete AFTER DELETE ON files BEGIN
+        {_V4_RECORD.format(row="old", kind=_V4_REMOVED)}
+    END
+    """,
+    f"""
+    CREATE TRIGGER journal_update AFTER UPDATE ON files
+    WHEN old.parent_id = new.parent_id AND old.name = new.name BEGIN
+        {_V4_RECORD.format(row="new", kind=_V4_UPDATED)}
+    END
+    """,
+    f"""
+    CREATE TRIGGER journal_move AFTER UPDATE ON files
+    WHEN old.parent_id != new.parent_id OR old.name != new.name BEGIN
+        {_V4_RECORD.format(row="old", kind=_V4_REMOVED)}
+        {_V4_RECORD.format(row="new", kind=_V4_MOVED)}
+    END
+    """,
+]
+
+_V5_TRIGGERS = [
+    """
+    CREATE TRIGGER hashes_delete AFTER DELETE ON files BEGIN
+        DELETE FROM hashes WHERE file_id = old.id;
+    END
+    """,
+]
+
+_V6_INDEXES = [
+    """
+    CREATE INDEX IF NOT EXISTS ix_files_modified_at
+    ON files (modified_at, id, parent_id, flags)
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS ix_files_size
+    ON files (size, id, parent_id, flags)
+    """,
+]
+
+
+# Records a change of a files row by its id.
+_V7_RECORD = """
+    INSERT INTO journal (file_id, kind) VALUES ({row}.id, {kind});
+"""
+_V7_TRIGGERS = [
+    f"""
+    CREATE TRIGGER journal_insert AFTER INSERT ON files BEGIN
+        {_V7_RECORD.format(row="new", kind=_V4_UPDATED)}
+    END
+    """,
+    f"""
+    CREATE TRIGGER journal_delete AFTER DELETE ON files BEGIN
+        {_V4_RECORD.format(row="old", kind=_V4_REMOVED)}
+    END
+    """,
+    f"""
+    CREATE TRIGGER journal_update AFTER UPDATE ON files
+    WHEN old.parent_id = new.parent_id AND old.name = new.name BEGIN
+        {_V7_RECORD.format(row="new", kind=_V4_UPDATED)}
+    END
+    """,
+    f"""
+    CREATE TRIGGER journal_move AFTER UPDATE ON files
+    WHEN old.parent_id != new.parent_id OR old.name != new.name BEGIN
+        {_V4_RECORD.format(row="old", kind=_V4_REMOVED)}
+        {_V4_RECORD.format(row="new", kind=_V4_MOVED)}
+    END
+    """,
+]
+
+
+def get_schema_version(conn: Connection) -> int:
+    """
+    Reads schema version. Databases created before versioning report 1.
+    """
+    version = int(conn.exec_driver_sql("PRAGMA user_version").scalar())
+    if version == 0 and _has_v1_files(conn):
+        return 1
+    return version
+
+
+def _has_v1_files(conn: Connection) -> bool:
+    columns = conn.exec_driver_sql("PRAGMA table_info(files)").fetchall()
+    return "path" in [column[1] for column in columns]
+
+
+def migrate(engine: Engine, metadata: Any) -> None:
+    """
+    Creates missing tables and brings schema up to date.
+    Does nothing if the schema is already current.
+    """
+    with engine.connect() as conn:
+        if get_schema_version(conn) == SCHEMA_VERSION:
+            return
+        # Lets readers and a writer work at the same time.
+        conn.exec_driver_sql("PRAGMA journal_mode = WAL")
+    name_index = has_name_index(engine)
+    tx_engine = engine.execution_options(isolation_level="SERIALIZABLE")  # type: ignore
+    with tx_engine.begin() as conn:
+        # pysqlite only opens transactions before INSERTs, UPDATEs and DELETEs.
+        conn.exec_driver_sql("BEGIN")
+        version = get_schema_version(conn)
+        if version == 1:
+            _rename_v1(conn)
+        metadata.create_all(conn)
+        if version == 1:
+            _copy_v1(conn)
+        if version == 2:
+            _add_v3_columns(conn)
+        if version < 3:
+            _add_v3_triggers(conn)
+        if version < 4:
+            _add_v4_triggers(conn)
+        if version < 5:
+            _add_v5_triggers(conn)
+        if version < 6:
+            _add_v6_indexes(conn)
+        if version < 7:
+            _add_v7_journal_ids(conn)
+        if version < 9:
+            _add_v9_autoincrement(conn)
+        conn.exec_driver_sql(f"PRAGMA user_version = {SCHEMA_VERSION}")
+    # Trigram index was dropped with the old table.
+    if version == 1 and name_index:
+        create_name_index(engine)
+
+
+def _rename_v1(conn: Connection) -> None:
+    conn.exec_driver_sql("DROP TABLE IF EXISTS file_names")
+    for trigger in ["file_names_insert", "file_names_delete", "file_names_update"]:
+        conn.exec_driver_sql(f"DROP TRIGGER IF EXISTS {trigger}")
+    conn.exec_driver_sql("DROP INDEX IF EXISTS ix_files_name")
+    conn.exec_driver_sql("ALTER TABLE files RENAME TO files_v1")
+
+
+def _v1_timestamp(value: str) -> int:
+    """
+    Converts SQLAlchemy's DateTime text (UTC, without timezone) to UNIX time.
+
+    >>> _v1_timestamp("1970-01-02 00:00:00.000000")
+    86400
+    """
+    return int(datetime.fromisoformat(value).replace(tzinfo=timezone.utc).timestamp())
+
+
+def _copy_v1(conn: Connection) -> None:
+    dir_ids: Dict[str, int] = {}
+    rows: List[Dict[str, Any]] = []
+
+    def dir_id(path: str) -> int:
+        if path not in dir_ids:
+            res = conn.exec_driver_sql("INSERT INTO dirs (path) VALUES (?)", (path,))
+            dir_ids[path] = res.lastrowid
+        return dir_ids[path]
+
+    def flush() -> None:
+        conn.exec_driver_sql(
+            "INSERT INTO files (parent_id, name, flags, size, created_at, modified_at)"
+            " VALUES (:parent_id, :name, :flags, :size, :created_at, :modified_at)",
+            rows,
+        )
+        rows.clear()
+
+    v1_files = conn.exec_driver_sql(
+        "SELECT path, is_dir, is_executable, is_suid, size, created_at, modified_at"
+        " FROM files_v1"
+    )
+    for path, is_dir, is_exec, is_suid, size, ctime, mtime in v1_files:
+        parent, name = os.path.split(path)
+        flags = 0
+        flags |= _V2_FLAG_DIR if is_dir else 0
+        flags |= _V2_FLAG_EXECUTABLE if is_exec else 0
+        flags |= _V2_FLAG_SUID if is_suid else 0
+        rows.append(
+            {
+                "parent_id": dir_id(os.path.join(parent, "")),
+                "name": name,
+                "flags": flags,
+                "size": size,
+                "created_at": _v1_timestamp(ctime),
+                "modified_at": _v1_timestamp(mtime),
+            }
+        )
+        if len(rows) >= 10000:
+            flush()
+    if len(rows) > 0:
+        flush()
+    conn.exec_driver_sql("DROP TABLE files_v1")
+
+
+def _add_v3_columns(conn: Connection) -> None:
+    for column in ["files_size", "files_count"]:
+        conn.exec_driver_sql(
+            f"ALTER TABLE dirs ADD COLUMN {column} INTEGER NOT NULL DEFAULT 0"
+        )
+
+
+def _add_v3_triggers(conn: Connection) -> None:
+    conn.exec_driver_sql("""
+        UPDATE dirs SET (files_size, files_count) = (
+            SELECT coalesce(sum(size), 0), count(*) FROM files
+            WHERE parent_id = dirs.id AND flags & 1 = 0
+        )
+        """)
+    for trigger in _V3_TRIGGERS:
+        conn.exec_driver_sql(trigger)
+
+
+def _add_v4_triggers(conn: Connection) -> None:
+    # Files indexed so far are listed as changes since the beginning.
+    conn.exec_driver_sql(f"""
+        INSERT INTO journal (path, kind)
+        SELECT d.path || f.name, {_V4_UPDATED} FROM files f
+        JOIN dirs d ON d.id = f.parent_id
+        """)
+    for trigger in _V4_TRIGGERS:
+        conn.exec_driver_sql(trigger)
+
+
+def _add_v5_triggers(conn: Connection) -> None:
+    for trigger in _V5_TRIGGERS:
+        conn.exec_driver_sql(trigger)
+
+
+def _add_v6_indexes(conn: Connection) -> None:
+    # New databases got them from the models already.
+    for index in _V6_INDEXES:
+        conn.exec_driver_sql(index)
+
+
+def _has_v7_journal(conn: Connection) -> bool:
+    columns = conn.exec_driver_sql("PRAGMA table_info(journal)").fetchall()
+    return "file_id" in [column[1] for column in columns]
+
+
+def _add_v7_journal_ids(conn: Connection) -> None:
+    for trigger in [
+        "journal_insert",
+        "journal_delete",
+        "journal_update",
+        "journal_move",
+    ]:
+        conn.exec_driver_sql(f"DROP TRIGGER {trigger}")
+    # Journals created before were not touched by the models.
+    if not _has_v7_journal(conn):
+        conn.exec_driver_sql("ALTER TABLE journal RENAME TO journal_v6")
+        conn.exec_driver_sql("""
+            CREATE TABLE journal (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                file_id INTEGER,
+                path VARCHAR,
+                kind INTEGER NOT NULL
+            )
+            """)
+        conn.exec_driver_sql("""
+            INSERT INTO journal (seq, path, kind)
+            SELECT seq, path, kind FROM journal_v6
+            """)
+        # Sequence numbers of removed entries must not be reused either.
+        conn.exec_driver_sql("DELETE FROM sqlite_sequence WHERE name = 'journal'")
+        conn.exec_driver_sql("""
+            INSERT INTO sqlite_sequence (name, seq)
+            SELECT 'journal', seq FROM sqlite_sequence WHERE name = 'journal_v6'
+            """)
+        conn.exec_driver_sql("DROP TABLE journal_v6")
+
+    conn.exec_driver_sql("""
+        CREATE TEMP TABLE v7_files (path VARCHAR PRIMARY KEY, id INTEGER)
+        """)
+    conn.exec_driver_sql("""
+        INSERT INTO v7_files
+        SELECT d.path || f.name, f.id FROM files f JOIN dirs d ON d.id = f.parent_id
+        """)
+    conn.exec_driver_sql(f"""
+        UPDATE journal SET
+            file_id = (SELECT id FROM v7_files WHERE path = journal.path),
+            path = NULL
+        WHERE kind = {_V4_UPDATED}
+        """)
+    # Updates of paths gone since are superseded by their removals.
+    conn.exec_driver_sql(f"""
+        DELETE FROM journal WHERE kind = {_V4_UPDATED} AND file_id IS NULL
+        """)
+    conn.exec_driver_sql("DROP TABLE v7_files")
+    for trigger in _V7_TRIGGERS:
+        conn.exec_driver_sql(trigger)
+
+
+def _has_v9_autoincrement(conn: Connection) -> bool:
+    sql = conn.exec_driver_sql(
+        "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'files'"
+    ).scalar()
+    return "AUTOINCREMENT" in sql
+
+
+def _add_v9_autoincrement(conn: Connection) -> None:
+    # Tables created before were not touched by the models.
+    if _has_v9_autoincrement(conn):
+        return
+    # Dropping the table drops its indexes and triggers, so they are
+    # created again as they are, including ones of the trigram index.
+    schema = conn.exec_driver_sql("""
+        SELECT sql FROM sqlite_master
+        WHERE tbl_name = 'files' AND type IN ('index', 'trigger')
+        AND sql IS NOT NULL
+        """).fetchall()
+    conn.exec_driver_sql("""
+        CREATE TABLE files_v9 (
+            id INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT,
+            parent_id INTEGER NOT NULL,
+            name VARCHAR NOT NULL,
+            flags INTEGER NOT NULL,
+            size INTEGER NOT NULL,
+            created_at INTEGER NOT NULL,
+            modified_at INTEGER NOT NULL,
+            UNIQUE (parent_id, name),
+            FOREIGN KEY(parent_id) REFERENCES dirs (id)
+        )
+        """)
+    conn.exec_driver_sql("INSERT INTO files_v9 SELECT * FROM files")
+    # Ids of files removed before might be in the journal still.
+    conn.exec_driver_sql("DELETE FROM sqlite_sequence WHERE name = 'files_v9'")
+    conn.exec_driver_sql("""
+        INSERT INTO sqlite_sequence (name, seq) SELECT 'files_v9', max(
+            (SELECT coalesce(max(id), 0) FROM files),
+            (SELECT coalesce(max(file_id), 0) FROM journal)
+        )
+        """)
+    conn.exec_driver_sql("DROP TABLE files")
+    conn.exec_driver_sql("ALTER TABLE files_v9 RENAME TO files")
+    for (sql,) in schema:
+        conn.exec_driver_sql(sql)
@@ -0,0 +1,75 @@
+from sqlalchemy import column, table
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import OperationalError
+
+NameIndex = table("file_names", column("rowid"), column("name"))
+"""
+FTS5 trigram index over files.name.
+Serves substring searches (LIKE '%text%') of at least 3 characters.
+"""
+
+_DDL = [
+    """
+    CREATE VIRTUAL TABLE file_names USING fts5(
+        name, content='files', content_rowid='id', tokenize='trigram'
+    )
+    """,
+    """
+    CREATE TRIGGER file_names_insert AFTER INSERT ON files BEGIN
+        INSERT INTO file_names(rowid, name) VALUES (new.id, new.name);
+    END
+    """,
+    """
+    CREATE TRIGGER file_names_delete AFTER DELETE ON files BEGIN
+        INSERT INTO file_names(file_names, rowid, name)
+        VALUES ('delete', old.id, old.name);
+    END
+    """,
+    """
+    CREATE TRIGGER file_names_update AFTER UPDATE OF name ON files BEGIN
+        INSERT INTO file_names(file_names, rowid, name)
+        VALUES ('delete', old.id, old.name);
+        INSERT INTO file_names(rowid, name) VALUES (new.id, new.name);
+    END
+    """,
+    "INSERT INTO file_names(file_names) VALUES ('rebuild')",
+]
+
+
+def has_name_index(engine: Engine) -> bool:
+    """
+    Checks whether the trigram index was created.
+    """
+    with engine.connect() as conn:
+        exists = conn.exec_driver_sql(
+            "SELECT 1 FROM sqlite_master WHERE name = 'file_names'"
+        ).first()
+        return exists is not None
+
+
+def create_name_index(engine: Engine) -> bool:
+    """
+    Creates the trigram index and triggers keeping it in sync, if missing.
+    It makes indexing several times slower, so it is opt-in.
+    Returns False if SQLite was built without FTS5 or trigram tokenizer.
+    """
+    if has_name_index(engine):
+        return True
+    engine = engine.execution_options(isolation_level="SERIALIZABLE")  # type: ignore
+    try:
+        with engine.begin() as conn:
+            for ddl in _DDL:
+                conn.exec_driver_sql(ddl)
+    except OperationalError:
+        return False
+    return True
+
+
+def drop_name_index(engine: Engine) -> None:
+    """
+    Drops the trigram index and its triggers, if present.
+    """
+    with engine.begin() as conn:
+        for trigger in ["file_names_insert", "file_names_delete", "file_names_update"]:
+            conn.exec_driver_sql(f"DROP TRIGGER IF EXISTS {trigger}")
+        conn.exec_driver_sql("DROP TABLE IF EXISTS file_names")
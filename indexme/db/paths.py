@@ -1,6 +1,6 @@
 from typing import Callable
 
-from xdg import xdg_config_home, xdg_data_home
+from xdg import xdg_config_home, xdg_data_home, xdg_runtime_dir
 
 
 def default_ignore_path() -> str:
@@ -19,8 +19,20 @@ def default_db_str() -> str:
     return f"sqlite:///{xdg_data_home()}/indexme.sqlite3"
 
 
+def default_socket_path() -> str:
+    """
+    Default daemon socket path factory.
+    Usually /run/user/1000/indexme.sock.
+    """
+    runtime_dir = xdg_runtime_dir()
+    if runtime_dir is None:
+        return f"{xdg_data_home()}/indexme.sock"
+    return f"{runtime_dir}/indexme.sock"
+
+
 _IGNORE_PATH_FACTORY: Callable[[], str] = default_ignore_path
 _DB_STRING_FACTORY: Callable[[], str] = default_db_str
+_SOCKET_PATH_FACTORY: Callable[[], str] = default_socket_path
 
 
 def get_ignore_path() -> str:
@@ -51,3 +63,18 @@ def set_db_string_factory(factory: Callable[[], str]) -> None:
     """
     global _DB_STRING_FACTORY
     _DB_STRING_FACTORY = factory
+
+
+def get_socket_path() -> str:
+    """
+    Gets a current daemon socket path.
+    """
+    return _SOCKET_PATH_FACTORY()
+
+
+def set_socket_path_factory(factory: Callable[[], str]) -> None:
+    """
+    Sets a new daemon socket path factory.
+    """
+    global _SOCKET_PATH_FACTORY
+    _SOCKET_PATH_FACTORY = factory
@@ -0,0 +1,201 @@
+import os
+import sqlite3
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import quote
+
+from indexme.db.layout import (
+    FLAG_DIR,
+    FLAG_EXECUTABLE,
+    FLAG_SUID,
+    MIN_FRAGMENT_LENGTH,
+    SCHEMA_VERSION,
+    dir_key,
+    prefer_sorted_scan,
+    subtree_range,
+)
+from indexme.db.paths import get_db_string
+
+_SORT_COLUMNS = {
+    "name": "f.name",
+    "path": "d.path || f.name",
+    "date": "f.modified_at",
+    "newest": "f.modified_at",
+    "size": "f.size",
+    "bytes": "f.size",
+}
+
+# Sort columns followed by indexes.
+_INDEXED_SORTS = ["date", "newest", "size", "bytes"]
+
+_FLAGS = {"executable": FLAG_EXECUTABLE, "suid": FLAG_SUID, "directories": FLAG_DIR}
+
+_TIMESTAMPS = {
+    "created_after": "f.created_at >= ?",
+    "created_before": "f.created_at <= ?",
+    "modified_after": "f.modified_at >= ?",
+    "modified_before": "f.modified_at <= ?",
+}
+
+
+def check_options(options: Dict[str, Any]) -> bool:
+    """
+    Validates searchme options.
+    Returns whether any filter is applied.
+    """
+    if options["sort_by"] not in _SORT_COLUMNS:
+        raise Exception(f"Unknown sort direction {options['sort_by']}")
+    modes = ["count_only", "xargs", "total_size", "du", "duplicates"]
+    if [options[mode] for mode in modes].count(True) > 1:
+        raise Exception("Conflicting options")
+
+    keys = ["extension", *_FLAGS, *_TIMESTAMPS]
+    filtered = options["name"] not in [None, ""]
+    filtered = filtered or any(options[key] is not None for key in keys)
+    if options["du"] and filtered:
+        raise Exception("Directory sizes cannot be filtered")
+    if options["changed_since"] is not None:
+        summaries = ["count_only", "total_size", "du"]
+        if filtered or any(options[mode] for mode in summaries):
+            raise Exception("Changes cannot be filtered nor summarized")
+    if options["limit"] is not None:
+        if options["limit"] < 0:
+            raise Exception("Limit cannot be negative")
+        summaries = ["count_only", "total_size", "du", "duplicates"]
+        if options["changed_since"] is not None or any(
+            options[mode] for mode in summaries
+        ):
+            raise Exception("Only listed files can be limited")
+    return filtered
+
+
+def open_read_only() -> Optional[sqlite3.Connection]:
+    """
+    Opens current SQLite database read-only.
+    Returns None if it is not an up to date SQLite database.
+    """
+    db_string = get_db_string()
+    if not db_string.startswith("sqlite:///"):
+        return None
+    path = db_string[len("sqlite:///") :]
+    try:
+        conn = sqlite3.connect(f"file:{quote(path)}?mode=ro", uri=True)
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+    except sqlite3.Error:
+        return None
+    if version != SCHEMA_VERSION:
+        conn.close()
+        return None
+    return conn
+
+
+def _has_name_index(conn: sqlite3.Connection) -> bool:
+    query = "SELECT 1 FROM sqlite_master WHERE name = 'file_names'"
+    return conn.execute(query).fetchone() is not None
+
+
+def _sorted_scan(conn: sqlite3.Connection, options: Dict[str, Any], root: str) -> bool:
+    """
+    Decides whether to list files in order of an index of the sort column,
+    like sorted_scan_pays_off does. Names narrow down matches by unknown
+    amounts, so searches by name are always sorted.
+    """
+    if options["sort_by"] not in _INDEXED_SORTS or options["count_only"]:
+        return False
+    if options["name"] not in [None, ""] or options["extension"] is not None:
+        return False
+    lower, upper = subtree_range(root)
+    query = (
+        "SELECT coalesce(sum(files_count), 0) FROM dirs WHERE path >= ? AND path < ?"
+    )
+    matched = conn.execute(query, [lower, upper]).fetchone()[0]
+    total = conn.execute("SELECT coalesce(max(id), 0) FROM files").fetchone()[0]
+    return prefer_sorted_scan(matched, total, options["limit"])
+
+
+def _where(
+    conn: sqlite3.Connection, options: Dict[str, Any], root: str, indexed: bool
+) -> Tuple[str, List[Any]]:
+    """
+    Builds WHERE clause matching files like GetAllFiles does.
+    Unless indexed, files are not looked up by their parent directories
+    (see in_subtree).
+    """
+    lower, upper = subtree_range(root)
+    parent, name = os.path.split(root)
+    parent_id = "f.parent_id" if indexed else "f.parent_id + 0"
+    clauses = [
+        f"({parent_id} IN (SELECT id FROM dirs WHERE path >= ? AND path < ?)"
+        f" OR ({parent_id} = (SELECT id FROM dirs WHERE path = ?) AND f.name = ?))"
+    ]
+    params: List[Any] = [lower, upper, dir_key(parent), name]
+
+    fragments = []
+    if options["name"] is not None:
+        fragments.append(("%" + options["name"] + "%", options["name"]))
+    if options["extension"] is not None:
+        extension = "." + options["extension"]
+        fragments.append(("%" + extension, extension))
+    long_fragments = [x for x in fragments if len(x[1]) >= MIN_FRAGMENT_LENGTH]
+    if len(long_fragments) > 0 and _has_name_index(conn):
+        clauses.append("f.id IN (SELECT rowid FROM file_names WHERE name LIKE ?)")
+        params.append(long_fragments[0][0])
+    for pattern, _fragment in fragments:
+        clauses.append("f.name LIKE ?")
+        params.append(pattern)
+
+    for key, flag in _FLAGS.items():
+        if options[key] is not None:
+            clauses.append(f"(f.flags & {flag} != 0) = ?")
+            params.append(int(options[key]))
+    for key, clause in _TIMESTAMPS.items():
+        if options[key] is not None:
+            clauses.append(clause)
+            params.append(options[key])
+    return " AND ".join(clauses), params
+
+
+def quick_search(
+    conn: sqlite3.Connection, options: Dict[str, Any], cwd: str
+) -> Optional[Iterator[str]]:
+    """
+    Runs a search and yields its output, like run_search, using sqlite3 directly.
+    Loading SQLAlchemy takes longer than most searches, so queries
+    equivalent to those built by GetAllFiles are written by hand here.
+    Returns None for searches it does not handle (directory sizes, changes,
+    duplicates).
+    """
+    check_options(options)
+    if options["du"] or options["total_size"] or options["duplicates"]:
+        return None
+    if options["changed_since"] is not None:
+        return None
+    root = os.path.abspath(os.path.join(cwd, options["root"]))
+    indexed = not _sorted_scan(conn, options, root)
+    where, params = _where(conn, options, root, indexed)
+    return _output(conn, options, cwd, where, params)
+
+
+def _output(
+    conn: sqlite3.Connection,
+    options: Dict[str, Any],
+    cwd: str,
+    where: str,
+    params: List[Any],
+) -> Iterator[str]:
+    if options["count_only"]:
+        query = f"SELECT count(*) FROM files f WHERE {where}"
+        yield f"{conn.execute(query, params).fetchone()[0]}\n"
+        return
+
+    order = _SORT_COLUMNS[options["sort_by"]]
+    desc = " DESC" if options["reverse"] else ""
+    query = (
+        "SELECT d.path || f.name FROM files f JOIN dirs d ON d.id = f.parent_id"
+        f" WHERE {where} ORDER BY {order}{desc}, f.id{desc}"
+    )
+    if options["limit"] is not None:
+        query += " LIMIT ?"
+        params = [*params, options["limit"]]
+    end = "\0" if options["xargs"] else "\n"
+    for (path,) in conn.execute(query, params):
+        yield os.path.relpath(path, cwd) + end
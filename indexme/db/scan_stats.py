@@ -0,0 +1,179 @@
+import os
+import threading
+import time
+from types import TracebackType
+from typing import Dict, Optional, TextIO, Type
+
+PHASES = ["list", "stat", "write", "commit", "hash"]
+"""
+Phases of a scan: listing directories, stat-ing entries, sending rows
+to the database (including lookups of parent directories), committing
+and hashing contents of files.
+"""
+
+COUNTERS = {
+    "dirs_listed": "Directories listed.",
+    "entries_stated": "Files and directories stat-ed.",
+    "rows_queued": "Files and directories sent to the database.",
+    "rows_written": "Rows inserted, or updated as they changed.",
+    "rows_removed": "Rows removed.",
+    "errors": "Directories not listed, entries not stat-ed or changes not saved.",
+    "batches": "Batches of watched changes applied.",
+    "files_hashed": "Files whose contents were hashed.",
+    "bytes_hashed": "Bytes of contents hashed.",
+}
+
+
+class ScanStats:
+    """
+    Counts work done by a scan and measures time spent in each phase.
+    Can be updated from many threads, so listing and stat-ing time is
+    summed over all threads and can exceed the elapsed time.
+    """
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.started = time.monotonic()
+        self.seconds = {phase: 0.0 for phase in PHASES}
+        self.counts = {name: 0 for name in COUNTERS}
+        self.gauges: Dict[str, float] = dict()
+
+    def add(
+        self, phase: Optional[str] = None, seconds: float = 0, **counts: int
+    ) -> None:
+        """
+        Records time spent in a phase, and increments counters.
+        """
+        with self.lock:
+            if phase is not None:
+                self.seconds[phase] += seconds
+            for name, count in counts.items():
+                self.counts[name] += count
+
+    def set(self, name: str, value: float) -> None:
+        """
+        Sets a gauge exported with metrics.
+        """
+        with self.lock:
+            self.gauges[name] = value
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+    def rate(self) -> float:
+        """
+        Gets entries stat-ed per second.
+        """
+        return self.counts["entries_stated"] / max(self.elapsed(), 1e-9)
+
+    def mark_scanned(self) -> None:
+        """
+        Sets gauges of time taken by scanning so far, and its rate.
+        """
+        self.set("scan_seconds", self.elapsed())
+        self.set("scan_entries_per_second", self.rate())
+
+    def progress(self) -> str:
+        """
+        Describes progress in a single line.
+
+        >>> stats = ScanStats()
+        >>> stats.add(dirs_listed=2, entries_stated=30, rows_written=10)
+        >>> stats.started -= 10
+        >>> print(stats.progress())
+        10s: 2 dirs, 30 entries (3/s), 10 rows written, 0 errors
+        """
+        with self.lock:
+            return (
+                f"{self.elapsed():.0f}s: {self.counts['dirs_listed']} dirs, "
+                f"{self.counts['entries_stated']} entries ({self.rate():.0f}/s), "
+                f"{self.counts['rows_written']} rows written, "
+                f"{self.counts['errors']} errors"
+            )
+
+    def summary(self) -> str:
+        """
+        Describes time spent in each phase and all counters.
+        """
+        with self.lock:
+            lines = [f"elapsed: {self.elapsed():.3f}s"]
+            lines.extend(
+                f"{phase}: {seconds:.3f}s" for phase, seconds in self.seconds.items()
+            )
+            lines.extend(f"{name}: {count}" for name, count in self.counts.items())
+            lines.append(f"entries per second: {self.rate():.0f}")
+            return "\n".join(lines)
+
+    def write_metrics(self, path: str) -> None:
+        """
+        Writes metrics in Prometheus textfile format.
+        The file is replaced atomically, so collectors never read it partially.
+        """
+        with self.lock:
+            lines = [
+                "# HELP indexme_phase_seconds_total Time spent in each phase.",
+                "# TYPE indexme_phase_seconds_total counter",
+            ]
+            for phase, seconds in self.seconds.items():
+                lines.append(
+                    f'indexme_phase_seconds_total{{phase="{phase}"}} {seconds}'
+                )
+            for name, help in COUNTERS.items():
+                lines.append(f"# HELP indexme_{name}_total {help}")
+                lines.append(f"# TYPE indexme_{name}_total counter")
+                lines.append(f"indexme_{name}_total {self.counts[name]}")
+            for name, value in self.gauges.items():
+                lines.append(f"# TYPE indexme_{name} gauge")
+                lines.append(f"indexme_{name} {value}")
+
+        temporary = f"{path}.{os.getpid()}.tmp"
+        with open(temporary, "w") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(temporary, path)
+
+
+class ProgressReporter:
+    """
+    Periodically prints progress lines and writes metrics on a background
+    thread, until stopped.
+    """
+
+    def __init__(
+        self,
+        stats: ScanStats,
+        interval: float,
+        out: Optional[TextIO] = None,
+        metrics: Optional[str] = None,
+    ) -> None:
+        self.stats = stats
+        self.interval = interval
+        self.out = out
+        self.metrics = metrics
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def _report(self) -> None:
+        if self.out is not None:
+            print(self.stats.progress(), file=self.out, flush=True)
+        if self.metrics is not None:
+            self.stats.mark_scanned()
+            self.stats.write_metrics(self.metrics)
+
+    def _run(self) -> None:
+        while not self.stopped.wait(self.interval):
+            self._report()
+
+    def __enter__(self) -> "ProgressReporter":
+        if self.interval > 0:
+            self.thread.start()
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc: Optional[BaseException],
+        traceback: Optional[TracebackType],
+    ) -> None:
+        self.stopped.set()
+        if self.thread.is_alive():
+            self.thread.join()
@@ -0,0 +1,45 @@
+import os
+from datetime import datetime
+from typing import List, Optional, cast
+
+from sqlalchemy import func
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm.session import Session
+
+from indexme.db.file_model import Scan
+
+
+def _ancestors(path: str) -> List[str]:
+    """
+    Lists a path and all directories above it.
+
+    >>> _ancestors("/home/a")
+    ['/home/a', '/home', '/']
+    """
+    paths = [path]
+    while os.path.dirname(path) != path:
+        path = os.path.dirname(path)
+        paths.append(path)
+    return paths
+
+
+def last_scan_start(s: Session, root: str) -> Optional[datetime]:
+    """
+    Gets the start time of the last scan covering a whole directory,
+    that is of it or of a directory above it. None if it was never scanned.
+    """
+    paths = _ancestors(os.path.abspath(root))
+    query = s.query(func.max(Scan.started_at)).filter(Scan.path.in_(paths))
+    return cast(Optional[datetime], query.scalar())
+
+
+def record_scan(s: Session, root: str, started: datetime) -> None:
+    """
+    Remembers that a directory was scanned, starting at a given time.
+    """
+    stmt = insert(Scan.__table__).values(path=os.path.abspath(root), started_at=started)
+    s.execute(
+        stmt.on_conflict_do_update(
+            index_elements=["path"], set_={"started_at": stmt.excluded.started_at}
+        )
+    )
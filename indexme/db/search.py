@@ -0,0 +1,89 @@
+import os
+from typing import Any, Dict, Iterator
+
+from sqlalchemy.orm.session import Session
+
+from indexme.db.file_model import File
+from indexme.db.file_ops import (
+    FileSortDirection,
+    GetAllFiles,
+    directory_totals,
+    sorted_scan_pays_off,
+    subtree_totals,
+)
+from indexme.db.hashing import duplicates
+from indexme.db.journal import changes_since
+from indexme.db.layout import CHANGE_REMOVED
+from indexme.db.quick_search import check_options
+
+SearchOptions = Dict[str, Any]
+"""
+Search criteria and output mode, as passed to searchme.
+Plain values only, so that they can be sent to the daemon.
+"""
+
+
+def run_search(s: Session, options: SearchOptions, cwd: str) -> Iterator[str]:
+    """
+    Runs a search and yields its output.
+    Paths are printed relative to cwd.
+    """
+    filtered = check_options(options)
+    direction = FileSortDirection(options["sort_by"], options["reverse"])
+    name = options["name"]
+
+    root = os.path.join(cwd, options["root"])
+    end = "\0" if options["xargs"] else "\n"
+    if options["changed_since"] is not None:
+        for seq, kind, path in changes_since(s, options["changed_since"], root):
+            sign = "-" if kind == CHANGE_REMOVED else "+"
+            yield f"{seq}\t{sign}\t{os.path.relpath(path, cwd)}{end}"
+        return
+    if options["du"]:
+        for path, size, _count in directory_totals(s, root):
+            yield f"{size}\t{os.path.relpath(path, cwd)}\n"
+        return
+    if options["total_size"] and not filtered:
+        yield f"{subtree_totals(s, root)[0]}\n"
+        return
+
+    # Names narrow down matches by unknown amounts, so searches by name
+    # are always sorted (see sorted_scan_pays_off).
+    summaries = ["count_only", "total_size", "duplicates"]
+    sorted_scan = (
+        not any(options[mode] for mode in summaries)
+        and name in [None, ""]
+        and options["extension"] is None
+        and sorted_scan_pays_off(s, root, direction, options["limit"])
+    )
+    query = (
+        GetAllFiles(s, root, sorted_scan)
+        .with_name(name)
+        .with_extension(options["extension"])
+        .with_executable_bit(options["executable"])
+        .with_suid_bit(options["suid"])
+        .with_directories_bit(options["directories"])
+        .with_created_after(options["created_after"])
+        .with_created_before(options["created_before"])
+        .with_modified_after(options["modified_after"])
+        .with_modified_before(options["modified_before"])
+    )
+    if options["count_only"]:
+        yield f"{query.count()}\n"
+        return
+    if options["total_size"]:
+        yield f"{query.total_size()}\n"
+        return
+    if options["duplicates"]:
+        for i, paths in enumerate(duplicates(query)):
+            # Groups are separated by empty lines, like in fdupes.
+            yield "\n" if i > 0 else ""
+            for path in paths:
+                yield os.path.relpath(path, cwd) + "\n"
+        return
+
+    query = query.with_sorting(direction)
+    if options["limit"] is not None:
+        query = query.limit(options["limit"])
+    for (path,) in query.rows(File.path):
+        yield os.path.relpath(path, cwd) + end
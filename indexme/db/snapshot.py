@@ -0,0 +1,284 @@
+import heapq
+import os
+import re
+from array import array
+from bisect import bisect_left
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from indexme.db.layout import (
+    FLAG_DIR,
+    FLAG_EXECUTABLE,
+    FLAG_SUID,
+    dir_key,
+    subtree_range,
+)
+from indexme.db.quick_search import check_options
+
+try:
+    import numpy  # type: ignore
+except ImportError:  # pragma: no cover
+    numpy = None
+
+_FLAGS = {"executable": FLAG_EXECUTABLE, "suid": FLAG_SUID, "directories": FLAG_DIR}
+
+_TIMESTAMPS = {
+    "created_after": ("created", True),
+    "created_before": ("created", False),
+    "modified_after": ("modified", True),
+    "modified_before": ("modified", False),
+}
+
+_SORT_COLUMNS = {
+    "date": "modified",
+    "newest": "modified",
+    "size": "sizes",
+    "bytes": "sizes",
+}
+
+# SQLite's LIKE ignores case of ASCII letters only.
+_ASCII_LOWER = str.maketrans("ABCDEFGHIJKLMNOPQRSTUVWXYZ", "abcdefghijklmnopqrstuvwxyz")
+
+
+def fold_case(text: str) -> str:
+    """
+    Lowercases ASCII letters, like SQLite's LIKE does.
+
+    >>> fold_case("ŻÓŁW.TXT")
+    'ŻÓŁw.txt'
+    """
+    return text.translate(_ASCII_LOWER)
+
+
+def like(pattern: str) -> Callable[[str], bool]:
+    """
+    Builds a test of case-folded strings matching a pattern like SQLite's
+    LIKE does: % matches any text, and _ any single character.
+    Patterns without wildcards inside are tested without regexes.
+
+    >>> like("%my_file%")("my-file.txt"), like("%.TXT")("a.txt")
+    (True, True)
+    >>> like("100%")("x100"), like("%100%%")("x100")
+    (False, True)
+    """
+    pattern = fold_case(pattern)
+    fragment = pattern.strip("%")
+    if re.search("[%_]", fragment) is None:
+        if pattern.startswith("%") and pattern.endswith("%"):
+            return lambda text: fragment in text
+        if pattern.startswith("%"):
+            return lambda text: text.endswith(fragment)
+        if pattern.endswith("%"):
+            return lambda text: text.startswith(fragment)
+        return lambda text: text == fragment
+    regex = "".join(
+        ".*" if c == "%" else "." if c == "_" else re.escape(c) for c in pattern
+    )
+    compiled = re.compile(regex, re.DOTALL)
+    return lambda text: compiled.fullmatch(text) is not None
+
+
+class Snapshot:
+    """
+    Read-only copy of the whole index held in memory as compact columns:
+    arrays of sizes, timestamps and flags, with directory paths stored once.
+    Answers searches like run_search does, without touching the database.
+    Uses NumPy masks if NumPy is installed, and plain loops otherwise.
+
+    Files are ordered by their directory's path, so files under any root
+    form a contiguous slice of the columns.
+    """
+
+    def __init__(self, conn: Any) -> None:
+        """
+        Loads all files through a DB-API connection.
+        """
+        dirs = conn.execute("SELECT id, path FROM dirs ORDER BY path").fetchall()
+        self.dirs: List[str] = [path for _id, path in dirs]
+        rank = {id: i for i, (id, _path) in enumerate(dirs)}
+
+        self.ids = array("q")
+        self.parents = array("q")
+        self.flags = array("q")
+        self.sizes = array("q")
+        self.created = array("q")
+        self.modified = array("q")
+        self.names: List[str] = []
+        rows = conn.execute(
+            "SELECT f.id, f.parent_id, f.name, f.flags, f.size,"
+            " f.created_at, f.modified_at"
+            " FROM dirs d JOIN files f ON f.parent_id = d.id ORDER BY d.path"
+        )
+        for id, parent_id, name, flags, size, ctime, mtime in rows:
+            self.ids.append(id)
+            self.parents.append(rank[parent_id])
+            self.names.append(name)
+            self.flags.append(flags)
+            self.sizes.append(size)
+            self.created.append(ctime)
+            self.modified.append(mtime)
+        self.folded_names = [fold_case(name) for name in self.names]
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def path(self, i: int) -> str:
+        """
+        Gets a full path of i-th file.
+        """
+        return self.dirs[self.parents[i]] + self.names[i]
+
+    def _files_in(self, lower: str, upper: str) -> Tuple[int, int]:
+        """
+        Gets a slice of files whose directory path is in [lower, upper).
+        """
+        start = bisect_left(self.parents, bisect_left(self.dirs, lower))
+        stop = bisect_left(self.parents, bisect_left(self.dirs, upper))
+        return start, stop
+
+    def _root_index(self, root: str) -> Optional[int]:
+        parent, name = os.path.split(root)
+        key = dir_key(parent)
+        start, stop = self._files_in(key, key + "\0")
+        for i in range(start, stop):
+            if self.names[i] == name:
+                return i
+        return None
+
+    def find(self, options: Dict[str, Any], root: str) -> List[int]:
+        """
+        Gets indices of files under root matching given searchme options.
+        """
+        start, stop = self._files_in(*subtree_range(root))
+        if numpy is not None:
+            indices = self._find_numpy(options, start, stop)
+        else:
+            indices = self._find_loop(options, start, stop)
+        root_index = self._root_index(root)
+        if root_index is not None and self._matches(options, [root_index]):
+            indices.append(root_index)
+        return self._match_names(options, indices)
+
+    def _matches(self, options: Dict[str, Any], indices: List[int]) -> List[int]:
+        """
+        Filters given files by attributes (everything but names).
+        """
+        for key, flag in _FLAGS.items():
+            if options[key] is not None:
+                wanted = bool(options[key])
+                flags = self.flags
+                indices = [i for i in indices if bool(flags[i] & flag) == wanted]
+        for key, (column, after) in _TIMESTAMPS.items():
+            value = options[key]
+            if value is not None:
+                values = getattr(self, column)
+                if after:
+                    indices = [i for i in indices if values[i] >= value]
+                else:
+                    indices = [i for i in indices if values[i] <= value]
+        return indices
+
+    def _find_loop(self, options: Dict[str, Any], start: int, stop: int) -> List[int]:
+        return self._matches(options, list(range(start, stop)))
+
+    def _find_numpy(self, options: Dict[str, Any], start: int, stop: int) -> List[int]:
+        def column(name: str) -> Any:
+            # A view of the array, without copying it.
+            return numpy.frombuffer(getattr(self, name), dtype=numpy.int64)[start:stop]
+
+        mask = numpy.ones(stop - start, dtype=bool)
+        for key, flag in _FLAGS.items():
+            if options[key] is not None:
+                mask &= ((column("flags") & flag) != 0) == bool(options[key])
+        for key, (name, after) in _TIMESTAMPS.items():
+            value = options[key]
+            if value is not None:
+                mask &= column(name) >= value if after else column(name) <= value
+        indices: List[int] = (numpy.nonzero(mask)[0] + start).tolist()
+        return indices
+
+    def _match_names(self, options: Dict[str, Any], indices: List[int]) -> List[int]:
+        names = self.folded_names
+        if options["name"] not in [None, ""]:
+            matches = like("%" + options["name"] + "%")
+            indices = [i for i in indices if matches(names[i])]
+        if options["extension"] is not None:
+            matches = like("%." + options["extension"])
+            indices = [i for i in indices if matches(names[i])]
+        return indices
+
+    def _sort_key(self, sort_by: str) -> Callable[[int], Any]:
+        if sort_by == "name":
+            return lambda i: (self.names[i], self.ids[i])
+        if sort_by == "path":
+            return lambda i: (self.path(i), self.ids[i])
+        values = getattr(self, _SORT_COLUMNS[sort_by])
+        return lambda i: (values[i], self.ids[i])
+
+    def top(
+        self,
+        indices: Sequence[int],
+        sort_by: str,
+        limit: Optional[int] = None,
+        reverse: bool = False,
+    ) -> List[int]:
+        """
+        Sorts matches like FileSortDirection does.
+        With a limit, only the first matches are selected, without
+        sorting all of them.
+        """
+        if numpy is not None and sort_by in _SORT_COLUMNS:
+            return self._top_numpy(indices, _SORT_COLUMNS[sort_by], limit, reverse)
+        key = self._sort_key(sort_by)
+        if limit is not None:
+            select = heapq.nlargest if reverse else heapq.nsmallest
+            return select(limit, indices, key=key)
+        return sorted(indices, key=key, reverse=reverse)
+
+    def _top_numpy(
+        self, indices: Sequence[int], column: str, limit: Optional[int], reverse: bool
+    ) -> List[int]:
+        # Descending order is ascending order of negated values.
+        sign = -1 if reverse else 1
+        selected = numpy.asarray(indices, dtype=numpy.int64)
+        values = numpy.frombuffer(getattr(self, column), dtype=numpy.int64)[selected]
+        values = values * sign
+        if limit is not None and limit < len(selected):
+            # Keep everything tied with the last selected value,
+            # so that ties are broken the same way as without a limit.
+            bound = numpy.partition(values, limit - 1)[limit - 1]
+            selected, values = selected[values <= bound], values[values <= bound]
+        ids = numpy.frombuffer(self.ids, dtype=numpy.int64)[selected] * sign
+        order: List[int] = selected[numpy.lexsort((ids, values))].tolist()
+        return order[:limit]
+
+    def search(self, options: Dict[str, Any], cwd: str) -> Optional[Iterator[str]]:
+        """
+        Runs a search and yields its output, like run_search.
+        Returns None for searches it does not handle (directory sizes, changes,
+        duplicates).
+        """
+        check_options(options)
+        if options["du"] or options["duplicates"]:
+            return None
+        if options["changed_since"] is not None:
+            return None
+        root = os.path.abspath(os.path.join(cwd, options["root"]))
+        return self._output(self.find(options, root), options, cwd)
+
+    def _output(
+        self, indices: List[int], options: Dict[str, Any], cwd: str
+    ) -> Iterator[str]:
+        if options["count_only"]:
+            yield f"{len(indices)}\n"
+            return
+        if options["total_size"]:
+            flags, sizes = self.flags, self.sizes
+            total = sum(sizes[i] for i in indices if not flags[i] & FLAG_DIR)
+            yield f"{total}\n"
+            return
+        end = "\0" if options["xargs"] else "\n"
+        top = self.top(
+            indices, options["sort_by"], options["limit"], options["reverse"]
+        )
+        for i in top:
+            yield os.path.relpath(self.path(i), cwd) + end
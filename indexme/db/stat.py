@@ -3,7 +3,9 @@ from abc import ABC, abstractmethod
 from datetime import datetime, timezone
 
 # Copied from stat.py due to Pylance errors.
+S_IFMT = 0o170000  # type of file
 S_IFDIR = 0o040000  # directory
+S_IFREG = 0o100000  # regular file
 S_ISUID = 0o4000  # set UID bit
 S_IXUSR = 0o0100  # execute by owner
 
@@ -15,12 +17,23 @@ class Stat(ABC):
     """
 
     @classmethod
-    def get(cls, path: str) -> "Stat":
+    def get(cls, path: str, follow_symlinks: bool = True) -> "Stat":
         """
         Try stat-ing a given path. Never fails.
         """
         try:
-            return ValidStat(os.stat(path))
+            return ValidStat(os.stat(path, follow_symlinks=follow_symlinks))
+        except:
+            return InvalidStat()
+
+    @classmethod
+    def from_entry(cls, entry: "os.DirEntry[str]") -> "Stat":
+        """
+        Try stat-ing a directory listing entry. Never fails.
+        Symlinks are not followed.
+        """
+        try:
+            return DirEntryStat(entry)
         except:
             return InvalidStat()
 
@@ -90,19 +103,23 @@ class ValidStat(Stat):
     """
     Represents a successful stat results.
     Does not do any I/O anymore - uses memoized results instead.
+    Only regular files can be executables.
     """
 
     def __init__(self, stat: os.stat_result):
         self.stat = stat
 
     def is_dir(self) -> bool:
-        return self.stat.st_mode & S_IFDIR != 0
+        return self.stat.st_mode & S_IFMT == S_IFDIR
+
+    def is_file(self) -> bool:
+        return self.stat.st_mode & S_IFMT == S_IFREG
 
     def is_executable(self) -> bool:
-        return (not self.is_dir()) and self.stat.st_mode & S_IXUSR != 0
+        return self.is_file() and self.stat.st_mode & S_IXUSR != 0
 
     def is_suid(self) -> bool:
-        return (not self.is_dir()) and self.stat.st_mode & S_ISUID != 0
+        return self.is_file() and self.stat.st_mode & S_ISUID != 0
 
     def size(self) -> int:
         return self.stat.st_size
@@ -112,3 +129,25 @@ class ValidStat(Stat):
 
     def mtime(self) -> datetime:
         return datetime.fromtimestamp(int(self.stat.st_mtime), timezone.utc)
+
+
+class DirEntryStat(ValidStat):
+    """
+    Represents a successful stat results of a directory listing entry.
+    Symlinks are not followed - they are neither directories nor executables.
+    Costs at most one syscall, as file type comes from the listing itself.
+    """
+
+    def __init__(self, entry: "os.DirEntry[str]"):
+        super().__init__(entry.stat(follow_symlinks=False))
+        self._is_dir = entry.is_dir(follow_symlinks=False)
+        self._is_file = entry.is_file(follow_symlinks=False)
+
+    def is_dir(self) -> bool:
+        return self._is_dir
+
+    def is_executable(self) -> bool:
+        return self._is_file and self.stat.st_mode & S_IXUSR != 0
+
+    def is_suid(self) -> bool:
+        return self._is_file and self.stat.st_mode & S_ISUID != 0
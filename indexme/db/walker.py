@@ -0,0 +1,168 @@
+import os
+import queue
+import threading
+import time
+from types import TracebackType
+from typing import Iterator, List, Optional, Tuple, Type
+
+from indexme.db.ignore import Exclusions
+from indexme.db.scan_stats import ScanStats
+from indexme.db.stat import InvalidStat, Stat
+
+Record = Tuple[str, Stat]
+
+
+class Walker:
+    """
+    Recursively lists and stats a directory using a pool of threads.
+    With no workers, it is walked in the iterating thread instead,
+    which is cheaper for small trees.
+    Excluded entries are skipped, so excluded directories are never listed.
+    Symlinks are not followed.
+    Entries are stat-ed straight from directory listing.
+    Iterating yields (path, stat) records of all entries, except the root.
+    Time spent listing and stat-ing is recorded in stats.
+    Use it as a context manager, so that threads stop when iterating ends early.
+    """
+
+    def __init__(
+        self,
+        root: str,
+        exclusions: Exclusions,
+        workers: int = 4,
+        queue_size: int = 1024,
+        stats: Optional[ScanStats] = None,
+    ) -> None:
+        self.root = root
+        self.stats = stats if stats is not None else ScanStats()
+        self.exclusions = exclusions
+        self.workers = workers
+        # Directories are walked depth-first, so a single worker produces
+        # entries in the same order as os.walk.
+        self.dirs: "queue.LifoQueue[Optional[str]]" = queue.LifoQueue()
+        # Each item holds all entries of a single directory.
+        self.records: "queue.Queue[Optional[List[Record]]]" = queue.Queue(queue_size)
+        self.error: Optional[BaseException] = None
+        self.stopped = threading.Event()
+        self.threads: List[threading.Thread] = []
+
+    def __enter__(self) -> "Walker":
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc_value: Optional[BaseException],
+        traceback: Optional[TracebackType],
+    ) -> None:
+        self.close()
+
+    def __iter__(self) -> Iterator[Record]:
+        if self.workers == 0:
+            yield from self._walk()
+            return
+
+        self.dirs.put(self.root)
+        self.threads = [
+            threading.Thread(target=self._work, daemon=True)
+            for _ in range(self.workers)
+        ]
+        self.threads.append(threading.Thread(target=self._finish, daemon=True))
+        for thread in self.threads:
+            thread.start()
+
+        try:
+            while True:
+                records = self.records.get()
+                if records is None:
+                    break
+                yield from records
+        finally:
+            self.close()
+
+        if self.error is not None:
+            raise self.error
+
+    def close(self) -> None:
+        """
+        Stops the walk and waits for the threads to finish.
+        Directories still queued are not listed, and queued records are dropped.
+        """
+        self.stopped.set()
+        while any(thread.is_alive() for thread in self.threads):
+            # Workers might be blocked on putting records into a full queue.
+            try:
+                while True:
+                    self.records.get_nowait()
+            except queue.Empty:
+                pass
+            for thread in self.threads:
+                thread.join(0.01)
+
+    def _work(self) -> None:
+        while True:
+            dir_path = self.dirs.get()
+            if dir_path is None:
+                return
+            try:
+                if self.stopped.is_set():
+                    continue
+                records, walk_into = self._list(dir_path)
+                # Consumer might have stopped while listing.
+                if not self.stopped.is_set():
+                    self.records.put(records)
+                    for path in reversed(walk_into):
+                        self.dirs.put(path)
+            except BaseException as e:
+                self.error = e
+            finally:
+                self.dirs.task_done()
+
+    def _walk(self) -> Iterator[Record]:
+        stack = [self.root]
+        while len(stack) > 0 and not self.stopped.is_set():
+            records, walk_into = self._list(stack.pop())
+            yield from records
+            stack.extend(reversed(walk_into))
+
+    def _list(self, dir_path: str) -> Tuple[List[Record], List[str]]:
+        """
+        Lists and stats a directory.
+        Returns records of its entries and subdirectories to walk into.
+        """
+        listing = time.perf_counter()
+        try:
+            entries = list(os.scandir(dir_path))
+        except OSError:
+            self.stats.add(errors=1)
+            return [], []
+        stating = time.perf_counter()
+        self.stats.add("list", stating - listing, dirs_listed=1)
+
+        files: List[Record] = []
+        subdirs: List[Record] = []
+        walk_into: List[str] = []
+        errors = 0
+        for entry in self.exclusions.filter_entries(dir_path, entries):
+            stat = Stat.from_entry(entry)
+            if isinstance(stat, InvalidStat):
+                errors += 1
+            record = (entry.path, stat)
+            if stat.is_dir():
+                subdirs.append(record)
+                walk_into.append(entry.path)
+            else:
+                files.append(record)
+        self.stats.add(
+            "stat",
+            time.perf_counter() - stating,
+            entries_stated=len(files) + len(subdirs),
+            errors=errors,
+        )
+        return files + subdirs, walk_into
+
+    def _finish(self) -> None:
+        self.dirs.join()
+        for _ in range(self.workers):
+            self.dirs.put(None)
+        self.records.put(None)
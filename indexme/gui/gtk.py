@@ -4,10 +4,10 @@ import gi  # type: ignore
 
 gi.require_version("Gtk", "3.0")
 gi.require_version("Gdk", "3.0")
-from gi.repository import Gdk, Gtk  # type: ignore
+from gi.repository import Gdk, GLib, GObject, Gtk  # type: ignore
 
-Gtk, Gdk = Gtk, Gdk
-__all__ = ["Gtk", "Gdk", "load_glade"]
+Gtk, Gdk, GLib, GObject = Gtk, Gdk, GLib, GObject
+__all__ = ["Gtk", "Gdk", "GLib", "GObject", "load_glade"]
 
 
 def load_glade(filename: str) -> Gtk.Builder:
@@ -0,0 +1,163 @@
+import random
+from typing import Any, Dict, List, Optional, Tuple
+
+from indexme.gui.gtk import GObject, Gtk
+from indexme.gui.result_tree import Child, ResultTree
+
+COLUMN_TYPES = [str, str, str, GObject.TYPE_LONG, str, GObject.TYPE_LONG, str]
+"""
+Types of columns of rows (see Row).
+"""
+
+
+class LazyTreeModel(GObject.GObject, Gtk.TreeModel):  # type: ignore
+    """
+    Tree model reading rows from a ResultTree only when the view asks for them.
+
+    An iterator points to a row by number of its parent node and its position
+    there. Nodes are numbered as their children are first listed.
+    Rows the tree loads later are announced to the view as they arrive.
+    """
+
+    def __init__(self, tree: ResultTree, root: str) -> None:
+        GObject.GObject.__init__(self)
+        self.tree = tree
+        self.stamp = random.randint(1, 2**31 - 1)
+        self.nodes: List[str] = [root]
+        self.node_numbers: Dict[str, int] = {root: 0}
+        # Where each node is displayed, as its parent's number and position.
+        self.positions: List[Optional[Tuple[int, int]]] = [None]
+        # Counts of children of nodes, as last told to the view.
+        self.counts: Dict[int, int] = {}
+        tree.watch(self._loaded)
+
+    def _iter(self, node: int, index: int) -> Gtk.TreeIter:
+        iter = Gtk.TreeIter()
+        iter.stamp = self.stamp
+        # Zero would be read back as NULL.
+        iter.user_data = node + 1
+        iter.user_data2 = index + 1
+        return iter
+
+    def _location(self, iter: Gtk.TreeIter) -> Tuple[int, int]:
+        return iter.user_data - 1, iter.user_data2 - 1
+
+    def _child(self, iter: Gtk.TreeIter) -> Child:
+        node, index = self._location(iter)
+        return self.tree.child(self.nodes[node], index)
+
+    def _node(self, iter: Optional[Gtk.TreeIter]) -> Optional[int]:
+        """
+        Gets number of a node whose children are listed at a row.
+        Returns None if the row has no children.
+        """
+        if iter is None:
+            return 0
+        row, has_children = self._child(iter)
+        if not has_children:
+            return None
+        path = row[0]
+        if path not in self.node_numbers:
+            self.node_numbers[path] = len(self.nodes)
+            self.nodes.append(path)
+            self.positions.append(self._location(iter))
+        return self.node_numbers[path]
+
+    def _n_children(self, node: int) -> int:
+        self.counts[node] = self.tree.n_children(self.nodes[node])
+        return self.counts[node]
+
+    def _loaded(self, parent: str, start: int, stop: int) -> None:
+        """
+        Tells the view about loaded children of a node,
+        inserting ones past the count it knows about.
+        """
+        node = self.node_numbers.get(parent)
+        if node is None:
+            return
+        # The view might ask for the new count while being told.
+        known = self.counts.get(node, 0)
+        for index in range(start, stop):
+            iter = self._iter(node, index)
+            path = self.do_get_path(iter)
+            if index >= known:
+                # Not loaded yet, so it has no children.
+                self.row_inserted(path, iter)
+                continue
+            self.row_changed(path, iter)
+            if self._child(iter)[1]:
+                self.row_has_child_toggled(path, iter)
+        self.counts[node] = max(self.counts.get(node, 0), stop)
+
+    def do_get_flags(self) -> Any:
+        return Gtk.TreeModelFlags(0)
+
+    def do_get_n_columns(self) -> int:
+        return len(COLUMN_TYPES)
+
+    def do_get_column_type(self, column: int) -> Any:
+        return COLUMN_TYPES[column]
+
+    def do_get_iter(self, path: Gtk.TreePath) -> Tuple[bool, Any]:
+        iter = None
+        for index in path.get_indices():
+            valid, iter = self.do_iter_nth_child(iter, index)
+            if not valid:
+                return False, None
+        return iter is not None, iter
+
+    def do_get_path(self, iter: Gtk.TreeIter) -> Gtk.TreePath:
+        node, index = self._location(iter)
+        indices = [index]
+        position = self.positions[node]
+        while position is not None:
+            node, index = position
+            indices.insert(0, index)
+            position = self.positions[node]
+        return Gtk.TreePath(indices)
+
+    def do_get_value(self, iter: Gtk.TreeIter, column: int) -> Any:
+        row, _has_children = self._child(iter)
+        return row[column]
+
+    def do_iter_next(self, iter: Gtk.TreeIter) -> bool:
+        node, index = self._location(iter)
+        if index + 1 >= self._n_children(node):
+            return False
+        iter.user_data2 = index + 2
+        return True
+
+    def do_iter_previous(self, iter: Gtk.TreeIter) -> bool:
+        _node, index = self._location(iter)
+        if index == 0:
+            return False
+        iter.user_data2 = index
+        return True
+
+    def do_iter_children(self, parent: Optional[Gtk.TreeIter]) -> Tuple[bool, Any]:
+        return self.do_iter_nth_child(parent, 0)
+
+    def do_iter_has_child(self, iter: Gtk.TreeIter) -> bool:
+        _row, has_children = self._child(iter)
+        return has_children
+
+    def do_iter_n_children(self, iter: Optional[Gtk.TreeIter]) -> int:
+        node = self._node(iter)
+        if node is None:
+            return 0
+        return self._n_children(node)
+
+    def do_iter_nth_child(
+        self, parent: Optional[Gtk.TreeIter], index: int
+    ) -> Tuple[bool, Any]:
+        node = self._node(parent)
+        if node is None or index >= self._n_children(node):
+            return False, None
+        return True, self._iter(node, index)
+
+    def do_iter_parent(self, child: Gtk.TreeIter) -> Tuple[bool, Any]:
+        node, _index = self._location(child)
+        position = self.positions[node]
+        if position is None:
+            return False, None
+        return True, self._iter(*position)
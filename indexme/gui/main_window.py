@@ -1,14 +1,16 @@
 import os
-from typing import Any, Callable, Dict, List, Optional
+from typing import Any, Callable, List, Optional, Tuple
 
 from send2trash import send2trash  # type: ignore
 from sqlalchemy.orm.session import Session
 
 from indexme.db.connection import connect
-from indexme.db.file_model import File, format_bytes
-from indexme.db.file_ops import FileSortDirection, GetAllFiles, get_file
+from indexme.db.file_ops import GetAllFiles
 from indexme.gui.clipboard import copy_file_to_clipboard, copy_path_to_clipboard
-from indexme.gui.gtk import Gdk, Gtk, load_glade
+from indexme.gui.gtk import Gdk, GLib, Gtk, load_glade
+from indexme.gui.lazy_model import LazyTreeModel
+from indexme.gui.result_tree import ResultTree
+from indexme.gui.search_worker import SearchWorker
 
 
 class MainWindow:
@@ -21,14 +23,13 @@ class MainWindow:
         self.Session = connect()
 
         self.root = os.path.abspath(os.path.expanduser(root))
-        self.added_rows: Dict[str, Gtk.TreeRow] = dict()
         self.actions: List[Callable[[str], Any]] = []
         self.filters: List[Callable[[GetAllFiles], GetAllFiles]] = []
+        self.sorting: Tuple[Any, Any] = (None, None)
 
         self.window = self.builder.get_object("window")
-        self.window.connect("destroy", Gtk.main_quit)
+        self.window.connect("destroy", lambda _this: self._destroyed())
 
-        self.store = self.builder.get_object("store")
         self.tree_view = self.builder.get_object("treeview")
         self.tree_view.connect(
             "row-activated", lambda _this, _num, _col: self._row_activated()
@@ -37,9 +38,17 @@ class MainWindow:
             "button-press-event", lambda _this, ev: self._row_clicked(ev)
         )
 
+        self.worker = SearchWorker(
+            self.Session, self._query, self.root, self._show_results, GLib.idle_add
+        )
+
         self.search = self.builder.get_object("search")
         self.search.connect("search-changed", lambda _this: self._search_changed())
 
+    def _destroyed(self) -> None:
+        self.worker.stop()
+        Gtk.main_quit()
+
     def show(self) -> None:
         """
         Displays the window.
@@ -58,39 +67,34 @@ class MainWindow:
         """
         self.filters.append(filter)
 
-    def _search_changed(self) -> None:
+    def _query(self, s: Session, root: str, text: str) -> GetAllFiles:
+        query = GetAllFiles(s, root).with_name(text)
+        for f in self.filters:
+            query = f(query)
+        return query
+
+    def _search_changed(self, fresh: bool = False) -> None:
         text = self.search.get_text()
-        self._clear_rows()
         if len(text) > 0:
-            with self.Session() as s:
-                query = GetAllFiles(s, self.root).with_name(text)
-                for f in self.filters:
-                    query = f(query)
-                for file in query.with_sorting(FileSortDirection("path")).limit(100):
-                    self._add_row(s, file.path, file)
-
-    def _clear_rows(self) -> None:
-        self.store.clear()
-        self.added_rows.clear()
-
-    def _add_row(self, session: Session, path: str, file: Optional[File]) -> None:
-        data = [path, os.path.basename(path), "", 0, "", 0, ""]
-        if file is not None:
-            size = "dir" if file.is_dir else format_bytes(file.size)
-            created_at = int(file.created_at.timestamp()), str(file.created_at)
-            modified_at = int(file.modified_at.timestamp()), str(file.modified_at)
-            data = [file.path, file.name, size, *created_at, *modified_at]
-
-        parent_path = os.path.dirname(path)
-        parent = None
-        if parent_path != self.root:
-            if parent_path not in self.added_rows:
-                parent_file = get_file(session, parent_path)
-                self._add_row(session, parent_path, parent_file)
-            parent = self.added_rows[parent_path]
-
-        row = self.store.append(parent, data)
-        self.added_rows[path] = row
+            self.worker.submit(text, fresh)
+        else:
+            self.worker.cancel()
+            self._show_results(None)
+
+    def _show_results(self, tree: Optional[ResultTree]) -> None:
+        """
+        Replaces displayed results, keeping their sorting.
+        Sorting by a column reads all rows of expanded directories.
+        """
+        if self.tree_view.get_model() is not None:
+            self.sorting = self.tree_view.get_model().get_sort_column_id()
+        if tree is None:
+            self.tree_view.set_model(None)
+            return
+        model = Gtk.TreeModelSort.new_with_model(LazyTreeModel(tree, self.root))
+        if self.sorting[0] is not None:
+            model.set_sort_column_id(*self.sorting)
+        self.tree_view.set_model(model)
 
     def _row_activated(self) -> None:
         store, iter = self.tree_view.get_selection().get_selected()
@@ -116,7 +120,7 @@ class MainWindow:
             loc = self.tree_view.get_path_at_pos(int(ev.x), int(ev.y))
             if loc is not None:
                 tree_path, _col, _rel_x, _rel_y = loc
-                row = self.store[tree_path]
+                row = self.tree_view.get_model()[tree_path]
 
                 expand_all = Gtk.MenuItem("Expand all")
                 expand_all.connect(
@@ -153,7 +157,7 @@ class MainWindow:
                 menu.append(Gtk.SeparatorMenuItem())
 
             refresh = Gtk.MenuItem("Refresh")
-            refresh.connect("activate", lambda _this: self._search_changed())
+            refresh.connect("activate", lambda _this: self._search_changed(True))
             menu.append(refresh)
 
             menu.show_all()
@@ -0,0 +1,342 @@
+import os
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple, cast
+
+from sqlalchemy import case, literal, select
+from sqlalchemy.orm import aliased
+from sqlalchemy.orm.query import Query
+from sqlalchemy.orm.session import Session
+
+from indexme.db.file_model import Directory, File, format_bytes
+from indexme.db.file_ops import GetAllFiles, dir_id
+from indexme.db.layout import FLAG_DIR, dir_key, subtree_range
+
+PAGE_SIZE = 200
+"""
+How many rows QueryTree fetches at once.
+"""
+
+CACHED_PAGES = 50
+"""
+How many pages QueryTree keeps in memory.
+"""
+
+Row = List[Any]
+"""
+A row of the window's tree model: path, name, size, creation and
+modification times (each as a timestamp and as text).
+"""
+
+Child = Tuple[Row, bool]
+"""
+A row in the tree, and whether it has children.
+"""
+
+Load = Callable[[Callable[[], Callable[[], Any]]], Any]
+"""
+Runs a query, possibly on another thread, then the function it returns,
+which stores results, on the thread the tree is used from.
+"""
+
+
+def file_row(
+    path: str, name: str, flags: int, size: int, created_at: Any, modified_at: Any
+) -> Row:
+    """
+    Builds a row describing a file.
+    """
+    size_text = "dir" if flags & FLAG_DIR else format_bytes(size)
+    created = int(created_at.timestamp()), str(created_at)
+    modified = int(modified_at.timestamp()), str(modified_at)
+    return [path, name, size_text, *created, *modified]
+
+
+def placeholder_row(path: str) -> Row:
+    """
+    Builds a row for a directory missing from the index.
+    """
+    return [path, os.path.basename(path), "", 0, "", 0, ""]
+
+
+class ResultTree(ABC):
+    """
+    Search results arranged in a tree: matching files below root,
+    under directories leading to them. Nodes are identified by paths.
+    """
+
+    @abstractmethod
+    def n_children(self, parent: str) -> int:
+        """
+        Counts children of a node.
+        """
+
+    @abstractmethod
+    def child(self, parent: str, index: int) -> Child:
+        """
+        Gets a child of a node by its position.
+        """
+
+    def watch(self, loaded: Callable[[str, int, int], Any]) -> None:
+        """
+        Registers a function called with a node and a range of positions
+        of its children, when they are loaded later than asked for.
+        Children past the count reported before are new.
+        Trees held in memory in full are never loaded later.
+        """
+
+
+def _run_now(query: Callable[[], Callable[[], Any]]) -> None:
+    query()()
+
+
+class MemoryTree(ResultTree):
+    """
+    Results held in memory in full.
+    """
+
+    def __init__(self, root: str, rows: List[Row]) -> None:
+        """
+        Arranges rows into a tree. Ancestors of each row must be included.
+        """
+        self.root = root
+        self.children: Dict[str, List[Row]] = dict()
+        for row in rows:
+            parent = os.path.dirname(row[0]) if row[0] != root else root
+            self.children.setdefault(parent, []).append(row)
+        for children in self.children.values():
+            children.sort(key=lambda row: cast(str, row[1]))
+
+    def n_children(self, parent: str) -> int:
+        return len(self.children.get(parent, []))
+
+    def child(self, parent: str, index: int) -> Child:
+        row = self.children[parent][index]
+        return row, row[0] != self.root and row[0] in self.children
+
+
+class QueryTree(ResultTree):
+    """
+    Results fetched from the database as they are needed.
+    Searches are built by query, given a session and a root.
+
+    Children of a node are its entries that match the search, or are
+    directories with matches below them. They are read in pages, in order
+    of names, so that the (parent_id, name) index is followed. A page
+    continues from a name of the nearest cached page of the node (keyset
+    pagination), and only pages between them are skipped using OFFSET.
+    Only recently used pages are kept, so memory use does not grow with
+    the number of results.
+
+    Queries are run by load. Until their results are stored, nodes have
+    no children and children are empty rows, and watching functions are
+    told about them once they are stored.
+
+    Directories above indexed ones are missing from the index. Children of
+    such a directory are found by skipping through paths of indexed ones.
+    """
+
+    def __init__(
+        self,
+        Session: Callable[[], Session],
+        query: Callable[[Session, str], GetAllFiles],
+        root: str,
+        page_size: int = PAGE_SIZE,
+        cached_pages: int = CACHED_PAGES,
+        load: Load = _run_now,
+    ) -> None:
+        self.Session = Session
+        self.query = query
+        self.root = root
+        self.page_size = page_size
+        self.cached_pages = cached_pages
+        self.load = load
+        self.counts: Dict[str, int] = dict()
+        self.missing: Dict[str, List[Child]] = dict()
+        self.pages: "OrderedDict[Tuple[str, int], List[Child]]" = OrderedDict()
+        self.requested: Set[Tuple[str, int]] = set()
+        self.loaded: List[Callable[[str, int, int], Any]] = []
+
+    def watch(self, loaded: Callable[[str, int, int], Any]) -> None:
+        self.loaded.append(loaded)
+
+    def _children(
+        self,
+        s: Session,
+        parent: str,
+        after: Optional[str] = None,
+        backwards: bool = False,
+    ) -> "Query[Any]":
+        """
+        Queries children of a node, optionally only those named after given
+        name, or before it if backwards, nearest first.
+        Selects their columns, and whether there are matches below them.
+        """
+        matches = self.query(s, parent).query
+        child = aliased(File)
+
+        # Like in_subtree, for a path of a child.
+        key = literal(dir_key(parent)) + child.name
+        below = (
+            select(Directory.id)
+            .where(Directory.path >= key + "/", Directory.path < key + "0")
+            .correlate(child)
+        )
+        has_matches = case(
+            (
+                child.flags.op("&")(FLAG_DIR) != 0,
+                matches.filter(File.parent_id.in_(below)).exists(),
+            ),
+            else_=False,
+        )
+        direct = matches.filter(File.parent_id == dir_id(parent)).with_entities(File.id)
+        query = s.query(child).filter(child.parent_id == dir_id(parent))
+        if after is not None:
+            query = query.filter(
+                child.name < after if backwards else child.name > after
+            )
+        return (
+            query.filter(child.id.in_(direct.statement) | has_matches)
+            .order_by(child.name.desc() if backwards else child.name)
+            .with_entities(
+                child.name,
+                child.flags,
+                child.size,
+                child.created_at,
+                child.modified_at,
+                has_matches,
+            )
+        )
+
+    def _missing_children(self, s: Session, parent: str) -> List[Child]:
+        """
+        Gets children of a directory missing from the index,
+        that have matches below them.
+        """
+        children: List[Child] = []
+        lower, upper = subtree_range(parent)
+        while True:
+            path = (
+                s.query(Directory.path)
+                .filter(Directory.path >= lower, Directory.path < upper)
+                .order_by(Directory.path)
+                .limit(1)
+                .scalar()
+            )
+            if path is None:
+                return children
+            name = path[len(dir_key(parent)) :].split("/")[0]
+            child = os.path.join(parent, name)
+            matches = self.query(s, child).query
+            if s.query(matches.exists()).scalar():
+                children.append((placeholder_row(child), True))
+            # Skip to the next child.
+            lower = subtree_range(child)[1]
+
+    def n_children(self, parent: str) -> int:
+        if parent not in self.counts:
+            self._request((parent, -1), lambda s: self._count(s, parent))
+        return self.counts.get(parent, 0)
+
+    def child(self, parent: str, index: int) -> Child:
+        if parent in self.missing:
+            return self.missing[parent][index]
+        number, offset = divmod(index, self.page_size)
+        if (parent, number) not in self.pages:
+            after, backwards, skip = self._anchor(parent, number)
+            self._request(
+                (parent, number),
+                lambda s: self._fetch(s, parent, number, after, backwards, skip),
+            )
+        page = self.pages.get((parent, number), [])
+        if offset >= len(page):
+            # Not loaded yet.
+            return placeholder_row(dir_key(parent)), False
+        self.pages.move_to_end((parent, number))
+        return page[offset]
+
+    def _request(
+        self, key: Tuple[str, int], query: Callable[[Session], Callable[[], None]]
+    ) -> None:
+        """
+        Loads children of a node once, unless they are being loaded already.
+        Page number -1 stands for their count.
+        """
+        if key in self.requested:
+            return
+        self.requested.add(key)
+
+        def run() -> Callable[[], None]:
+            with self.Session() as s:
+                store = query(s)
+
+            def stored() -> None:
+                self.requested.discard(key)
+                store()
+
+            return stored
+
+        self.load(run)
+
+    def _count(self, s: Session, parent: str) -> Callable[[], None]:
+        missing = None
+        if s.query(dir_id(parent)).scalar() is None:
+            missing = self._missing_children(s, parent)
+            count = len(missing)
+        else:
+            count = self._children(s, parent).count()
+
+        def store() -> None:
+            if missing is not None:
+                self.missing[parent] = missing
+            self.counts[parent] = count
+            self._loaded(parent, 0, count)
+
+        return store
+
+    def _anchor(self, parent: str, number: int) -> Tuple[Optional[str], bool, int]:
+        """
+        Finds where to read a page from: the name of the nearest cached page
+        of the node to continue from, whether to read backwards from it,
+        and how many children to skip.
+        """
+        cached = [n for (p, n), page in self.pages.items() if p == parent and page]
+        before = max([n for n in cached if n < number], default=-1)
+        after = min([n for n in cached if n > number], default=None)
+        if after is not None and after - number < number - before:
+            name = self.pages[(parent, after)][0][0][1]
+            return name, True, (after - number - 1) * self.page_size
+        name = None if before < 0 else self.pages[(parent, before)][-1][0][1]
+        return name, False, (number - before - 1) * self.page_size
+
+    def _fetch(
+        self,
+        s: Session,
+        parent: str,
+        number: int,
+        after: Optional[str],
+        backwards: bool,
+        skip: int,
+    ) -> Callable[[], None]:
+        query = self._children(s, parent, after, backwards)
+        if skip > 0:
+            query = query.offset(skip)
+        page: List[Child] = []
+        for name, *columns, has_matches in query.limit(self.page_size):
+            row = file_row(os.path.join(parent, name), name, *columns)
+            page.append((row, bool(has_matches)))
+        if backwards:
+            page.reverse()
+
+        def store() -> None:
+            self.pages[(parent, number)] = page
+            while len(self.pages) > self.cached_pages:
+                self.pages.popitem(last=False)
+            start = number * self.page_size
+            self._loaded(parent, start, start + len(page))
+
+        return store
+
+    def _loaded(self, parent: str, start: int, stop: int) -> None:
+        for loaded in self.loaded:
+            loaded(parent, start, stop)
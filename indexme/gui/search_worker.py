@@ -0,0 +1,277 @@
+import os
+import threading
+import time
+from collections import deque
+from functools import partial
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional, Set, Tuple
+
+from sqlalchemy.orm.session import Session
+
+from indexme.db.file_model import File
+from indexme.db.file_ops import GetAllFiles, get_files
+from indexme.db.snapshot import fold_case
+from indexme.gui.result_tree import (
+    MemoryTree,
+    QueryTree,
+    ResultTree,
+    Row,
+    file_row,
+    placeholder_row,
+)
+
+MEMORY_LIMIT = 10000
+"""
+How many matches are kept in memory. Results of searches with more
+matches are fetched from the database as they are browsed, and are
+not refined.
+"""
+
+
+class Results:
+    """
+    Rows of files matching a search text.
+    """
+
+    def __init__(self, text: str, rows: List[Row], complete: bool) -> None:
+        self.text = text
+        self.rows = rows
+        self.complete = complete
+
+    def refine(self, text: str) -> Optional["Results"]:
+        """
+        Narrows results down to a longer text, without querying the database.
+        Names match a text when they contain it, ignoring case like LIKE does,
+        so files matching the longer text are among the current ones.
+        Returns None if that is not the case, some matches were not kept,
+        or the text contains LIKE wildcards.
+        """
+        fragment = fold_case(text)
+        if not self.complete or fold_case(self.text) not in fragment:
+            return None
+        if "%" in text or "_" in text:
+            # These are wildcards in LIKE.
+            return None
+        rows = [row for row in self.rows if fragment in fold_case(row[1])]
+        return Results(text, rows, True)
+
+
+class SearchWorker:
+    """
+    Runs searches on a background thread, so that typing does not block the UI.
+    Searches are built by query, given a session, a root and a text.
+
+    A search starts once no newer one was submitted for debounce seconds.
+    Submitting a search cancels the one in progress, and results of
+    cancelled searches are never shown. Results are handed to show through
+    schedule (e.g. GLib.idle_add), so that it runs on the UI thread.
+    Results browsed from the database are loaded on the worker thread
+    as well, before pending searches.
+    """
+
+    def __init__(
+        self,
+        Session: Callable[[], Session],
+        query: Callable[[Session, str, str], GetAllFiles],
+        root: str,
+        show: Callable[[ResultTree], Any],
+        schedule: Callable[[Callable[[], Any]], Any],
+        debounce: float = 0.15,
+    ) -> None:
+        self.Session = Session
+        self.query = query
+        self.root = root
+        self.show = show
+        self.schedule = schedule
+        self.debounce = debounce
+
+        self.lock = threading.Condition()
+        self.generation = 0
+        self.pending: Optional[str] = None
+        self.deadline = 0.0
+        self.fresh = False
+        self.stopped = False
+        self.loads: Deque[Tuple[int, Callable[[], Callable[[], Any]]]] = deque()
+
+        # Used by the worker thread only.
+        self.previous: Optional[Results] = None
+        self.ancestors: Dict[str, Row] = dict()
+
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def submit(self, text: str, fresh: bool = False) -> None:
+        """
+        Schedules a search, cancelling the previous one.
+        Fresh searches always query the database.
+        """
+        with self.lock:
+            self.generation += 1
+            self.pending = text
+            self.deadline = time.monotonic() + self.debounce
+            self.fresh = self.fresh or fresh
+            self.lock.notify()
+
+    def cancel(self) -> None:
+        """
+        Cancels pending and running searches.
+        """
+        with self.lock:
+            self.generation += 1
+            self.pending = None
+
+    def stop(self) -> None:
+        """
+        Cancels searches and waits for the worker thread to finish.
+        Results of a search in progress are not shown.
+        """
+        with self.lock:
+            self.generation += 1
+            self.pending = None
+            self.loads.clear()
+            self.stopped = True
+            self.lock.notify()
+        self.thread.join()
+
+    def _load(self, generation: int, query: Callable[[], Callable[[], Any]]) -> None:
+        """
+        Queues a query of rows of a shown tree (see Load).
+        Queries of trees replaced by newer searches are dropped.
+        """
+        with self.lock:
+            self.loads.append((generation, query))
+            self.lock.notify()
+
+    def _is_current(self, generation: int) -> bool:
+        return generation == self.generation
+
+    def _next(self) -> Optional[Callable[[], None]]:
+        """
+        Waits until a load or a search should start.
+        Returns None once stopped.
+        """
+        with self.lock:
+            while True:
+                remaining = self.deadline - time.monotonic()
+                if self.stopped:
+                    return None
+                if len(self.loads) > 0:
+                    generation, query = self.loads.popleft()
+                    if self._is_current(generation):
+                        return partial(self._run_load, query, generation)
+                elif self.pending is None:
+                    self.lock.wait()
+                elif remaining > 0:
+                    self.lock.wait(remaining)
+                else:
+                    text, self.pending = self.pending, None
+                    fresh, self.fresh = self.fresh, False
+                    return partial(self._run_search, text, fresh, self.generation)
+
+    def _run(self) -> None:
+        while True:
+            job = self._next()
+            if job is None:
+                return
+            job()
+
+    def _run_search(self, text: str, fresh: bool, generation: int) -> None:
+        if fresh:
+            self.previous = None
+            self.ancestors.clear()
+        tree = self._search(text, generation)
+        if tree is not None:
+            self.schedule(partial(self._show, tree, generation))
+
+    def _run_load(
+        self, query: Callable[[], Callable[[], Any]], generation: int
+    ) -> None:
+        store = query()
+        self.schedule(partial(self._store, store, generation))
+
+    def _show(self, tree: ResultTree, generation: int) -> None:
+        # A newer search may have been submitted while this was scheduled.
+        if self._is_current(generation):
+            self.show(tree)
+
+    def _store(self, store: Callable[[], Any], generation: int) -> None:
+        if self._is_current(generation):
+            store()
+
+    def _search(self, text: str, generation: int) -> Optional[ResultTree]:
+        """
+        Gets results to display. Returns None if cancelled.
+        """
+        results = None if self.previous is None else self.previous.refine(text)
+        with self.Session() as s:
+            if results is None:
+                results = self._fetch(s, text, generation)
+                if results is None:
+                    return None
+            self.previous = results
+            if not results.complete:
+                query = lambda s, root: self.query(s, root, text)
+                tree = QueryTree(self.Session, query, self.root)
+                # Top level is displayed right away, the rest is loaded later.
+                tree.n_children(self.root)
+                tree.load = partial(self._load, generation)
+                return tree
+
+            paths = {row[0] for row in results.rows}
+            ancestors: Set[str] = set()
+            for path in paths:
+                for parent in self._ancestor_paths(path):
+                    if parent in ancestors:
+                        break
+                    ancestors.add(parent)
+            if not self._is_current(generation):
+                return None
+            self._fetch_ancestors(s, ancestors)
+            rows = [self.ancestors[path] for path in ancestors - paths]
+            return MemoryTree(self.root, results.rows + rows)
+
+    def _fetch(self, s: Session, text: str, generation: int) -> Optional[Results]:
+        columns = [
+            File.path,
+            File.name,
+            File.flags,
+            File.size,
+            File.created_at,
+            File.modified_at,
+        ]
+        rows = []
+        query = self.query(s, self.root, text).limit(MEMORY_LIMIT + 1)
+        for values in query.rows(*columns):
+            if not self._is_current(generation):
+                return None
+            rows.append(file_row(*values))
+        if len(rows) > MEMORY_LIMIT:
+            return Results(text, [], False)
+        return Results(text, rows, True)
+
+    def _ancestor_paths(self, path: str) -> Iterator[str]:
+        """
+        Yields paths of ancestors of path below root, nearest first.
+        """
+        parent = os.path.dirname(path)
+        while path != self.root and parent not in [self.root, path]:
+            yield parent
+            path, parent = parent, os.path.dirname(parent)
+
+    def _fetch_ancestors(self, s: Session, paths: Set[str]) -> None:
+        """
+        Fetches rows of given directories not fetched before, in batches.
+        """
+        missing = paths - self.ancestors.keys()
+        files = get_files(s, missing)
+        for parent in missing:
+            file = files.get(parent)
+            self.ancestors[parent] = placeholder_row(parent)
+            if file is not None:
+                self.ancestors[parent] = file_row(
+                    file.path,
+                    file.name,
+                    file.flags,
+                    file.size,
+                    file.created_at,
+                    file.modified_at,
+                )
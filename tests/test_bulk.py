@@ -0,0 +1,93 @@
+import os
+import shutil
+import tempfile
+from typing import List
+from unittest import TestCase
+
+from indexme.db.bulk import FileWriter
+from indexme.db.connection import connect
+from indexme.db.file_model import File
+from indexme.db.file_ops import GetAllFiles, subtree_totals
+from indexme.db.ignore import Exclusions
+from indexme.db.walker import Walker
+from tests.utils import test_env
+
+
+class FileWriterMoveTests(TestCase):
+    def setUp(self) -> None:
+        test_env()
+        self.root = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.root, "a", "b"))
+        with open(os.path.join(self.root, "a", "b", "file.txt"), "w") as f:
+            f.write("text")
+        os.mkdir(os.path.join(self.root, "ab"))
+        self.Session = connect()
+        with self.Session() as s, FileWriter(s) as writer:
+            writer.add(self.root)
+            for path, path_stat in Walker(self.root, Exclusions([])):
+                writer.add(path, path_stat)
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.root)
+
+    def paths(self) -> List[str]:
+        with self.Session() as s:
+            rows = GetAllFiles(s, self.root).rows(File.path)
+            return sorted(os.path.relpath(path, self.root) for (path,) in rows)
+
+    def test_moves_subtree(self) -> None:
+        with self.Session() as s, FileWriter(s) as writer:
+            writer.move(os.path.join(self.root, "a"), os.path.join(self.root, "c"))
+        self.assertEqual(self.paths(), [".", "ab", "c", "c/b", "c/b/file.txt"])
+        with self.Session() as s:
+            self.assertEqual(subtree_totals(s, os.path.join(self.root, "c")), (4, 1))
+
+    def test_moves_into_another_directory(self) -> None:
+        with self.Session() as s, FileWriter(s) as writer:
+            writer.move(
+                os.path.join(self.root, "a", "b"), os.path.join(self.root, "ab", "b")
+            )
+        self.assertEqual(self.paths(), [".", "a", "ab", "ab/b", "ab/b/file.txt"])
+
+    def test_writes_batches_in_single_transaction(self) -> None:
+        with self.Session() as s:
+            with FileWriter(s, batch_size=1, single_transaction=True) as writer:
+                writer.remove(os.path.join(self.root, "ab"))
+                writer.move(os.path.join(self.root, "a"), os.path.join(self.root, "c"))
+                self.assertEqual(writer.pending, [])
+                self.assertIn("a", self.paths())
+            self.assertEqual(self.paths(), [".", "c", "c/b", "c/b/file.txt"])
+
+    def test_rolls_back_single_transaction(self) -> None:
+        with self.assertRaises(OSError), self.Session() as s:
+            with FileWriter(s, batch_size=1, single_transaction=True) as writer:
+                writer.remove(os.path.join(self.root, "ab"))
+                writer.remove(os.path.join(self.root, "a"))
+                raise OSError("failed")
+        self.assertEqual(self.paths(), [".", "a", "a/b", "a/b/file.txt", "ab"])
+
+
+class WalkerTests(TestCase):
+    def setUp(self) -> None:
+        self.root = tempfile.mkdtemp()
+        for i in range(50):
+            os.makedirs(os.path.join(self.root, str(i), "sub"))
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.root)
+
+    def test_stops_threads_when_closed_early(self) -> None:
+        with Walker(self.root, Exclusions([]), queue_size=1) as walker:
+            next(iter(walker))
+        self.assertFalse(any(thread.is_alive() for thread in walker.threads))
+
+    def test_lists_all_entries(self) -> None:
+        with Walker(self.root, Exclusions([])) as walker:
+            self.assertEqual(len(list(walker)), 100)
+        self.assertFalse(any(thread.is_alive() for thread in walker.threads))
+
+    def test_walks_without_workers(self) -> None:
+        with Walker(self.root, Exclusions([])) as walker:
+            expected = sorted(path for path, _stat in walker)
+        with Walker(self.root, Exclusions([]), workers=0) as walker:
+            self.assertEqual(sorted(path for path, _stat in walker), expected)
@@ -1,11 +1,27 @@
-from typing import List
-from unittest import TestCase
+import io
+import os
+import shutil
+import socket
+import tempfile
+import threading
+from contextlib import redirect_stdout
+from typing import Any, List
+from unittest import TestCase, mock
 
 from click.testing import Result
 
 from indexme.cli.indexme import app as indexme
+from indexme.cli.indexme import apply_changes
 from indexme.cli.purgeme import app as purgeme
 from indexme.cli.searchme import app as searchme
+from indexme.cli.serveme import SearchServer
+from indexme.db.bulk import FileWriter
+from indexme.db.changes import ChangeSet
+from indexme.db.connection import connect, transaction
+from indexme.db.file_model import File
+from indexme.db.ignore import Exclusions
+from indexme.db.paths import set_socket_path_factory
+from indexme.db.scan_stats import ScanStats
 from tests.utils import get_db_size, run_app, test_env
 
 
@@ -37,6 +53,202 @@ class CliIndexMeTests(TestCase):
         res = index(["tests/example_dir", "--exclude", "one", "--exclude", "two"])
         self.assertIn("example_file.txt", res.stdout)
 
+    def test_indexes_with_many_workers(self) -> None:
+        res = index(["tests/example_dir", "--workers", "8"])
+        self.assertIn("example_file.txt", res.stdout)
+        self.assertEqual(get_db_size(), 2)
+
+    def test_does_not_follow_symlinks(self) -> None:
+        root = tempfile.mkdtemp()
+        try:
+            os.symlink(os.path.abspath("tests/example_dir"), f"{root}/link")
+            index([root])
+            res = search(["", root, "--no-directories"])
+            self.assertIn("link\n", res.stdout)
+            self.assertEqual(get_db_size(), 1)
+        finally:
+            shutil.rmtree(root)
+
+    def test_reindexing_updates_rows_in_place(self) -> None:
+        index(["tests/example_dir"])
+        res = index(["tests/example_dir"])
+        self.assertIn("example_file.txt", res.stdout)
+        self.assertEqual(get_db_size(), 2)
+
+    def test_reports_stats_and_metrics(self) -> None:
+        fd, metrics = tempfile.mkstemp()
+        os.close(fd)
+        try:
+            index(["tests/example_dir"])
+            res = index(["tests/example_dir", "--stats", "--metrics", metrics])
+            self.assertIn("entries_stated: 2\n", res.stdout)
+            self.assertIn("rows_written: 0\n", res.stdout)
+            with open(metrics) as f:
+                text = f.read()
+            self.assertIn("indexme_dirs_listed_total 2\n", text)
+            self.assertIn('indexme_phase_seconds_total{phase="commit"}', text)
+        finally:
+            os.remove(metrics)
+
+
+class CliWatchTests(TestCase):
+    def setUp(self) -> None:
+        test_env()
+        self.root = tempfile.mkdtemp()
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.root)
+
+    def apply(self, changes: ChangeSet, stats: ScanStats) -> None:
+        Session = connect()
+        with Session() as s, redirect_stdout(io.StringIO()):
+            apply_changes(s, changes, Exclusions([]), stats)
+
+    def test_does_not_follow_symlinks(self) -> None:
+        os.symlink(os.path.abspath("tests/example_dir"), f"{self.root}/link")
+        changes = ChangeSet()
+        changes.add(f"{self.root}/link", created=True)
+        self.apply(changes, ScanStats())
+        res = search(["", self.root, "--no-directories"])
+        self.assertIn("link\n", res.stdout)
+        self.assertEqual(get_db_size(), 1)
+
+    def test_walks_nested_added_dirs_once(self) -> None:
+        os.makedirs(f"{self.root}/n/m")
+        open(f"{self.root}/n/m/file", "w").close()
+        changes = ChangeSet()
+        for path in ["n", "n/m", "n/m/file"]:
+            changes.add(f"{self.root}/{path}", created=True)
+        stats = ScanStats()
+        self.apply(changes, stats)
+        self.assertEqual(stats.counts["dirs_listed"], 2)
+        self.assertEqual(stats.counts["rows_written"], 3)
+
+    def test_skips_failing_changes(self) -> None:
+        changes = ChangeSet()
+        for name in ["a", "b", "c"]:
+            os.makedirs(f"{self.root}/{name}/inner")
+            changes.add(f"{self.root}/{name}", created=True)
+        add = FileWriter.add
+
+        def failing_add(writer: FileWriter, path: str, stat: Any = None) -> File:
+            if path == f"{self.root}/b":
+                raise OSError("failed")
+            return add(writer, path, stat)
+
+        stats = ScanStats()
+        with mock.patch.object(FileWriter, "add", failing_add), mock.patch(
+            "indexme.db.bulk.transaction", wraps=transaction
+        ) as transactions:
+            self.apply(changes, stats)
+        self.assertEqual(transactions.call_count, 1)
+        self.assertEqual(stats.counts["errors"], 1)
+        res = search(["", self.root, "--sort-by", "path"])
+        self.assertEqual(
+            [os.path.relpath(x, self.root) for x in res.stdout.splitlines()],
+            ["a", "a/inner", "c", "c/inner"],
+        )
+
+
+class CliIgnoreFilesTests(TestCase):
+    def setUp(self) -> None:
+        test_env()
+        self.root = tempfile.mkdtemp()
+        files = {
+            ".gitignore": "*.o\n!keep.o\nbuild/\n",
+            "a.o": "",
+            "keep.o": "",
+            "src/main.c": "",
+            "src/build/main.o": "",
+            "sub/.indexmeignore": "!*.o\n",
+            "sub/b.o": "",
+        }
+        for name, text in files.items():
+            path = os.path.join(self.root, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "w") as f:
+                f.write(text)
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.root)
+
+    def indexed(self) -> List[str]:
+        res = search(["", self.root, "--sort-by", "path"])
+        return [os.path.relpath(x, self.root) for x in res.stdout.splitlines()]
+
+    def test_follows_ignore_files(self) -> None:
+        index([self.root])
+        self.assertEqual(
+            self.indexed(),
+            [".gitignore", "keep.o", "src", "src/main.c", "sub", "sub/.indexmeignore"]
+            + ["sub/b.o"],
+        )
+
+    def test_can_skip_ignore_files(self) -> None:
+        index([self.root, "--no-ignore-files", "--exclude", "/**/src/*/"])
+        self.assertIn("a.o", self.indexed())
+        self.assertNotIn("src/build", self.indexed())
+        self.assertIn("src/main.c", self.indexed())
+
+
+class CliIncrementalIndexMeTests(TestCase):
+    def setUp(self) -> None:
+        test_env()
+        self.root = tempfile.mkdtemp()
+        self.inner = os.path.join(self.root, "inner")
+        os.mkdir(self.inner)
+        open(os.path.join(self.inner, "old.txt"), "w").close()
+        index([self.root])
+        self.inner_stat = os.stat(self.inner)
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.root)
+
+    def test_updates_changed_dirs(self) -> None:
+        # Most likely within the second of the last scan.
+        os.remove(os.path.join(self.inner, "old.txt"))
+        open(os.path.join(self.inner, "new.txt"), "w").close()
+        index([self.root, "--incremental"])
+        res = search(["", self.root])
+        self.assertIn("new.txt", res.stdout)
+        self.assertNotIn("old.txt", res.stdout)
+
+    def test_skips_unchanged_dirs(self) -> None:
+        past = self.inner_stat.st_mtime - 10
+        os.utime(self.inner, (0, past))
+        index([self.root])
+        open(os.path.join(self.inner, "new.txt"), "w").close()
+        os.utime(self.inner, (0, past))
+        res = index([self.root, "--incremental"])
+        self.assertNotIn("new.txt", res.stdout)
+        self.assertEqual(get_db_size(), 2)
+
+    def test_removes_newly_excluded_entries(self) -> None:
+        os.utime(self.inner, (0, self.inner_stat.st_mtime - 10))
+        index([self.root])
+        index([self.root, "--incremental", "--exclude", "old.txt"])
+        self.assertEqual(get_db_size(), 1)
+
+
+class CliNameIndexTests(TestCase):
+    def setUp(self) -> None:
+        test_env()
+        index(["tests/example_dir", "--name-index"])
+
+    def test_finds_file(self) -> None:
+        res = search(["ample_fi", "tests/example_dir", "--extension", "txt"])
+        self.assertEqual(res.stdout, "tests/example_dir/inner/example_file.txt\n")
+
+    def test_follows_deletions(self) -> None:
+        purge(["tests/example_dir", "--all"])
+        res = search(["ample_fi", "tests/example_dir"])
+        self.assertEqual(res.stdout, "")
+
+    def test_can_be_dropped(self) -> None:
+        index(["--no-scan", "--no-name-index"])
+        res = search(["ample_fi", "tests/example_dir"])
+        self.assertIn("example_file.txt", res.stdout)
+
 
 class CliPurgeMeTests(TestCase):
     def setUp(self) -> None:
@@ -55,6 +267,26 @@ class CliPurgeMeTests(TestCase):
         purge(["tests/example_dir"])
         self.assertEqual(get_db_size(), 2)
 
+    def test_does_not_purge_siblings_sharing_prefix(self) -> None:
+        purge(["tests/example_dir/inn", "--all"])
+        self.assertEqual(get_db_size(), 2)
+        purge(["tests/example_dir/inner", "--all"])
+        self.assertEqual(get_db_size(), 0)
+
+    def test_purges_deleted_subtrees(self) -> None:
+        root = tempfile.mkdtemp()
+        try:
+            os.makedirs(os.path.join(root, "a", "b"))
+            open(os.path.join(root, "a", "b", "file.txt"), "w").close()
+            open(os.path.join(root, "kept.txt"), "w").close()
+            index([root])
+            shutil.rmtree(os.path.join(root, "a"))
+            res = purge([root])
+            self.assertIn("file.txt", res.stdout)
+            self.assertEqual(search(["", root, "--count-only"]).stdout, "1\n")
+        finally:
+            shutil.rmtree(root)
+
 
 class CliSearchMeTests(TestCase):
     def setUp(self) -> None:
@@ -89,9 +321,192 @@ class CliSearchMeTests(TestCase):
         res = search(["", "--count-only", "tests/example_dir"])
         self.assertEqual(res.stdout, "2\n")
 
+    def test_sums_file_sizes(self) -> None:
+        size = os.path.getsize("tests/example_dir/inner/example_file.txt")
+        res = search(["", "--total-size", "tests/example_dir"])
+        self.assertEqual(res.stdout, f"{size}\n")
+        res = search(["example", "--total-size", "tests/example_dir"])
+        self.assertEqual(res.stdout, f"{size}\n")
+        res = search(["invalid", "--total-size", "tests/example_dir"])
+        self.assertEqual(res.stdout, "0\n")
+
+    def test_lists_directory_sizes(self) -> None:
+        size = os.path.getsize("tests/example_dir/inner/example_file.txt")
+        res = search(["", "tests/example_dir", "--du"])
+        self.assertEqual(
+            res.stdout,
+            f"{size}\ttests/example_dir/inner\n{size}\ttests/example_dir\n",
+        )
+
+    def test_directory_sizes_follow_purges(self) -> None:
+        purge(["tests/example_dir/inner/example_file.txt", "--all"])
+        res = search(["", "--total-size", "tests/example_dir"])
+        self.assertEqual(res.stdout, "0\n")
+
     def test_can_list_for_xargs(self) -> None:
         res = search(["", "--xargs", "tests/example_dir"])
         self.assertEqual(
             res.stdout,
             "tests/example_dir/inner\0tests/example_dir/inner/example_file.txt\0",
         )
+
+
+class CliChangedSinceTests(TestCase):
+    def setUp(self) -> None:
+        test_env()
+        self.root = tempfile.mkdtemp()
+        self.old = os.path.join(self.root, "old.txt")
+        open(self.old, "w").close()
+        os.mkdir(os.path.join(self.root, "dir"))
+        index([self.root])
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.root)
+
+    def changes(self, seq: int) -> List[str]:
+        """
+        Gets changes since seq, with paths relative to root.
+        """
+        res = search(["", self.root, "--changed-since", str(seq)])
+        lines = []
+        for line in res.stdout.splitlines():
+            _seq, sign, path = line.split("\t")
+            lines.append(f"{sign} {os.path.relpath(path, self.root)}")
+        return lines
+
+    def test_lists_changes_after_seq(self) -> None:
+        self.assertEqual(self.changes(0), ["+ old.txt", "+ dir"])
+        os.remove(self.old)
+        open(os.path.join(self.root, "new.txt"), "w").close()
+        purge([self.root])
+        index([self.root])
+        self.assertEqual(self.changes(2), ["- old.txt", "+ new.txt"])
+        index([self.root])
+        self.assertEqual(self.changes(4), [])
+
+    def apply(self, changes: ChangeSet) -> None:
+        with connect()() as s, redirect_stdout(io.StringIO()):
+            apply_changes(s, changes, Exclusions([]))
+
+    def test_does_not_reuse_ids_of_removed_files(self) -> None:
+        # Watch mode does not compact the journal.
+        changes = ChangeSet()
+        changes.remove(os.path.join(self.root, "dir"), is_dir=True)
+        self.apply(changes)
+        changes = ChangeSet()
+        open(os.path.join(self.root, "new.txt"), "w").close()
+        changes.add(os.path.join(self.root, "new.txt"), created=True)
+        self.apply(changes)
+        self.assertEqual(self.changes(0), ["+ old.txt", "- dir", "+ new.txt"])
+
+    def test_compaction_keeps_latest_changes(self) -> None:
+        os.utime(self.old, (0, 0))
+        index([self.root])
+        index(["--no-scan", "--compact-journal"])
+        self.assertEqual(self.changes(0), ["+ dir", "+ old.txt"])
+        index(["--no-scan", "--forget-changes", "2"])
+        self.assertEqual(self.changes(2), ["+ old.txt"])
+        with self.assertRaises(Exception):
+            self.changes(1)
+
+
+class CliDuplicatesTests(TestCase):
+    def setUp(self) -> None:
+        test_env()
+        self.root = tempfile.mkdtemp()
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.root)
+
+    def write(self, name: str, contents: bytes) -> None:
+        with open(os.path.join(self.root, name), "wb") as f:
+            f.write(contents)
+
+    def duplicates(self) -> str:
+        index([self.root, "--hash"])
+        res = search(["", self.root, "--duplicates"])
+        lines = res.stdout.splitlines()
+        return "".join(f"{os.path.relpath(x, self.root) if x else x}\n" for x in lines)
+
+    def test_lists_groups_of_same_files(self) -> None:
+        large = os.urandom(300 * 1024)
+        self.write("a", large)
+        self.write("b", large)
+        # Same size and ends, different middle.
+        self.write("c", large[:1000] + b"x" + large[1001:])
+        self.write("d", b"small")
+        self.write("e", b"small")
+        self.write("f", b"other")
+        self.assertEqual(self.duplicates(), "a\nb\n\nd\ne\n")
+        self.write("b", large + b"x")
+        self.assertEqual(self.duplicates(), "d\ne\n")
+
+
+class CliServeMeTests(TestCase):
+    def setUp(self) -> None:
+        test_env()
+        purge(["/", "--all"])
+        index(["tests/example_dir"])
+        self.socket_dir = tempfile.mkdtemp()
+        self.socket_path = os.path.join(self.socket_dir, "indexme.sock")
+        set_socket_path_factory(lambda: self.socket_path)
+        self.server = SearchServer(self.socket_path)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def tearDown(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.socket_dir)
+
+    def test_searches_through_daemon(self) -> None:
+        with mock.patch("indexme.cli.searchme.search_directly") as search_directly:
+            res = search(["", "--xargs", "tests/example_dir"])
+        search_directly.assert_not_called()
+        self.assertEqual(
+            res.stdout,
+            "tests/example_dir/inner\0tests/example_dir/inner/example_file.txt\0",
+        )
+
+    def test_falls_back_for_other_databases(self) -> None:
+        test_env()
+        set_socket_path_factory(lambda: self.socket_path)
+        res = search(["", "--count-only", "tests/example_dir"])
+        self.assertEqual(res.stdout, "0\n")
+
+    def test_reports_errors_from_daemon(self) -> None:
+        with self.assertRaisesRegex(Exception, "Conflicting options"):
+            search(["", "--du", "--xargs"])
+
+    def test_answers_while_other_clients_stall(self) -> None:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as stalled:
+            stalled.connect(self.socket_path)
+            with mock.patch("indexme.cli.searchme.search_directly") as direct:
+                res = search(["inner", "--count-only"])
+        direct.assert_not_called()
+        self.assertEqual(res.stdout, "1\n")
+
+    def test_falls_back_when_daemon_does_not_answer(self) -> None:
+        path = os.path.join(self.socket_dir, "stuck.sock")
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as stuck:
+            stuck.bind(path)
+            stuck.listen()
+            set_socket_path_factory(lambda: path)
+            with mock.patch("indexme.db.daemon.CONNECT_TIMEOUT", 0.1):
+                res = search(["inner", "--count-only"])
+        self.assertEqual(res.stdout, "1\n")
+
+    def test_reloads_snapshot_after_changes(self) -> None:
+        self.server.use_snapshot = True
+        # Answered from database while the snapshot is loading.
+        self.assertEqual(search(["inner", "--count-only"]).stdout, "1\n")
+        assert self.server.loader is not None
+        self.server.loader.join()
+        with mock.patch("indexme.cli.serveme.run_search") as run_search:
+            res = search(["inner", "--count-only"])
+        run_search.assert_not_called()
+        self.assertEqual(res.stdout, "1\n")
+
+        index(["tests"])
+        self.assertEqual(search(["example_dir", "--count-only"]).stdout, "1\n")
+        self.server.loader.join()
+        self.assertEqual(search(["example_dir", "--count-only"]).stdout, "1\n")
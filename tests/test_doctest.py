@@ -1,9 +1,29 @@
 import doctest
 from unittest import TestLoader, TestSuite
 
-from indexme.db import file_model
+from indexme.cli import purgeme
+from indexme.db import (
+    changes,
+    daemon,
+    file_model,
+    ignore,
+    layout,
+    migrations,
+    scan_stats,
+    scans,
+    snapshot,
+)
 
 
 def load_tests(loader: TestLoader, tests: TestSuite, pattern: str) -> TestSuite:
+    tests.addTests(doctest.DocTestSuite(changes))
+    tests.addTests(doctest.DocTestSuite(daemon))
     tests.addTests(doctest.DocTestSuite(file_model))
+    tests.addTests(doctest.DocTestSuite(ignore))
+    tests.addTests(doctest.DocTestSuite(layout))
+    tests.addTests(doctest.DocTestSuite(migrations))
+    tests.addTests(doctest.DocTestSuite(purgeme))
+    tests.addTests(doctest.DocTestSuite(scan_stats))
+    tests.addTests(doctest.DocTestSuite(scans))
+    tests.addTests(doctest.DocTestSuite(snapshot))
     return tests
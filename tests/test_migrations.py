@@ -0,0 +1,49 @@
+import sqlite3
+from unittest import TestCase
+
+from indexme.db.connection import connect
+from indexme.db.file_model import JournalEntry
+from indexme.db.file_ops import FileSortDirection, GetAllFiles
+from indexme.db.journal import changes_since
+from tests.utils import get_db_path, test_env
+
+
+class MigrationTests(TestCase):
+    def setUp(self) -> None:
+        test_env()
+        db = sqlite3.connect(get_db_path())
+        db.execute(
+            "CREATE TABLE files (path VARCHAR PRIMARY KEY, name VARCHAR NOT NULL,"
+            " is_dir BOOLEAN NOT NULL, is_executable BOOLEAN NOT NULL,"
+            " is_suid BOOLEAN NOT NULL, size INTEGER NOT NULL,"
+            " created_at DATETIME NOT NULL, modified_at DATETIME NOT NULL)"
+        )
+        db.execute(
+            "INSERT INTO files VALUES"
+            " ('/a', 'a', 1, 0, 0, 4096, '1970-01-02 00:00:00.000000',"
+            " '1970-01-02 00:00:00.000000'),"
+            " ('/a/b.sh', 'b.sh', 0, 1, 0, 12, '1970-01-02 00:00:00.000000',"
+            " '1970-01-03 00:00:00.000000')"
+        )
+        db.commit()
+        db.close()
+
+    def test_migrates_v1_files(self) -> None:
+        Session = connect()
+        with Session() as s:
+            files = list(GetAllFiles(s, "/a").with_sorting(FileSortDirection("path")))
+            self.assertEqual([f.path for f in files], ["/a", "/a/b.sh"])
+            self.assertTrue(files[0].is_dir)
+            self.assertTrue(files[1].is_executable)
+            self.assertFalse(files[1].is_suid)
+            self.assertEqual(files[1].size, 12)
+            self.assertEqual(int(files[1].modified_at.timestamp()), 2 * 86400)
+            # Existing files are listed as changed since the beginning.
+            self.assertEqual(
+                [x.file_id for x in s.query(JournalEntry).order_by(JournalEntry.seq)],
+                [files[0].id, files[1].id],
+            )
+            self.assertEqual(
+                [path for _seq, _kind, path in changes_since(s, 0, "/a")],
+                ["/a", "/a/b.sh"],
+            )
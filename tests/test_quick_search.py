@@ -0,0 +1,161 @@
+import os
+from itertools import product
+from typing import Any, Dict, List
+from unittest import TestCase
+
+from indexme.cli.indexme import app as indexme
+from indexme.db.connection import connect
+from indexme.db.file_ops import FileSortDirection, GetAllFiles
+from indexme.db.quick_search import check_options, open_read_only, quick_search
+from indexme.db.search import run_search
+from tests.utils import run_app, test_env
+
+DEFAULTS: Dict[str, Any] = {
+    "name": None,
+    "root": "tests/example_dir",
+    "extension": None,
+    "executable": None,
+    "suid": None,
+    "directories": None,
+    "created_after": None,
+    "created_before": None,
+    "modified_after": None,
+    "modified_before": None,
+    "sort_by": "date",
+    "reverse": False,
+    "limit": None,
+    "count_only": False,
+    "total_size": False,
+    "du": False,
+    "xargs": False,
+    "duplicates": False,
+    "changed_since": None,
+}
+
+SEARCHES: List[Dict[str, Any]] = [
+    {},
+    {"name": "example"},
+    {"name": "ex", "extension": "txt"},
+    {"name": "inner", "root": "tests"},
+    {"root": "tests/example_dir/inner/example_file.txt"},
+    {"directories": False, "executable": False, "suid": False},
+    {"created_after": 0, "modified_before": 2**32},
+    {"modified_after": 2**32},
+    {"sort_by": "path", "xargs": True},
+    {"sort_by": "size", "count_only": True},
+    {"sort_by": "size", "reverse": True, "limit": 2},
+    {"sort_by": "name", "reverse": True},
+    {"limit": 0},
+]
+
+OPTION_VALUES: Dict[str, List[Any]] = {
+    "name": ["", "e", "ex", "example", "EXAMPLE", "%", "_"],
+    "root": ["tests", "tests/example_dir/inner", "tests/missing"],
+    "extension": ["", "t", "txt"],
+    "executable": [False, True],
+    "suid": [False, True],
+    "directories": [False, True],
+    "created_after": [0, 2**32],
+    "created_before": [0, 2**32],
+    "modified_after": [0, 2**32],
+    "modified_before": [0, 2**32],
+    "limit": [0, 1, 3],
+    "count_only": [True],
+    "total_size": [True],
+    "du": [True],
+    "xargs": [True],
+    "duplicates": [True],
+    "changed_since": [0],
+}
+
+ORDERS = [
+    {"sort_by": sort_by, "reverse": reverse}
+    for sort_by, reverse in product(
+        ["name", "path", "date", "newest", "size", "bytes"], [False, True]
+    )
+]
+
+
+def all_searches() -> List[Dict[str, Any]]:
+    """
+    Gets each value of each option, in every order, accepted by check_options.
+    """
+    searches = []
+    options: List[Dict[str, Any]] = [{}]
+    options += [{k: v} for k, values in OPTION_VALUES.items() for v in values]
+    for search, order in product(options, ORDERS):
+        try:
+            check_options({**DEFAULTS, **search, **order})
+        except Exception:
+            continue
+        searches.append({**search, **order})
+    return searches
+
+
+class QuickSearchTests(TestCase):
+    def setUp(self) -> None:
+        test_env()
+        run_app(indexme, ["tests/example_dir"])
+
+    def assert_same_results(self, searches: List[Dict[str, Any]] = SEARCHES) -> None:
+        Session = connect()
+        for search in searches:
+            options = {**DEFAULTS, **search}
+            conn = open_read_only()
+            assert conn is not None
+            output = quick_search(conn, options, os.getcwd())
+            if output is None:
+                # Left to run_search.
+                unhandled = ["du", "total_size", "duplicates"]
+                self.assertTrue(
+                    any(options[key] for key in unhandled)
+                    or options["changed_since"] is not None,
+                    search,
+                )
+                conn.close()
+                continue
+            with Session() as s:
+                expected = list(run_search(s, options, os.getcwd()))
+            self.assertEqual(list(output), expected, search)
+            conn.close()
+
+    def test_matches_orm_search(self) -> None:
+        self.assert_same_results()
+
+    def test_matches_orm_search_using_name_index(self) -> None:
+        run_app(indexme, ["--no-scan", "--name-index"])
+        self.assert_same_results()
+
+    def test_matches_orm_search_for_all_options(self) -> None:
+        searches = all_searches()
+        self.assertGreater(len(searches), 200)
+        self.assertTrue(any(search.get("du") for search in searches))
+        self.assert_same_results(searches)
+        run_app(indexme, ["--no-scan", "--name-index"])
+        self.assert_same_results(searches)
+
+    def test_leaves_directory_sizes_to_orm_search(self) -> None:
+        conn = open_read_only()
+        assert conn is not None
+        self.assertIsNone(quick_search(conn, {**DEFAULTS, "du": True}, os.getcwd()))
+        conn.close()
+
+    def test_reads_pages_after_cursors(self) -> None:
+        Session = connect()
+        with Session() as s:
+            for sort_by in ["name", "path", "date", "size"]:
+                for reverse in [False, True]:
+                    direction = FileSortDirection(sort_by, reverse)
+                    root = "tests/example_dir"
+                    expected = list(GetAllFiles(s, root).with_sorting(direction))
+                    scanned = GetAllFiles(s, root, sorted_scan=True)
+                    self.assertEqual(list(scanned.with_sorting(direction)), expected)
+                    pages, cursor = [], None
+                    while True:
+                        query = GetAllFiles(s, root).with_sorting(direction, cursor)
+                        page = list(query.limit(2))
+                        if len(page) == 0:
+                            break
+                        pages.extend(page)
+                        cursor = direction.cursor(page[-1])
+                    self.assertEqual(pages, expected, (sort_by, reverse))
@@ -0,0 +1,61 @@
+import os
+from typing import Set
+from unittest import TestCase
+
+from sqlalchemy.orm.session import Session
+
+from indexme.cli.indexme import app as indexme
+from indexme.db.connection import connect
+from indexme.db.file_model import File
+from indexme.db.file_ops import GetAllFiles
+from indexme.gui.result_tree import QueryTree
+from tests import test_search_worker
+from tests.utils import run_app, test_env
+
+
+class QueryTreeTests(TestCase):
+    def setUp(self) -> None:
+        test_env()
+        run_app(indexme, ["tests"])
+        self.Session = connect()
+        self.root = os.path.abspath(".")
+
+    def expected(self, text: str) -> Set[str]:
+        """
+        Gets relative paths of matches and their ancestors below root.
+        """
+        paths = set()
+        with self.Session() as s:
+            for (path,) in GetAllFiles(s, self.root).with_name(text).rows(File.path):
+                while path != self.root:
+                    paths.add(os.path.relpath(path))
+                    path = os.path.dirname(path)
+        return paths
+
+    def test_lists_matches_under_ancestors(self) -> None:
+        for text in ["py", "e", "example_", "nothing"]:
+
+            def query(s: Session, root: str) -> GetAllFiles:
+                return GetAllFiles(s, root).with_name(text)
+
+            tree = QueryTree(self.Session, query, self.root, 2, 3)
+            paths = test_search_worker.walk(tree, self.root)
+            self.assertEqual(len(paths), len(set(paths)), text)
+            self.assertEqual(set(paths), self.expected(text), text)
+            self.assertLessEqual(len(tree.pages), 3)
+
+    def test_reads_pages_from_nearest_cached_ones(self) -> None:
+        def query(s: Session, root: str) -> GetAllFiles:
+            return GetAllFiles(s, root).with_name("e")
+
+        root = os.path.abspath("tests")
+        tree = QueryTree(self.Session, query, root)
+        count = tree.n_children(root)
+        self.assertGreater(count, 6)
+        expected = [tree.child(root, i) for i in range(count)]
+        tree = QueryTree(self.Session, query, root, 2, 2)
+        self.assertEqual(tree.n_children(root), count)
+        for order in [range(count - 1, -1, -1), [4, 0, 5, 2, 1, 6, 3]]:
+            for i in order:
+                self.assertEqual(tree.child(root, i), expected[i], i)
+        self.assertEqual(tree._anchor(root, 2), (expected[3][0][1], False, 0))
@@ -0,0 +1,127 @@
+import os
+import queue
+from typing import Any, Callable, List, Tuple
+from unittest import TestCase, mock
+
+from sqlalchemy.orm.session import Session
+
+from indexme.cli.indexme import app as indexme
+from indexme.db.connection import connect
+from indexme.db.file_ops import GetAllFiles, get_files
+from indexme.gui.result_tree import QueryTree, ResultTree
+from indexme.gui.search_worker import SearchWorker
+from tests.utils import run_app, test_env
+
+
+def walk(tree: ResultTree, parent: str) -> List[str]:
+    """
+    Lists relative paths of nodes below parent, depth first.
+    """
+    paths = []
+    for i in range(tree.n_children(parent)):
+        row, has_children = tree.child(parent, i)
+        paths.append(os.path.relpath(row[0]))
+        if has_children:
+            paths.extend(walk(tree, row[0]))
+    return paths
+
+
+class SearchWorkerTests(TestCase):
+    def setUp(self) -> None:
+        test_env()
+        run_app(indexme, ["tests/example_dir"])
+        self.shown: "queue.Queue[ResultTree]" = queue.Queue()
+        self.scheduled: "queue.Queue[Callable[[], Any]]" = queue.Queue()
+        self.root = os.path.abspath("tests")
+        self.worker = SearchWorker(
+            connect(), self.query, self.root, self.show, self.schedule
+        )
+
+    def tearDown(self) -> None:
+        self.worker.stop()
+
+    def query(self, s: Session, root: str, text: str) -> GetAllFiles:
+        return GetAllFiles(s, root).with_name(text)
+
+    def show(self, tree: ResultTree) -> None:
+        self.shown.put(tree)
+
+    def next_shown(self) -> ResultTree:
+        """
+        Runs scheduled callbacks, like a UI thread, until results are shown.
+        """
+        while self.shown.empty():
+            self.scheduled.get(timeout=5)()
+        return self.shown.get()
+
+    def shown_paths(self) -> List[str]:
+        return walk(self.next_shown(), self.root)
+
+    def schedule(self, callback: Callable[[], Any]) -> None:
+        self.scheduled.put(callback)
+
+    def test_shows_matches_under_ancestors(self) -> None:
+        self.worker.submit("file")
+        self.assertEqual(
+            self.shown_paths(),
+            [
+                "tests/example_dir",
+                "tests/example_dir/inner",
+                "tests/example_dir/inner/example_file.txt",
+            ],
+        )
+
+    def test_fetches_ancestors_at_once(self) -> None:
+        with mock.patch(
+            "indexme.gui.search_worker.get_files", wraps=get_files
+        ) as fetch:
+            self.worker.submit("file")
+            self.shown_paths()
+        fetch.assert_called_once()
+        self.assertEqual(
+            get_files(connect()(), ["tests/example_dir/inner", "tests/nothing"]).keys(),
+            {os.path.abspath("tests/example_dir/inner")},
+        )
+
+    def test_shows_only_last_of_quickly_typed_searches(self) -> None:
+        for text in ["i", "in", "inn"]:
+            self.worker.submit(text)
+        self.worker.submit("inner")
+        self.assertEqual(len(self.shown_paths()), 2)
+        self.assertTrue(self.shown.empty())
+
+    def test_refines_previous_results(self) -> None:
+        self.worker.submit("EX")
+        self.assertEqual(len(self.shown_paths()), 3)
+        with mock.patch.object(self.worker, "Session") as Session:
+            self.worker.submit("example")
+            self.assertEqual(len(self.shown_paths()), 3)
+        Session.return_value.__enter__.return_value.execute.assert_not_called()
+
+    def test_stops_thread(self) -> None:
+        self.worker.submit("file")
+        self.worker.stop()
+        self.assertFalse(self.worker.thread.is_alive())
+
+    def test_browses_many_matches_from_database(self) -> None:
+        with mock.patch("indexme.gui.search_worker.MEMORY_LIMIT", 1):
+            self.worker.submit("E")
+            tree = self.next_shown()
+        assert isinstance(tree, QueryTree)
+        loaded: List[Tuple[str, int, int]] = []
+        tree.watch(lambda *args: loaded.append(args))
+        self.assertEqual(tree.n_children(self.root), 1)
+        # Rows below the top level are loaded by the worker thread.
+        paths = walk(tree, self.root)
+        while len(tree.requested) > 0:
+            self.scheduled.get(timeout=5)()
+            paths = walk(tree, self.root)
+        self.assertIn((os.path.join(self.root, "example_dir"), 0, 1), loaded)
+        self.assertEqual(
+            paths,
+            [
+                "tests/example_dir",
+                "tests/example_dir/inner",
+                "tests/example_dir/inner/example_file.txt",
+            ],
+        )
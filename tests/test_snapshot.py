@@ -0,0 +1,73 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from indexme.cli.indexme import app as indexme
+from indexme.db.connection import connect
+from indexme.db.quick_search import open_read_only, quick_search
+from indexme.db.search import run_search
+from indexme.db.snapshot import Snapshot
+from tests import test_quick_search
+from tests.utils import run_app, test_env
+
+
+class SnapshotTests(TestCase):
+    def setUp(self) -> None:
+        test_env()
+        run_app(indexme, ["tests"])
+        conn = open_read_only()
+        assert conn is not None
+        self.snapshot = Snapshot(conn)
+        conn.close()
+
+    def test_matches_orm_search(self) -> None:
+        Session = connect()
+        searches = [
+            *test_quick_search.SEARCHES,
+            {"total_size": True},
+            {"name": "EXAMPLE"},
+        ]
+        for search in searches:
+            options = {**test_quick_search.DEFAULTS, **search}
+            output = self.snapshot.search(options, os.getcwd())
+            assert output is not None
+            with Session() as s:
+                expected = list(run_search(s, options, os.getcwd()))
+            self.assertEqual(list(output), expected, search)
+
+    def test_treats_names_like_sql(self) -> None:
+        root = tempfile.mkdtemp()
+        try:
+            for name in ["my_file.txt", "my-file.txt", "100%.txt", "1000.TXT"]:
+                open(os.path.join(root, name), "w").close()
+            run_app(indexme, [root])
+            conn = open_read_only()
+            assert conn is not None
+            snapshot = Snapshot(conn)
+            Session = connect()
+            for search in [
+                {"name": "my_file"},
+                {"name": "100%"},
+                {"name": "_0%.t"},
+                {"extension": "t_t"},
+            ]:
+                options = {**test_quick_search.DEFAULTS, "root": root, **search}
+                output = snapshot.search(options, root)
+                assert output is not None
+                with Session() as s:
+                    expected = list(run_search(s, options, root))
+                self.assertEqual(list(output), expected, search)
+                quick = quick_search(conn, options, root)
+                assert quick is not None
+                self.assertEqual(list(quick), expected, search)
+            conn.close()
+        finally:
+            shutil.rmtree(root)
+
+    def test_selects_top_matches(self) -> None:
+        root = os.path.abspath("tests")
+        matches = self.snapshot.find(test_quick_search.DEFAULTS, root)
+        for sort_by in ["name", "path", "date", "size"]:
+            everything = self.snapshot.top(matches, sort_by)
+            self.assertEqual(self.snapshot.top(matches, sort_by, 3), everything[:3])
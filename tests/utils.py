@@ -8,17 +8,31 @@ from typer.testing import CliRunner
 
 from indexme.db.connection import connect
 from indexme.db.file_model import File
-from indexme.db.paths import set_db_string_factory, set_ignore_path_factory
+from indexme.db.paths import (
+    get_db_string,
+    set_db_string_factory,
+    set_ignore_path_factory,
+    set_socket_path_factory,
+)
 
 
 def test_env() -> None:
     """
-    Sets the programs to use temporary database and not to use global ignore file.
+    Sets the programs to use temporary database and not to use global ignore file
+    nor a running daemon.
     """
     fd, path = tempfile.mkstemp()
     os.close(fd)
     set_db_string_factory(lambda: f"sqlite:///{path}")
     set_ignore_path_factory(lambda: "/does/not/exist")
+    set_socket_path_factory(lambda: "/does/not/exist")
+
+
+def get_db_path() -> str:
+    """
+    Gets a path to current SQLite database.
+    """
+    return get_db_string()[len("sqlite:///") :]
 
 
 def get_db_size() -> int: